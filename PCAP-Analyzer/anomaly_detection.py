@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Anomaly Detection Module
+Vectorized spike (robust z-score) and change-point detection over the
+per-second capture timeline, with contributing hosts per flagged window
+"""
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from timeseries import FLAG_SYN, FLAG_RST, FLAG_ICMP_UNREACH
+
+# Trailing baseline length and the history needed before a bucket is scored
+BASELINE_BUCKETS = 60
+MIN_HISTORY = 10
+
+# Robust z-score for spikes, and mean-shift score for change points
+SPIKE_Z = 6.0
+CHANGE_Z = 6.0
+CHANGE_MIN_RATIO = 0.5
+
+# Minimum excess over the baseline (per second) before anything is reported
+MIN_EXCESS = {
+    'pps': 50,
+    'syn': 20,
+    'rst': 10,
+    'unique_sources': 10,
+    'icmp_unreachable': 5
+}
+
+SERIES_LABELS = {
+    'pps': 'Packets/sec',
+    'syn': 'SYN/sec',
+    'rst': 'RST/sec',
+    'unique_sources': 'Unique sources/sec',
+    'icmp_unreachable': 'ICMP unreachable/sec'
+}
+
+MAX_WINDOWS = 20
+TOP_CONTRIBUTORS = 3
+
+# Bound on timeline length (buckets) and on rows copied per rolling-median step
+MAX_TIMELINE_BUCKETS = 500000
+ROLLING_CHUNK = 8192
+
+
+def timeline_series(columns, interval=1.0):
+    """
+    Per-bucket series from PacketColumns (timeseries.py)
+
+    Returns (bucket start times, per-packet bucket indexes, series, interval).
+    Silent gaps longer than the baseline are shortened to BASELINE_BUCKETS
+    empty buckets, so the timeline grows with the occupied time rather than
+    the capture span (a stray timestamp or merged captures days apart). If it
+    is still longer than MAX_TIMELINE_BUCKETS the interval is doubled until
+    it fits.
+    """
+    ts = np.frombuffer(columns.ts, dtype=np.float64)
+    while True:
+        start = np.floor(ts.min() / interval) * interval
+        occupied, inverse = np.unique(((ts - start) // interval).astype(np.int64), return_inverse=True)
+        position = np.concatenate([[0], np.cumsum(np.minimum(np.diff(occupied), BASELINE_BUCKETS + 1))])
+        buckets = int(position[-1]) + 1
+        if buckets <= MAX_TIMELINE_BUCKETS:
+            break
+        interval *= 2
+    bucket = position[inverse.ravel()]
+
+    # Empty buckets continue from the occupied bucket before them
+    owner = np.searchsorted(position, np.arange(buckets), side='right') - 1
+    times = start + (occupied[owner] + np.arange(buckets) - position[owner]) * interval
+
+    flags = np.frombuffer(columns.flags, dtype=np.uint8)
+    src = np.frombuffer(columns.src, dtype=np.uint32).astype(np.int64)
+    ip = src != 0
+    pairs = np.unique((bucket[ip] << 32) | src[ip])
+
+    series = {
+        'pps': np.bincount(bucket, minlength=buckets),
+        'syn': np.bincount(bucket, weights=(flags & FLAG_SYN) > 0, minlength=buckets),
+        'rst': np.bincount(bucket, weights=(flags & FLAG_RST) > 0, minlength=buckets),
+        'unique_sources': np.bincount(pairs >> 32, minlength=buckets),
+        'icmp_unreachable': np.bincount(bucket, weights=(flags & FLAG_ICMP_UNREACH) > 0, minlength=buckets)
+    }
+    series = {name: values.astype(np.float64) / interval for name, values in series.items()}
+    return times, bucket, series, interval
+
+
+def _rolling_median(windows, lo, hi, median=None):
+    """Median of window rows lo..hi-1 (of |row - median| if given), ROLLING_CHUNK rows per copy"""
+    out = np.empty(hi - lo)
+    reduce = np.nanmedian if lo < windows.shape[1] else np.median
+    for first in range(lo, hi, ROLLING_CHUNK):
+        last = min(first + ROLLING_CHUNK, hi)
+        chunk = windows[first:last]
+        if median is not None:
+            chunk = np.abs(chunk - median[first - lo:last - lo, None])
+        out[first - lo:last - lo] = reduce(chunk, axis=1)
+    return out
+
+
+def robust_spikes(values, baseline=BASELINE_BUCKETS, threshold=SPIKE_Z, min_excess=0):
+    """Robust z-score of each bucket against the trailing median/MAD; returns (z, median, flagged)
+
+    The trailing windows are a strided view; medians are taken over bounded
+    chunks of it, NaN-aware only for the first `baseline` buckets.
+    """
+    padded = np.concatenate([np.full(baseline, np.nan), values])
+    windows = sliding_window_view(padded, baseline)[:len(values)]
+    history = np.minimum(np.arange(len(values)), baseline)
+
+    scored = history >= MIN_HISTORY
+    median = np.full(len(values), np.nan)
+    mad = np.full(len(values), np.nan)
+    # Buckets with a partial (NaN-padded) baseline, then full baselines
+    for lo, hi in ((MIN_HISTORY, min(baseline, len(values))), (baseline, len(values))):
+        if lo >= hi:
+            continue
+        median[lo:hi] = _rolling_median(windows, lo, hi)
+        mad[lo:hi] = _rolling_median(windows, lo, hi, median[lo:hi])
+
+    # Poisson-style floor so a flat baseline (MAD 0) does not flag noise
+    scale = np.maximum(1.4826 * np.nan_to_num(mad), np.sqrt(np.maximum(np.nan_to_num(median), 1.0)))
+    z = np.where(scored, (values - np.nan_to_num(median)) / scale, 0.0)
+    flagged = scored & (z >= threshold) & (values - np.nan_to_num(median) >= min_excess)
+    return z, median, flagged
+
+
+def change_points(values, span=BASELINE_BUCKETS // 2, threshold=CHANGE_Z, min_excess=0):
+    """Level shifts: mean of the next `span` buckets vs the previous `span` (cumulative sums)
+
+    Returns a list of (bucket, mean_before, mean_after, score), keeping only
+    the strongest point within +-span buckets.
+    """
+    n = len(values)
+    if n < 2 * span + 1:
+        return []
+
+    total = np.concatenate([[0.0], np.cumsum(values)])
+    squares = np.concatenate([[0.0], np.cumsum(values * values)])
+    t = np.arange(span, n - span + 1)
+    before = (total[t] - total[t - span]) / span
+    after = (total[t + span] - total[t]) / span
+    var_before = np.maximum((squares[t] - squares[t - span]) / span - before ** 2, 0)
+    var_after = np.maximum((squares[t + span] - squares[t]) / span - after ** 2, 0)
+
+    shift = np.abs(after - before)
+    noise = np.sqrt((var_before + var_after + np.maximum(np.maximum(before, after), 1.0)) / span)
+    score = shift / noise
+    significant = ((score >= threshold) & (shift >= min_excess)
+                   & (shift >= CHANGE_MIN_RATIO * np.maximum(np.minimum(before, after), 1.0)))
+
+    # Non-maximum suppression: keep local maxima of the score within +-span
+    padded = np.concatenate([np.full(span, -np.inf), score, np.full(span, -np.inf)])
+    local_max = score >= sliding_window_view(padded, 2 * span + 1).max(axis=1)
+    keep = np.flatnonzero(significant & local_max)
+    return [(int(t[i]), float(before[i]), float(after[i]), float(score[i])) for i in keep]
+
+
+def flagged_windows(flagged):
+    """Runs of consecutive flagged buckets as (first, last) index pairs"""
+    edges = np.diff(np.concatenate([[0], flagged.astype(np.int8), [0]]))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1))
+
+
+def detect_anomalies(columns, interval=1.0):
+    """
+    Spikes and level shifts in pps, SYN, RST, unique-source and ICMP
+    unreachable rates. Each finding names the time window and the top
+    source hosts of the matching packets in it (integer addresses).
+    """
+    if not NUMPY_AVAILABLE or len(columns) < 2:
+        return []
+
+    times, bucket, series, interval = timeline_series(columns, interval)
+    order = np.argsort(bucket, kind='stable')
+    sorted_bucket = bucket[order]
+    flags = np.frombuffer(columns.flags, dtype=np.uint8)[order]
+    src = np.frombuffer(columns.src, dtype=np.uint32)[order]
+    packet_masks = {
+        'syn': (flags & FLAG_SYN) > 0,
+        'rst': (flags & FLAG_RST) > 0,
+        'icmp_unreachable': (flags & FLAG_ICMP_UNREACH) > 0
+    }
+
+    def contributors(metric, first, last):
+        lo, hi = np.searchsorted(sorted_bucket, [first, last + 1])
+        hosts = src[lo:hi]
+        if metric in packet_masks:
+            hosts = hosts[packet_masks[metric][lo:hi]]
+        hosts = hosts[hosts != 0]
+        if not len(hosts):
+            return []
+        values, counts = np.unique(hosts, return_counts=True)
+        top = np.argsort(counts)[::-1][:TOP_CONTRIBUTORS]
+        return [(int(values[i]), int(counts[i])) for i in top]
+
+    def time_of(index):
+        """Start time of timeline bucket `index` (one past the end continues at the interval)"""
+        if index < len(times):
+            return float(times[index])
+        return float(times[-1] + (index - len(times) + 1) * interval)
+
+    findings = []
+    span = BASELINE_BUCKETS // 2
+    for metric, values in series.items():
+        min_excess = MIN_EXCESS[metric]
+        shifts = change_points(values, span, min_excess=min_excess)
+
+        # Right after a level shift the trailing median still reflects the old
+        # level, so spikes starting inside a shift are the shift itself
+        z, median, flagged = robust_spikes(values, min_excess=min_excess)
+        windows = [(first, last) for first, last in flagged_windows(flagged)
+                   if not any(point <= first < point + span for point, before, after, _ in shifts if after > before)]
+        windows.sort(key=lambda w: z[w[0]:w[1] + 1].max(), reverse=True)
+        for first, last in windows[:MAX_WINDOWS]:
+            peak = first + int(np.argmax(values[first:last + 1]))
+            findings.append({
+                'metric': metric,
+                'kind': 'spike',
+                'start': time_of(first),
+                'end': time_of(last) + interval,
+                'value': float(values[peak]),
+                'baseline': float(median[peak]),
+                'score': float(z[peak]),
+                'hosts': contributors(metric, first, last)
+            })
+
+        for point, before, after, score in shifts[:MAX_WINDOWS]:
+            findings.append({
+                'metric': metric,
+                'kind': 'level_up' if after > before else 'level_down',
+                'start': time_of(point),
+                'end': time_of(point + span - 1) + interval,
+                'value': after,
+                'baseline': before,
+                'score': score,
+                'hosts': contributors(metric, point, point + span - 1) if after > before else []
+            })
+
+    return sorted(findings, key=lambda f: f['start'])
+
+
+if __name__ == '__main__':
+    print("Anomaly Detection Module")
+    print("Import this module into pcap_analyzer_v3.py")
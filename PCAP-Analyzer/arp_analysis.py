@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+ARP Analysis Module
+IP<->MAC binding tables with first/last-seen times, conflicting bindings
+(spoofing / duplicate addresses), gratuitous-ARP storms and request floods
+"""
+
+from collections import Counter
+from datetime import datetime
+
+from sketches import DistinctCounter
+
+# Per-second rates that open a storm / flood episode
+GARP_STORM_PER_SEC = 20
+REQUEST_FLOOD_PER_SEC = 100
+SOURCE_FLOOD_PER_SEC = 50
+
+# A MAC claiming more IPs than this is proxy ARP or spoofing
+MAC_IP_LIMIT = 16
+
+# Memory bounds for broadcast-heavy captures
+MAX_ARP_BINDINGS = 100000
+MAX_MACS_PER_IP = 16
+MAX_ARP_EVENTS = 1000
+
+ARP_EPISODE_KINDS = {
+    'garp_storm': 'Gratuitous ARP storm',
+    'request_flood': 'ARP request flood',
+    'source_flood': 'ARP request flood from one sender'
+}
+
+
+class ArpTracker:
+    """
+    Streaming ARP state fed by observe() for every ARP packet
+
+    bindings maps (ip, mac) -> [first_seen, last_seen, packets] for every
+    sender binding claimed; ip_macs / mac_ips index it both ways (MACs per IP
+    capped, IPs per MAC counted with a DistinctCounter). A conflict is an IP
+    whose sender MAC changes from one packet to the next, so flapping between
+    two MACs counts every flip. Rates are counted per whole second and
+    consecutive busy seconds merge into episodes.
+    """
+
+    def __init__(self, max_bindings=MAX_ARP_BINDINGS):
+        self.max_bindings = max_bindings
+        self.bindings = {}
+        self.ip_macs = {}
+        self.ip_last = {}
+        self.mac_ips = {}
+        self.counts = Counter()
+        self.requested = Counter()
+        self.conflicts = []
+        self.conflicting_ips = Counter()
+        self.mismatches = Counter()
+        self.episodes = []
+        self.untracked = 0
+        self.second = None
+        self.second_counts = Counter()
+        self.second_senders = Counter()
+
+    def observe(self, ts, op, eth_src, hwsrc, psrc, hwdst, pdst):
+        """op 1 = request, 2 = reply; eth_src is the Ethernet source (None if unknown)"""
+        gratuitous = psrc == pdst and psrc != '0.0.0.0'
+        self.counts['packets'] += 1
+        self.counts['requests' if op == 1 else 'replies'] += 1
+        if gratuitous:
+            self.counts['gratuitous'] += 1
+        if op == 1 and not gratuitous and len(self.requested) < self.max_bindings:
+            self.requested[pdst] += 1
+
+        if eth_src and eth_src != hwsrc:
+            self.counts['mismatched'] += 1
+            if len(self.mismatches) < MAX_ARP_EVENTS:
+                self.mismatches[(eth_src, hwsrc, psrc)] += 1
+
+        self._rate(ts, op, hwsrc, gratuitous)
+        if psrc != '0.0.0.0':  # ARP probes claim no address
+            self._bind(ts, psrc, hwsrc)
+
+    def _bind(self, ts, ip, mac):
+        previous = self.ip_last.get(ip)
+        if previous is not None and previous != mac:
+            self.counts['conflicts'] += 1
+            self.conflicting_ips[ip] += 1
+            if len(self.conflicts) < MAX_ARP_EVENTS:
+                self.conflicts.append({'time': ts, 'ip': ip, 'previous_mac': previous, 'new_mac': mac})
+
+        binding = self.bindings.get((ip, mac))
+        if binding is not None:
+            self.ip_last[ip] = mac
+            binding[1] = ts
+            binding[2] += 1
+            return
+        if len(self.bindings) >= self.max_bindings:
+            self.untracked += 1
+            return
+        self.bindings[(ip, mac)] = [ts, ts, 1]
+        self.ip_last[ip] = mac
+
+        macs = self.ip_macs.setdefault(ip, [])
+        if len(macs) < MAX_MACS_PER_IP:
+            macs.append(mac)
+
+        ips = self.mac_ips.get(mac)
+        if ips is None:
+            ips = self.mac_ips[mac] = DistinctCounter()
+        ips.add(ip)
+
+    def _rate(self, ts, op, sender, gratuitous):
+        second = int(ts)
+        if second != self.second:
+            self._close_second()
+            self.second = second
+        if gratuitous:
+            self.second_counts['garp_storm'] += 1
+        elif op == 1:
+            self.second_counts['request_flood'] += 1
+            self.second_senders[sender] += 1
+
+    def _close_second(self):
+        if self.second is None:
+            return
+        busy = []
+        if self.second_counts['garp_storm'] >= GARP_STORM_PER_SEC:
+            busy.append(('garp_storm', '*', self.second_counts['garp_storm']))
+        if self.second_counts['request_flood'] >= REQUEST_FLOOD_PER_SEC:
+            busy.append(('request_flood', '*', self.second_counts['request_flood']))
+        for sender, count in self.second_senders.items():
+            if count >= SOURCE_FLOOD_PER_SEC:
+                busy.append(('source_flood', sender, count))
+
+        for kind, source, count in busy:
+            for episode in reversed(self.episodes[-32:]):
+                if episode['kind'] == kind and episode['source'] == source and self.second - episode['end'] <= 1:
+                    episode['end'] = self.second
+                    episode['packets'] += count
+                    episode['peak'] = max(episode['peak'], count)
+                    break
+            else:
+                if len(self.episodes) < MAX_ARP_EVENTS:
+                    self.episodes.append({'kind': kind, 'source': source, 'start': self.second,
+                                          'end': self.second, 'packets': count, 'peak': count})
+        self.second_counts = Counter()
+        self.second_senders = Counter()
+
+    def report(self):
+        """Summary dict (closes the current second; safe to call repeatedly)"""
+        self._close_second()
+        self.second = None
+
+        conflicts = []
+        for ip, count in self.conflicting_ips.most_common():
+            macs = self.ip_macs[ip]
+            conflicts.append({
+                'ip': ip,
+                'changes': count,
+                'macs': [{'mac': mac, 'first_seen': self.bindings[(ip, mac)][0],
+                          'last_seen': self.bindings[(ip, mac)][1], 'packets': self.bindings[(ip, mac)][2]}
+                         for mac in macs if (ip, mac) in self.bindings]
+            })
+
+        multi_ip_macs = sorted(((mac, len(ips)) for mac, ips in self.mac_ips.items() if len(ips) > MAC_IP_LIMIT),
+                               key=lambda item: item[1], reverse=True)
+        return {
+            'counts': dict(self.counts),
+            'bindings': len(self.bindings),
+            'ips': len(self.ip_macs),
+            'macs': len(self.mac_ips),
+            'untracked': self.untracked,
+            'top_requested': self.requested.most_common(10),
+            'conflicts': conflicts,
+            'conflict_events': self.conflicts,
+            'multi_ip_macs': multi_ip_macs,
+            'mismatches': [{'eth_src': eth, 'arp_src': hw, 'ip': ip, 'packets': count}
+                           for (eth, hw, ip), count in self.mismatches.most_common()],
+            'episodes': sorted(self.episodes, key=lambda e: e['packets'], reverse=True)
+        }
+
+
+def format_time(ts):
+    return datetime.fromtimestamp(ts).strftime('%H:%M:%S')
+
+
+def print_arp_analysis(report, limit=10):
+    """Print binding tables, conflicts and rate episodes"""
+    counts = report['counts']
+    print(f"\n  📍 Binding table: {report['ips']:,} IPs, {report['macs']:,} MACs, "
+          f"{report['bindings']:,} IP↔MAC bindings ({counts.get('gratuitous', 0):,} gratuitous ARPs)")
+    if report['untracked']:
+        print(f"    ({report['untracked']:,} new bindings beyond the {MAX_ARP_BINDINGS:,}-binding limit not tracked)")
+
+    if report['conflicts']:
+        print(f"\n  🔴 Conflicting IP→MAC bindings ({len(report['conflicts'])} IPs) - ARP spoofing or duplicate IP:")
+        for conflict in report['conflicts'][:limit]:
+            print(f"    {conflict['ip']}: {conflict['changes']} MAC change(s)")
+            for binding in conflict['macs'][:5]:
+                print(f"      {binding['mac']}  {binding['packets']:>6,} pkts  "
+                      f"first {format_time(binding['first_seen'])}  last {format_time(binding['last_seen'])}")
+    else:
+        print("\n  ✓ No conflicting IP→MAC bindings")
+
+    if report['multi_ip_macs']:
+        print(f"\n  ⚠ MACs claiming more than {MAC_IP_LIMIT} IPs (proxy ARP or spoofing):")
+        for mac, count in report['multi_ip_macs'][:limit]:
+            print(f"    {mac}: {count:,} IPs")
+
+    if report['mismatches']:
+        print(f"\n  ⚠ Ethernet source differs from ARP sender MAC:")
+        for row in report['mismatches'][:limit]:
+            print(f"    {row['eth_src']} sent ARP as {row['arp_src']} ({row['ip']}): {row['packets']} packets")
+
+    if report['episodes']:
+        print(f"\n  🔴 ARP storms / floods ({len(report['episodes'])} episodes):")
+        for episode in report['episodes'][:limit]:
+            source = '' if episode['source'] == '*' else f" from {episode['source']}"
+            print(f"    {ARP_EPISODE_KINDS[episode['kind']]}{source}: {format_time(episode['start'])} "
+                  f"for {episode['end'] - episode['start'] + 1}s, {episode['packets']:,} packets "
+                  f"(peak {episode['peak']:,}/s)")
+
+
+if __name__ == '__main__':
+    print("ARP Analysis Module")
+    print("Import this module into pcap_analyzer_v3.py")
@@ -4,10 +4,463 @@ AWS Service Detection Module
 Detects AWS-specific traffic patterns in PCAP files
 """
 
+import heapq
+import ipaddress
+import math
 from collections import Counter, defaultdict
 from scapy.all import IP, TCP, UDP, Raw
 
-def detect_aws_services(packets):
+from flow_table import PROTO_NAMES, PROTO_NUMBERS, flow_key, flow_label, int_to_ip, ip_to_int, unpack_flow_key
+from signatures import SIGNATURES, register_signatures
+from sketches import Reservoir
+
+# A SYN without SYN-ACK is a failed check after one to two of these windows
+HANDSHAKE_TIMEOUT = 10.0
+
+# Memory bounds: in-flight SYNs, targets with their own stats, latency samples
+MAX_PENDING_HANDSHAKES = 500000
+MAX_HANDSHAKE_TARGETS = 10000
+LATENCY_SAMPLES = 1000
+
+# NAT gateway: simultaneous connections per unique destination (IP, port, protocol),
+# and the idle timeout after which it drops a mapping
+NAT_PORT_LIMIT = 55000
+NAT_WARN_FRACTION = 0.8
+NAT_IDLE_TIMEOUT = 350.0
+MAX_NAT_DESTINATIONS = 50000
+MAX_NAT_MAPPINGS = 500000
+
+# VPC CIDRs as {cidr: name}; empty means each RFC1918 /16 is treated as a VPC
+VPC_CIDRS = {}
+
+# Asymmetric routing: hop counts of the two directions may differ by this
+# much, and one-way UDP flows need this many packets to be reported; flows
+# idle this long are classified and dropped
+ASYM_HOP_TOLERANCE = 2
+ASYM_MIN_PACKETS = 3
+ASYM_IDLE_TIMEOUT = 120.0
+MAX_ASYM_FLOWS = 200000
+MAX_ASYM_REPORTED = 1000
+MAX_VPC_CACHE = 100000
+
+ASYM_REASONS = {
+    'synack_without_syn': 'SYN-ACK without a SYN (request took another path)',
+    'one_way': 'Traffic seen in only one direction',
+    'ttl_mismatch': 'Hop counts differ between the two directions'
+}
+
+# Flag bits kept per flow by AsymmetryTracker
+_SEEN_SYN = 1
+_SYNACK_WITHOUT_SYN = 2
+_SEEN_ACK = 4
+_CLOSED = 8
+
+AWS_SIGNATURES = {
+    'aws.put': b'PUT',
+    'aws.get': b'GET',
+    'aws.get_path': b'GET /',
+    'aws.imds_token': b'/latest/api/token',
+    'aws.elb_health': b'ELB-HealthChecker',
+    'aws.elb_v2': b'ELB-HealthChecker/2.0',
+    'aws.elb_v1': b'ELB-HealthChecker/1.0',
+    'aws.http': b'HTTP/',
+    'aws.http_ok': b'200 OK'
+}
+register_signatures(AWS_SIGNATURES)
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class HandshakeTracker:
+    """
+    TCP handshake outcomes and SYN -> SYN-ACK latency per target (NLB TCP
+    health checks are bare handshakes)
+
+    Pending SYNs are keyed by the packed flow key (flow_table.flow_key) and
+    held as (first SYN time, initiator-is-side-A) in two generations of
+    HANDSHAKE_TIMEOUT seconds; a SYN still pending when its generation is
+    retired is a timeout. SYN-ACKs and RSTs only look up and pop, so the
+    table holds in-flight handshakes rather than every flow seen. Latencies
+    are kept as reservoir samples, globally and per target.
+    """
+
+    def __init__(self):
+        self.current = {}
+        self.previous = {}
+        self.generation_start = None
+        self.attempts = 0
+        self.success = 0
+        self.refused = 0
+        self.timeouts = 0
+        self.untracked = 0
+        self.latency = Reservoir(LATENCY_SAMPLES * 10)
+        self.targets = {}
+
+    def _rotate(self, ts):
+        if self.generation_start is None:
+            self.generation_start = ts
+        elif ts - self.generation_start >= HANDSHAKE_TIMEOUT:
+            self.expire(self.previous)
+            self.previous, self.current = self.current, {}
+            self.generation_start = ts
+
+    def _target(self, key, initiator_is_a):
+        """(server ip, server port) of a flow key"""
+        if initiator_is_a:
+            return (key >> 16) & 0xffffffff, key & 0xffff
+        return (key >> 64) & 0xffffffff, (key >> 48) & 0xffff
+
+    def _stats(self, target):
+        stats = self.targets.get(target)
+        if stats is None and len(self.targets) < MAX_HANDSHAKE_TARGETS:
+            # attempts, success, refused, timeouts, latency samples
+            stats = self.targets[target] = [0, 0, 0, 0, Reservoir(LATENCY_SAMPLES)]
+        return stats
+
+    def syn(self, ts, src, sport, dst, dport):
+        self._rotate(ts)
+        key, forward = flow_key(PROTO_NUMBERS['TCP'], src, sport, dst, dport)
+        if key in self.current or key in self.previous:  # retransmission, keep the first SYN time
+            return
+        if len(self.current) >= MAX_PENDING_HANDSHAKES:
+            self.untracked += 1
+            return
+        self.current[key] = (ts, forward)
+        self.attempts += 1
+        stats = self._stats((dst, dport))
+        if stats is not None:
+            stats[0] += 1
+
+    def answer(self, ts, src, sport, dst, dport, refused=False):
+        """SYN-ACK (or RST when refused) sent by the server src:sport"""
+        self._rotate(ts)
+        key, forward = flow_key(PROTO_NUMBERS['TCP'], src, sport, dst, dport)
+        pending = self.current.get(key)
+        generation = self.current
+        if pending is None:
+            pending = self.previous.get(key)
+            generation = self.previous
+        if pending is None or pending[1] == forward:  # nothing pending, or sent by the client
+            return
+        del generation[key]
+        stats = self.targets.get((src, sport))
+        if refused:
+            self.refused += 1
+            if stats is not None:
+                stats[2] += 1
+            return
+        latency = ts - pending[0]
+        self.success += 1
+        self.latency.add(latency)
+        if stats is not None:
+            stats[1] += 1
+            stats[4].add(latency)
+
+    def expire(self, generation):
+        for key, (ts, initiator_is_a) in generation.items():
+            self.timeouts += 1
+            stats = self.targets.get(self._target(key, initiator_is_a))
+            if stats is not None:
+                stats[3] += 1
+        generation.clear()
+
+    def finish(self):
+        """Count SYNs still pending at the end of the capture as timeouts"""
+        self.expire(self.previous)
+        self.expire(self.current)
+
+    def report(self):
+        ordered = sorted(self.latency)
+        targets = []
+        for (server, port), (attempts, success, refused, timeouts, samples) in self.targets.items():
+            latencies = sorted(samples)
+            targets.append({
+                'target': f"{int_to_ip(server)}:{port}",
+                'attempts': attempts,
+                'success': success,
+                'refused': refused,
+                'timeouts': timeouts,
+                'success_rate': success / attempts * 100 if attempts else 0,
+                'p50_ms': percentile(latencies, 0.5) * 1000 if latencies else None,
+                'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None
+            })
+        return {
+            'attempts': self.attempts,
+            'success': self.success,
+            'refused': self.refused,
+            'timeouts': self.timeouts,
+            'untracked': self.untracked,
+            'latency_ms': {name: percentile(ordered, fraction) * 1000 if ordered else None
+                           for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))},
+            'targets': sorted(targets, key=lambda t: t['attempts'], reverse=True)
+        }
+
+
+class NatTracker:
+    """
+    Concurrent NAT mappings per destination: (protocol, source IP,
+    destination IP, destination port)
+
+    A mapping is one flow keyed by the packed flow key (flow_table.flow_key).
+    It opens on a TCP SYN, on the first packet of a UDP flow, or on the first
+    packet of a TCP connection already established when the capture started,
+    and closes on FIN/RST in either direction or after NAT_IDLE_TIMEOUT
+    seconds without packets. Idle expiry uses two generations like
+    HandshakeTracker, so a mapping lingers one to two timeouts after its last
+    packet. Open mappings are counted per destination as they open and close;
+    the peak is compared against NAT_PORT_LIMIT. Closed mappings are
+    remembered for two more generations: a SYN reopening one is an
+    ephemeral-port reuse, a SYN on an open mapping a retransmission.
+    """
+
+    def __init__(self, idle_timeout=NAT_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.generation_start = None
+        self.current = {}
+        self.previous = {}
+        self.closed = set()
+        self.closed_previous = set()
+        self.destinations = {}
+        self.connections = 0
+        self.untracked = 0
+
+    def _rotate(self, ts):
+        if self.generation_start is None:
+            self.generation_start = ts
+        elif ts - self.generation_start >= self.idle_timeout:
+            for key, initiator_is_a in self.previous.items():
+                self._close(key, initiator_is_a)
+            self.previous, self.current = self.current, {}
+            self.closed_previous, self.closed = self.closed, set()
+            self.generation_start = ts
+
+    def _destination(self, key, initiator_is_a):
+        """(protocol number, source ip, destination ip, destination port) of a flow key"""
+        proto, ip_a, port_a, ip_b, port_b = unpack_flow_key(key)
+        if initiator_is_a:
+            return proto, ip_a, ip_b, port_b
+        return proto, ip_b, ip_a, port_a
+
+    def _close(self, key, initiator_is_a):
+        self.destinations[self._destination(key, initiator_is_a)][0] -= 1
+        if len(self.closed) < MAX_NAT_MAPPINGS:
+            self.closed.add(key)
+
+    def observe(self, ts, proto, src, sport, dst, dport, flags=None):
+        """One packet (proto a protocol number, integer addresses; TCP flags, None for UDP)"""
+        self._rotate(ts)
+        key, forward = flow_key(proto, src, sport, dst, dport)
+        initiator_is_a = self.current.get(key)
+        if initiator_is_a is None:
+            initiator_is_a = self.previous.pop(key, None)
+            if initiator_is_a is not None:
+                self.current[key] = initiator_is_a
+        if initiator_is_a is not None:
+            if flags is not None and flags & 0x05:  # FIN or RST
+                del self.current[key]
+                self._close(key, initiator_is_a)
+            return
+
+        reopened = key in self.closed or key in self.closed_previous
+        if flags is None:
+            new_connection, initiator_is_a = True, forward
+        elif flags & 0x05:
+            return
+        elif flags & 0x12 == 0x02:
+            new_connection, initiator_is_a = True, forward
+        elif reopened or flags & 0x02:  # after FIN/RST of a tracked mapping, or a SYN-ACK
+            return
+        else:
+            # Established before the capture: the client is the higher (ephemeral) port
+            new_connection, initiator_is_a = False, forward == (sport >= dport)
+
+        destination = self._destination(key, initiator_is_a)
+        stats = self.destinations.get(destination)
+        if stats is None:
+            if len(self.destinations) >= MAX_NAT_DESTINATIONS:
+                self.untracked += 1
+                return
+            # open mappings, peak, peak time, new connections, reopened mappings
+            stats = self.destinations[destination] = [0, 0, None, 0, 0]
+        if len(self.current) >= MAX_NAT_MAPPINGS:
+            self.untracked += 1
+            return
+        self.current[key] = initiator_is_a
+        stats[0] += 1
+        if stats[0] > stats[1]:
+            stats[1], stats[2] = stats[0], ts
+        if new_connection:
+            stats[3] += 1
+            self.connections += 1
+            if reopened:
+                stats[4] += 1
+
+    def report(self):
+        """Per-destination peaks of concurrent mappings, busiest first"""
+        rows = []
+        tcp_connections = tcp_reused = 0
+        for (proto, src, dst, dport), (_, peak, at, connections, reused) in self.destinations.items():
+            reuse = None
+            if proto == PROTO_NUMBERS['TCP'] and connections:
+                reuse = reused / connections * 100
+                tcp_connections += connections
+                tcp_reused += reused
+            rows.append({'proto': PROTO_NAMES.get(proto, str(proto)), 'src': int_to_ip(src),
+                         'dst': f"{int_to_ip(dst)}:{dport}", 'peak_ports': peak, 'peak_time': at,
+                         'utilization': peak / NAT_PORT_LIMIT * 100, 'connections': connections,
+                         'reused': reused, 'reuse_rate': reuse})
+        rows.sort(key=lambda row: row['peak_ports'], reverse=True)
+        return {
+            'destinations': rows,
+            'peak_ports': rows[0]['peak_ports'] if rows else 0,
+            'reuse_rate': tcp_reused / tcp_connections * 100 if tcp_connections else None,
+            'untracked': self.untracked
+        }
+
+
+class CidrTable:
+    """Longest-prefix match of integer IPv4 addresses against named CIDRs (one dict per prefix length)"""
+
+    def __init__(self, cidrs=None):
+        self.tables = {}
+        self.lengths = []
+        if isinstance(cidrs, dict):
+            for cidr, name in cidrs.items():
+                self.add(cidr, name)
+        else:
+            for cidr in cidrs or ():
+                self.add(cidr)
+
+    def add(self, cidr, name=None):
+        network = ipaddress.ip_network(cidr, strict=False)
+        self.tables.setdefault(network.prefixlen, {})[int(network.network_address)] = name or str(network)
+        self.lengths = sorted(self.tables, reverse=True)
+
+    def lookup(self, ip):
+        for length in self.lengths:
+            name = self.tables[length].get(ip & (0xffffffff << (32 - length)) & 0xffffffff)
+            if name is not None:
+                return name
+        return None
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables.values())
+
+
+def hop_count(ttl):
+    """Hops travelled, assuming the nearest common initial TTL (64, 128 or 255)"""
+    initial = 64 if ttl <= 64 else 128 if ttl <= 128 else 255
+    return initial - ttl
+
+
+class AsymmetryTracker:
+    """
+    Per-flow direction, hop-count and handshake evidence of asymmetric
+    routing (e.g. a Transit Gateway or firewall path used one way only)
+
+    Flows are keyed by the packed flow key and held as [packets A->B,
+    packets B->A, hops A->B, hops B->A, flag bits], with hop counts taken
+    from the first packet each way. Like HandshakeTracker, flows live in two
+    generations of ASYM_IDLE_TIMEOUT seconds: a packet moves its flow to the
+    current generation unless the flow has seen FIN/RST, and the retired
+    generation is classified and dropped. A current generation holding half
+    of MAX_ASYM_FLOWS rotates early, so each generation still gets one full
+    generation as `previous` before it is retired. Only suspect counts and the largest
+    MAX_ASYM_REPORTED suspects outlive their flows.
+    """
+
+    def __init__(self, vpc_of):
+        self.vpc_of = vpc_of
+        self.current = {}
+        self.previous = {}
+        self.generation_start = None
+        self.reasons = Counter()
+        self.vpc_pairs = Counter()
+        self.suspects = []
+        self.retired = 0
+        self.evicted = 0
+
+    def _rotate(self, ts):
+        if self.generation_start is None:
+            self.generation_start = ts
+        elif ts - self.generation_start >= ASYM_IDLE_TIMEOUT or len(self.current) >= MAX_ASYM_FLOWS // 2:
+            if ts - self.generation_start < ASYM_IDLE_TIMEOUT:
+                self.evicted += len(self.previous)
+            self.expire(self.previous)
+            self.previous, self.current = self.current, {}
+            self.generation_start = ts
+
+    def observe(self, ts, proto, src, sport, dst, dport, ttl, flags=0):
+        self._rotate(ts)
+        key, forward = flow_key(proto, src, sport, dst, dport)
+        state = self.current.get(key)
+        if state is None:
+            state = self.previous.get(key)
+            if state is None:
+                state = self.current[key] = [0, 0, -1, -1, 0]
+            elif not state[4] & _CLOSED:
+                self.current[key] = self.previous.pop(key)
+        side = 0 if forward else 1
+        state[side] += 1
+        if state[2 + side] < 0:
+            state[2 + side] = hop_count(ttl)
+        if flags:
+            if flags & 0x12 == 0x02:
+                state[4] |= _SEEN_SYN
+            elif flags & 0x12 == 0x12 and not state[4] & _SEEN_SYN:
+                state[4] |= _SYNACK_WITHOUT_SYN
+            if flags & 0x10:
+                state[4] |= _SEEN_ACK
+            if flags & 0x05:
+                state[4] |= _CLOSED
+
+    def expire(self, generation):
+        """Classify and drop a generation of flows"""
+        for key, (ab, ba, hops_ab, hops_ba, bits) in generation.items():
+            tcp = key >> 96 == PROTO_NUMBERS['TCP']
+            if bits & _SYNACK_WITHOUT_SYN:
+                reason = 'synack_without_syn'
+            elif not (ab and ba) and (bits & _SEEN_ACK if tcp else ab + ba >= ASYM_MIN_PACKETS):
+                reason = 'one_way'
+            elif ab and ba and abs(hops_ab - hops_ba) > ASYM_HOP_TOLERANCE:
+                reason = 'ttl_mismatch'
+            else:
+                continue
+
+            # Oriented from side A unless only side B was seen
+            a_first = ab > 0
+            ip_a, ip_b = (key >> 64) & 0xffffffff, (key >> 16) & 0xffffffff
+            if not a_first:
+                ip_a, ip_b = ip_b, ip_a
+            src_vpc, dst_vpc = self.vpc_of(ip_a), self.vpc_of(ip_b)
+            self.reasons[reason] += 1
+            self.vpc_pairs[(src_vpc or 'external', dst_vpc or 'external')] += 1
+            row = {'flow': flow_label(key, a_first), 'reason': reason, 'src_vpc': src_vpc, 'dst_vpc': dst_vpc,
+                   'packets_fwd': ab if a_first else ba, 'packets_rev': ba if a_first else ab,
+                   'hops_fwd': hops_ab if a_first else hops_ba, 'hops_rev': hops_ba if a_first else hops_ab}
+            # A flow retired twice (evicted, then seen again) needs the sequence as tie-break
+            item = (ab + ba, key, self.retired, row)
+            self.retired += 1
+            if len(self.suspects) < MAX_ASYM_REPORTED:
+                heapq.heappush(self.suspects, item)
+            elif item > self.suspects[0]:
+                heapq.heapreplace(self.suspects, item)
+        generation.clear()
+
+    def report(self):
+        """Suspect flows, largest first (retires the flows still held)"""
+        self.expire(self.previous)
+        self.expire(self.current)
+        rows = [item[3] for item in sorted(self.suspects, reverse=True)]
+        return {'flows': rows, 'reasons': self.reasons, 'vpc_pairs': self.vpc_pairs, 'evicted': self.evicted}
+
+
+def detect_aws_services(packets, vpc_cidrs=None):
     """
     Detect AWS-specific traffic patterns
     Returns dict with AWS service analysis
@@ -44,58 +497,81 @@ def detect_aws_services(packets):
         }
     }
     
-    # Track TCP streams for NLB health check detection
-    tcp_streams = defaultdict(lambda: {'syn': False, 'synack': False})
+    # Track TCP handshakes for NLB health check detection
+    handshakes = HandshakeTracker()
+    
+    # Track source-port usage per destination for NAT port exhaustion
+    nat = NatTracker()
+    
+    # VPC membership by longest-prefix match, and per-flow routing symmetry
+    vpc_table = CidrTable(VPC_CIDRS if vpc_cidrs is None else vpc_cidrs)
+    vpc_cache = {}
+    
+    def vpc_of(ip):
+        vpc = vpc_cache.get(ip, False)
+        if vpc is False:
+            if vpc_table.lengths:
+                vpc = vpc_table.lookup(ip)
+            else:
+                vpc = _default_vpc(ip)
+            if len(vpc_cache) < MAX_VPC_CACHE:
+                vpc_cache[ip] = vpc
+        return vpc
+    
+    asymmetry = AsymmetryTracker(vpc_of)
     
     for pkt in packets:
         if not IP in pkt:
             continue
         
+        # One signature pass per TCP payload serves every check below
+        payload, found = None, {}
+        if TCP in pkt and Raw in pkt:
+            payload = pkt[Raw].load
+            found = SIGNATURES.scan(payload)
+        
         # IMDS Detection (169.254.169.254)
         if pkt[IP].dst == '169.254.169.254':
             aws_analysis['imds_access']['total'] += 1
             aws_analysis['imds_access']['sources'][pkt[IP].src] += 1
             
-            if TCP in pkt and Raw in pkt:
-                payload = pkt[Raw].load.decode('utf-8', errors='ignore')
-                
+            if payload is not None:
                 # IMDSv2 token request
-                if 'PUT' in payload and '/latest/api/token' in payload:
+                if 'aws.put' in found and 'aws.imds_token' in found:
                     aws_analysis['imds_access']['v2_token'] += 1
                 
                 # IMDSv1 GET request
-                elif 'GET' in payload:
+                elif 'aws.get' in found:
                     aws_analysis['imds_access']['v1_get'] += 1
                     aws_analysis['imds_access']['security_warning'] = True
                     
                     # Extract path
-                    if 'GET /' in payload:
-                        path = payload.split('GET ')[1].split(' ')[0]
-                        aws_analysis['imds_access']['paths'][path] += 1
+                    if 'aws.get_path' in found:
+                        path = payload[found['aws.get_path'] + 4:].split(b' ', 1)[0]
+                        aws_analysis['imds_access']['paths'][path.decode('utf-8', errors='ignore')] += 1
         
         # ELB Health Check Detection
-        if TCP in pkt and Raw in pkt:
-            payload = pkt[Raw].load.decode('utf-8', errors='ignore')
-            
+        if payload is not None:
             # ALB/CLB health checks
-            if 'ELB-HealthChecker' in payload:
+            if 'aws.elb_health' in found:
                 aws_analysis['elb_health_checks']['total'] += 1
                 target = pkt[IP].dst
                 
                 # Detect version
-                if 'ELB-HealthChecker/2.0' in payload:
+                if 'aws.elb_v2' in found:
                     aws_analysis['elb_health_checks']['alb'] += 1
-                elif 'ELB-HealthChecker/1.0' in payload:
+                elif 'aws.elb_v1' in found:
                     aws_analysis['elb_health_checks']['clb'] += 1
                 
                 # Check response code
-                if 'HTTP/' in payload:
-                    if '200 OK' in payload:
+                if 'aws.http' in found:
+                    if 'aws.http_ok' in found:
                         aws_analysis['elb_health_checks']['success'] += 1
                         aws_analysis['elb_health_checks']['targets'][target]['success'] += 1
                     else:
                         # Extract status code
-                        code_match = payload.split('HTTP/')[1].split()[0] if 'HTTP/' in payload else 'Unknown'
+                        code = payload[found['aws.http'] + 5:].split(None, 1)
+                        code_match = code[0].decode('utf-8', errors='ignore') if code else 'Unknown'
                         aws_analysis['elb_health_checks']['targets'][target]['failure'] += 1
                         aws_analysis['elb_health_checks']['failures'].append({
                             'target': target,
@@ -105,57 +581,87 @@ def detect_aws_services(packets):
         
         # NLB Health Check Detection (TCP SYN/SYN-ACK)
         if TCP in pkt:
-            stream_key = f"{pkt[IP].src}:{pkt[TCP].sport}-{pkt[IP].dst}:{pkt[TCP].dport}"
+            flags = int(pkt[TCP].flags)
             
             # SYN packet
-            if pkt[TCP].flags & 0x02 and not pkt[TCP].flags & 0x10:  # SYN, no ACK
-                tcp_streams[stream_key]['syn'] = True
+            if flags & 0x02 and not flags & 0x10:  # SYN, no ACK
+                handshakes.syn(float(pkt.time), ip_to_int(pkt[IP].src), pkt[TCP].sport,
+                               ip_to_int(pkt[IP].dst), pkt[TCP].dport)
             
-            # SYN-ACK packet
-            if pkt[TCP].flags & 0x12 == 0x12:  # SYN+ACK
-                reverse_key = f"{pkt[IP].dst}:{pkt[TCP].dport}-{pkt[IP].src}:{pkt[TCP].sport}"
-                if tcp_streams[reverse_key]['syn']:
-                    tcp_streams[reverse_key]['synack'] = True
-                    aws_analysis['elb_health_checks']['nlb_tcp'] += 1
+            # SYN-ACK or RST answering a SYN
+            elif flags & 0x12 == 0x12 or flags & 0x04:
+                handshakes.answer(float(pkt.time), ip_to_int(pkt[IP].src), pkt[TCP].sport,
+                                  ip_to_int(pkt[IP].dst), pkt[TCP].dport, refused=bool(flags & 0x04))
         
         # NAT Gateway Detection
         if TCP in pkt:
-            aws_analysis['nat_gateway']['total_connections'] += 1
+            # Mappings open on SYN and close on FIN/RST or when idle
+            nat.observe(float(pkt.time), PROTO_NUMBERS['TCP'], ip_to_int(pkt[IP].src), pkt[TCP].sport,
+                        ip_to_int(pkt[IP].dst), pkt[TCP].dport, flags)
             
             # RST packets (potential port exhaustion)
             if pkt[TCP].flags & 0x04:  # RST flag
                 if pkt[TCP].sport > 1024:  # Ephemeral port
                     aws_analysis['nat_gateway']['rst_packets'] += 1
-            
-            # Check for port exhaustion risk (>50k connections)
-            if aws_analysis['nat_gateway']['total_connections'] > 50000:
-                aws_analysis['nat_gateway']['port_exhaustion_risk'] = True
+        elif UDP in pkt:
+            nat.observe(float(pkt.time), PROTO_NUMBERS['UDP'], ip_to_int(pkt[IP].src), pkt[UDP].sport,
+                        ip_to_int(pkt[IP].dst), pkt[UDP].dport)
         
         # Transit Gateway / Cross-VPC Detection
-        src_ip = pkt[IP].src
-        dst_ip = pkt[IP].dst
+        src_int = ip_to_int(pkt[IP].src)
+        dst_int = ip_to_int(pkt[IP].dst)
+        src_vpc = vpc_of(src_int)
+        dst_vpc = vpc_of(dst_int)
         
-        # Detect RFC1918 addresses (private IPs)
-        if _is_private_ip(src_ip) and _is_private_ip(dst_ip):
-            src_subnet = '.'.join(src_ip.split('.')[:2])
-            dst_subnet = '.'.join(dst_ip.split('.')[:2])
-            
-            # Different subnets = potential cross-VPC
-            if src_subnet != dst_subnet:
-                aws_analysis['transit_gateway']['cross_vpc_traffic'] += 1
-                aws_analysis['transit_gateway']['vpc_cidrs'].add(src_subnet)
-                aws_analysis['transit_gateway']['vpc_cidrs'].add(dst_subnet)
+        # Both ends in known VPCs, but different ones = cross-VPC
+        if src_vpc and dst_vpc and src_vpc != dst_vpc:
+            aws_analysis['transit_gateway']['cross_vpc_traffic'] += 1
+            aws_analysis['transit_gateway']['vpc_cidrs'].add(src_vpc)
+            aws_analysis['transit_gateway']['vpc_cidrs'].add(dst_vpc)
+        
+        # Direction / TTL / handshake evidence for flows touching a VPC
+        if src_vpc or dst_vpc:
+            if TCP in pkt:
+                asymmetry.observe(float(pkt.time), PROTO_NUMBERS['TCP'], src_int, pkt[TCP].sport, dst_int,
+                                  pkt[TCP].dport, pkt[IP].ttl, int(pkt[TCP].flags))
+            elif UDP in pkt:
+                asymmetry.observe(float(pkt.time), PROTO_NUMBERS['UDP'], src_int, pkt[UDP].sport, dst_int,
+                                  pkt[UDP].dport, pkt[IP].ttl)
+    
+    # Post-processing: NLB health check success rate, latency and per-target results
+    handshakes.finish()
+    nlb = handshakes.report()
+    aws_analysis['elb_health_checks']['nlb_tcp'] = nlb['success']
+    aws_analysis['elb_health_checks']['nlb'] = nlb
+    
+    if nlb['attempts'] > 0:
+        aws_analysis['elb_health_checks']['nlb_success_rate'] = (nlb['success'] / nlb['attempts']) * 100
     
-    # Post-processing: Check for NLB health check success rate
-    nlb_success = sum(1 for s in tcp_streams.values() if s['syn'] and s['synack'])
-    nlb_total = sum(1 for s in tcp_streams.values() if s['syn'])
+    # Post-processing: asymmetric routing suspects
+    asym = asymmetry.report()
+    aws_analysis['transit_gateway']['potential_asymmetric'] = asym['flows']
+    aws_analysis['transit_gateway']['asymmetric_reasons'] = asym['reasons']
+    aws_analysis['transit_gateway']['asymmetric_vpc_pairs'] = asym['vpc_pairs']
+    aws_analysis['transit_gateway']['evicted_flows'] = asym['evicted']
     
-    if nlb_total > 0:
-        aws_analysis['elb_health_checks']['nlb_success_rate'] = (nlb_success / nlb_total) * 100
+    # Post-processing: NAT port usage peaks per destination
+    nat_report = nat.report()
+    aws_analysis['nat_gateway'].update(nat_report)
+    aws_analysis['nat_gateway']['total_connections'] = nat.connections
+    aws_analysis['nat_gateway']['timeouts'] = nlb['timeouts']
+    aws_analysis['nat_gateway']['port_exhaustion_risk'] = (
+        nat_report['peak_ports'] >= NAT_PORT_LIMIT * NAT_WARN_FRACTION)
     
     return aws_analysis
 
 
+def _default_vpc(ip):
+    """RFC1918 /16 containing an integer address, or None for public addresses"""
+    if _is_private_ip(int_to_ip(ip)):
+        return f"{int_to_ip(ip & 0xffff0000)}/16"
+    return None
+
+
 def _is_private_ip(ip):
     """Check if IP is in RFC1918 private range"""
     octets = ip.split('.')
@@ -187,7 +693,7 @@ def print_aws_analysis(aws_analysis):
     
     # ELB Health Checks
     elb = aws_analysis['elb_health_checks']
-    if elb['total'] > 0:
+    if elb['total'] > 0 or elb.get('nlb', {}).get('attempts'):
         print("\n[ELB Health Checks]")
         print(f"  Total: {elb['total']}")
         print(f"    ALB (v2.0): {elb['alb']}")
@@ -201,6 +707,21 @@ def print_aws_analysis(aws_analysis):
             for failure in elb['failures'][:5]:  # Show first 5
                 print(f"    ❌ {failure['target']} returned {failure['code']}")
         
+        nlb = elb.get('nlb')
+        if nlb and nlb['attempts']:
+            latency = nlb['latency_ms']
+            print(f"\n  NLB (TCP) handshakes: {nlb['success']}/{nlb['attempts']} "
+                  f"({elb['nlb_success_rate']:.0f}%), {nlb['refused']} refused, {nlb['timeouts']} timed out")
+            if latency['p50'] is not None:
+                print(f"    SYN → SYN-ACK latency: p50 {latency['p50']:.1f}ms, p90 {latency['p90']:.1f}ms, "
+                      f"p99 {latency['p99']:.1f}ms, max {latency['max']:.1f}ms")
+            print("\n  NLB Per-Target Summary:")
+            for target in nlb['targets'][:10]:
+                status = "✓" if target['success'] == target['attempts'] else "✗"
+                p50 = f", p50 {target['p50_ms']:.1f}ms / p99 {target['p99_ms']:.1f}ms" if target['p50_ms'] is not None else ""
+                print(f"    {status} {target['target']}: {target['success']}/{target['attempts']} "
+                      f"({target['success_rate']:.0f}%){p50}")
+        
         if elb['targets']:
             print("\n  Per-Target Summary:")
             for target, counts in sorted(elb['targets'].items()):
@@ -233,24 +754,51 @@ def print_aws_analysis(aws_analysis):
     
     # NAT Gateway
     nat = aws_analysis['nat_gateway']
-    if nat['total_connections'] > 0:
+    if nat['total_connections'] > 0 or nat.get('destinations'):
         print("\n[NAT Gateway Analysis]")
         print(f"  Total connections: {nat['total_connections']}")
         print(f"  RST packets: {nat['rst_packets']}")
+        print(f"  Handshake timeouts: {nat['timeouts']}")
+        if nat['reuse_rate'] is not None:
+            print(f"  Ephemeral port reuse: {nat['reuse_rate']:.1f}% of new connections reopen a closed mapping")
+        
+        if nat['destinations']:
+            print(f"\n  Peak concurrent mappings per destination ({NAT_IDLE_TIMEOUT:.0f}s idle timeout, "
+                  f"limit {NAT_PORT_LIMIT:,}):")
+            for row in nat['destinations'][:5]:
+                reuse = f", {row['reuse_rate']:.0f}% port reuse" if row['reuse_rate'] is not None else ""
+                print(f"    {row['proto']} {row['src']} → {row['dst']}: {row['peak_ports']:,} "
+                      f"({row['utilization']:.1f}%){reuse}")
         
         if nat['port_exhaustion_risk']:
-            print("\n  ⚠️  WARNING: High connection count detected!")
-            print("     NAT Gateway limit: 55,000 connections per IP")
-            print("     Consider adding more NAT Gateways")
+            print("\n  ⚠️  WARNING: Source ports towards one destination near the NAT limit!")
+            print("     NAT Gateway limit: 55,000 simultaneous connections per unique destination")
+            print("     Consider adding more NAT Gateways or spreading across destination IPs")
     
     # Transit Gateway
     tgw = aws_analysis['transit_gateway']
-    if tgw['cross_vpc_traffic'] > 0:
+    if tgw['cross_vpc_traffic'] > 0 or tgw['potential_asymmetric']:
         print("\n[Transit Gateway / Cross-VPC Traffic]")
         print(f"  Cross-VPC packets: {tgw['cross_vpc_traffic']}")
         print(f"  Detected VPC subnets: {len(tgw['vpc_cidrs'])}")
         if tgw['vpc_cidrs']:
             print(f"    {', '.join(sorted(tgw['vpc_cidrs']))}")
+        
+        if tgw['potential_asymmetric']:
+            print(f"\n  ⚠️  Potential asymmetric routing ({sum(tgw['asymmetric_reasons'].values())} flows):")
+            for reason, count in tgw['asymmetric_reasons'].most_common():
+                print(f"    {count:>6}  {ASYM_REASONS[reason]}")
+            
+            print("\n  By VPC pair:")
+            for (src_vpc, dst_vpc), count in tgw['asymmetric_vpc_pairs'].most_common(5):
+                print(f"    {src_vpc} → {dst_vpc}: {count} flows")
+            
+            print("\n  Top flows:")
+            for row in tgw['potential_asymmetric'][:10]:
+                hops = f", hops {row['hops_fwd']}/{row['hops_rev']}" if row['reason'] == 'ttl_mismatch' else ""
+                print(f"    {row['flow']}: {row['reason'].replace('_', ' ')}, "
+                      f"{row['packets_fwd']}/{row['packets_rev']} packets{hops}")
+            print("\n  💡 Check TGW route tables and appliance-mode on inspection VPC attachments")
 
 
 if __name__ == '__main__':
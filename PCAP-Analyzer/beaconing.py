@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Beaconing Detection Module
+Finds C2-style periodic connections from internal hosts to external
+endpoints: connection start times are grouped per (host, endpoint) pair
+and scored on inter-arrival jitter and autocorrelation periodicity in
+batched numpy operations
+"""
+
+from array import array
+
+from flow_table import int_to_ip
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# A pair needs this many connections over at least this span to be scored
+BEACON_MIN_CONNECTIONS = 8
+BEACON_MIN_SPAN = 60.0
+BEACON_MIN_PERIOD = 1.0
+
+# Reported pairs must reach this combined score (0-1)
+BEACON_MIN_SCORE = 0.6
+MAX_BEACONS = 50
+
+# Histogram bins per pair for the autocorrelation, and pairs per batch
+PERIODICITY_BINS = 256
+BATCH_PAIRS = 4096
+
+
+class ConnectionStarts:
+    """Append-only (time, source, destination, destination port) columns of new connections"""
+    __slots__ = ('ts', 'src', 'dst', 'port')
+
+    def __init__(self):
+        self.ts = array('d')
+        self.src = array('I')
+        self.dst = array('I')
+        self.port = array('H')
+
+    def append(self, ts, src, dst, port):
+        self.ts.append(ts)
+        self.src.append(src)
+        self.dst.append(dst)
+        self.port.append(port)
+
+    def __len__(self):
+        return len(self.ts)
+
+
+def private_mask(ips):
+    """RFC1918 membership of a uint32 address array"""
+    return ((ips >> 24) == 10) | ((ips >> 20) == 0xAC1) | ((ips >> 16) == 0xC0A8)
+
+
+def _grouped_median(values, groups, offsets, counts):
+    """Lower median of each group; values/groups sorted by group, every count > 0"""
+    ordered = values[np.lexsort((values, groups))]
+    return ordered[offsets + (counts - 1) // 2]
+
+
+def periodicity(ts, groups, first, span, pairs, bins=PERIODICITY_BINS):
+    """Highest normalized autocorrelation at a non-trivial lag, per pair
+
+    Each pair's start times are binned over its own span and the
+    autocorrelations of a batch of pairs come from one rfft/irfft over the
+    (pairs x bins) matrix. Lags below 2 bins and above half the span are
+    ignored.
+    """
+    position = np.minimum(((ts - first[groups]) / span[groups] * bins).astype(np.int64), bins - 1)
+    counts = np.bincount(groups * bins + position, minlength=pairs * bins).reshape(pairs, bins).astype(np.float64)
+    centered = counts - counts.mean(axis=1, keepdims=True)
+    spectrum = np.fft.rfft(centered, n=2 * bins, axis=1)
+    acf = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, n=2 * bins, axis=1)[:, :bins // 2 + 1]
+    zero = acf[:, 0]
+    return np.where(zero > 0, acf[:, 2:].max(axis=1) / np.where(zero > 0, zero, 1), 0.0)
+
+
+def detect_beacons(starts, min_connections=BEACON_MIN_CONNECTIONS, internal=None):
+    """
+    Ranked beaconing candidates from ConnectionStarts
+
+    internal(ips) -> bool mask selects the internal side (default RFC1918);
+    only internal -> external pairs are scored. jitter is the median
+    absolute deviation of the inter-arrival times over their median;
+    periodicity is the autocorrelation peak. score averages regularity
+    (1 - jitter, floored at 0) and periodicity, scaled by 1 - 1/sqrt(n) so
+    a handful of connections that happen to line up rank below a long
+    beacon. Addresses are integers.
+    """
+    if not NUMPY_AVAILABLE or len(starts) < min_connections:
+        return []
+
+    internal = internal or private_mask
+    ts = np.frombuffer(starts.ts, dtype=np.float64)
+    src = np.frombuffer(starts.src, dtype=np.uint32)
+    dst = np.frombuffer(starts.dst, dtype=np.uint32)
+    port = np.frombuffer(starts.port, dtype=np.uint16)
+    outbound = internal(src) & ~internal(dst) & (dst != 0)
+    ts, src, dst, port = ts[outbound], src[outbound], dst[outbound], port[outbound]
+    if not len(ts):
+        return []
+
+    # Sort by (pair, time) and number the pairs, keeping those with enough connections
+    hosts = (src.astype(np.uint64) << np.uint64(32)) | dst
+    order = np.lexsort((ts, port, hosts))
+    ts, hosts, port = ts[order], hosts[order], port[order]
+    new_pair = np.concatenate([[True], (hosts[1:] != hosts[:-1]) | (port[1:] != port[:-1])])
+    pair_of = np.cumsum(new_pair) - 1
+    candidate = np.bincount(pair_of) >= min_connections
+    if not candidate.any():
+        return []
+    heads = np.flatnonzero(new_pair)[candidate]
+    pair_hosts, pair_ports = hosts[heads], port[heads]
+    selected = candidate[pair_of]
+    groups = (np.cumsum(candidate) - 1)[pair_of[selected]]
+    ts = ts[selected]
+    pairs = len(heads)
+    counts = np.bincount(groups, minlength=pairs)
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    first = ts[offsets]
+    last = ts[offsets + counts - 1]
+    span = last - first
+
+    # Inter-arrival times within each pair
+    same = groups[1:] == groups[:-1]
+    intervals = np.diff(ts)[same]
+    interval_groups = groups[1:][same]
+    interval_counts = counts - 1
+    interval_offsets = np.concatenate([[0], np.cumsum(interval_counts)[:-1]])
+    median = _grouped_median(intervals, interval_groups, interval_offsets, interval_counts)
+    mad = _grouped_median(np.abs(intervals - median[interval_groups]), interval_groups,
+                          interval_offsets, interval_counts)
+    jitter = mad / np.maximum(median, 1e-9)
+
+    eligible = np.flatnonzero((span >= BEACON_MIN_SPAN) & (median >= BEACON_MIN_PERIOD))
+    if not len(eligible):
+        return []
+
+    # Autocorrelation in batches of pairs to bound the (pairs x bins) matrix
+    peaks = np.zeros(pairs)
+    for batch_start in range(0, len(eligible), BATCH_PAIRS):
+        batch = eligible[batch_start:batch_start + BATCH_PAIRS]
+        lo, hi = offsets[batch[0]], offsets[batch[-1]] + counts[batch[-1]]
+        local = np.searchsorted(batch, groups[lo:hi])
+        in_batch = batch[np.minimum(local, len(batch) - 1)] == groups[lo:hi]
+        peaks[batch] = periodicity(ts[lo:hi][in_batch], local[in_batch], first[batch], span[batch], len(batch))
+
+    confidence = 1 - 1 / np.sqrt(counts)
+    score = (np.clip(1 - jitter, 0, 1) + np.clip(peaks, 0, 1)) / 2 * confidence
+    ranked = eligible[np.argsort(score[eligible])[::-1]]
+    ranked = ranked[score[ranked] >= BEACON_MIN_SCORE][:MAX_BEACONS]
+
+    beacons = []
+    for index in ranked:
+        beacons.append({
+            'src': int(pair_hosts[index]) >> 32,
+            'dst': int(pair_hosts[index]) & 0xffffffff,
+            'port': int(pair_ports[index]),
+            'connections': int(counts[index]),
+            'first_seen': float(first[index]),
+            'last_seen': float(last[index]),
+            'period': float(median[index]),
+            'jitter': float(jitter[index]),
+            'periodicity': float(peaks[index]),
+            'score': float(score[index])
+        })
+    return beacons
+
+
+def format_period(seconds):
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f}h"
+    if seconds >= 60:
+        return f"{seconds / 60:.1f}m"
+    return f"{seconds:.1f}s"
+
+
+def print_beacons(beacons, limit=10):
+    """Print ranked beaconing candidates"""
+    if not NUMPY_AVAILABLE:
+        return
+    if not beacons:
+        print("\n  ✓ No periodic (beaconing) connections to external hosts")
+        return
+
+    print(f"\n  📡 Beaconing candidates ({len(beacons)} internal → external pairs with periodic connections):")
+    for b in beacons[:limit]:
+        print(f"    {int_to_ip(b['src']):<18} -> {int_to_ip(b['dst'])}:{b['port']:<6} every {format_period(b['period']):>6} "
+              f"x{b['connections']:<5,} jitter {b['jitter'] * 100:.1f}%, periodicity {b['periodicity']:.2f} "
+              f"(score {b['score']:.2f})")
+
+
+if __name__ == '__main__':
+    print("Beaconing Detection Module")
+    print("Import this module into pcap_analyzer_v3.py")
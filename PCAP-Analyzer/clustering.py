@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Source Clustering Module
+Groups sources that behaved alike (ports, sizes, rates, timing) by running
+vectorized k-means over standardized per-source feature vectors built from
+the conversation table - botnet members in a DDoS end up in one tight cluster
+"""
+
+from itertools import islice
+from operator import attrgetter
+
+from flow_table import PROTO_NUMBERS, int_to_ip
+from sketches import SpaceSavingTable
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Clustering needs this many sources; k is capped so clusters average this many members
+MIN_CLUSTER_SOURCES = 20
+CLUSTER_COUNT = 8
+KMEANS_ITERATIONS = 50
+KMEANS_SEED_SAMPLE = 20000
+CLUSTER_CHUNK = 65536
+
+# A cluster this large whose members sit this close to the centroid (RMS,
+# standardized units) is reported as a coordinated group
+COORDINATED_MIN_SOURCES = 10
+COORDINATED_MAX_SPREAD = 0.5
+
+# Tables clustering cannot see every source of, so it is skipped
+CLUSTER_SKIPPED = {
+    'sketched': 'the conversation table keeps only the heaviest flows (--sketch)'
+}
+
+CLUSTER_REPRESENTATIVES = 5
+CLUSTER_TOP_PORTS = 3
+
+# (name, log-scaled)
+SOURCE_FEATURES = (
+    ('flows', True),
+    ('destinations', True),
+    ('dst_ports', True),
+    ('packets_per_flow', True),
+    ('bytes_per_packet', False),
+    ('reply_ratio', False),
+    ('tcp_share', False),
+    ('flow_rate', True),
+    ('flow_duration', True),
+    ('first_seen', False)
+)
+
+# Per-source sums and extremes kept while streaming the flows
+SOURCE_SUMS = ('flows', 'packets', 'bytes', 'replies', 'tcp', 'duration')
+
+
+def flow_columns(items):
+    """
+    Initiator-oriented numpy columns of (packed key, FlowRecord) items
+
+    Packed keys are split into two 64-bit halves and unpacked as arrays.
+    """
+    keys = [key for key, _ in items]
+    high = np.fromiter((key >> 64 for key in keys), dtype=np.uint64, count=len(keys))
+    low = np.fromiter((key & 0xffffffffffffffff for key in keys), dtype=np.uint64, count=len(keys))
+    proto = (high >> np.uint64(32)).astype(np.uint8)
+    ip_a = (high & np.uint64(0xffffffff)).astype(np.uint32)
+    ip_b = ((low >> np.uint64(16)) & np.uint64(0xffffffff)).astype(np.uint32)
+    port_a = (low >> np.uint64(48)).astype(np.uint16)
+    port_b = (low & np.uint64(0xffff)).astype(np.uint16)
+
+    rows = [record for _, record in items]
+
+    def column(field, dtype=np.float64):
+        return np.fromiter(map(attrgetter(field), rows), dtype=dtype, count=len(rows))
+    a_first = column('initiator_is_a', bool)
+    packets_ab, packets_ba = column('packets_ab'), column('packets_ba')
+    return {
+        'src': np.where(a_first, ip_a, ip_b), 'dst': np.where(a_first, ip_b, ip_a),
+        'dport': np.where(a_first, port_b, port_a), 'proto': proto,
+        'packets': np.where(a_first, packets_ab, packets_ba), 'replies': np.where(a_first, packets_ba, packets_ab),
+        'bytes': np.where(a_first, column('bytes_ab'), column('bytes_ba')),
+        'first': column('first_seen'), 'last': column('last_seen')
+    }
+
+
+def _chunk_totals(columns):
+    """Per-source partial aggregates of one chunk of flow columns"""
+    sources, groups = np.unique(columns['src'], return_inverse=True)
+    n = len(sources)
+    weights = {'flows': None, 'packets': columns['packets'], 'bytes': columns['bytes'],
+               'replies': columns['replies'], 'tcp': columns['proto'] == PROTO_NUMBERS['TCP'],
+               'duration': columns['last'] - columns['first']}
+    totals = {name: np.bincount(groups, weights=weights[name], minlength=n).astype(np.float64)
+              for name in SOURCE_SUMS}
+    totals['src'] = sources
+    totals['start'] = np.full(n, np.inf)
+    totals['end'] = np.full(n, -np.inf)
+    np.minimum.at(totals['start'], groups, columns['first'])
+    np.maximum.at(totals['end'], groups, columns['last'])
+    src = columns['src'].astype(np.uint64)
+    totals['destinations'] = np.unique((src << np.uint64(32)) | columns['dst'].astype(np.uint64))
+    totals['ports'], totals['port_flows'] = np.unique((src << np.uint64(16)) | columns['dport'].astype(np.uint64),
+                                                      return_counts=True)
+    return totals
+
+
+def _merge_totals(parts):
+    """Fold partial aggregates (in stream order) into one"""
+    if len(parts) == 1:
+        return parts[0]
+    sources, groups = np.unique(np.concatenate([part['src'] for part in parts]), return_inverse=True)
+    n = len(sources)
+    totals = {name: np.bincount(groups, weights=np.concatenate([part[name] for part in parts]), minlength=n)
+              for name in SOURCE_SUMS}
+    totals['src'] = sources
+    totals['start'] = np.full(n, np.inf)
+    totals['end'] = np.full(n, -np.inf)
+    np.minimum.at(totals['start'], groups, np.concatenate([part['start'] for part in parts]))
+    np.maximum.at(totals['end'], groups, np.concatenate([part['end'] for part in parts]))
+    totals['destinations'] = np.unique(np.concatenate([part['destinations'] for part in parts]))
+    ports, slots = np.unique(np.concatenate([part['ports'] for part in parts]), return_inverse=True)
+    totals['ports'] = ports
+    totals['port_flows'] = np.bincount(slots, weights=np.concatenate([part['port_flows'] for part in parts]),
+                                       minlength=len(ports)).astype(np.int64)
+    return totals
+
+
+def source_totals(items):
+    """
+    Per-source aggregates of (packed key, FlowRecord) items, read in
+    CLUSTER_CHUNK chunks so a spilled table is never loaded whole
+
+    Holds per-source sums ('src' sorted, SOURCE_SUMS, 'start'/'end' of the
+    flows), the distinct (src << 32 | dst) pairs in 'destinations' and the
+    distinct (src << 16 | dst port) pairs in 'ports' with their flow counts.
+    Pending chunks are folded in once they outgrow the running total, so the
+    work stays amortized O(n log n) and memory follows the sources and pairs,
+    not the flows. None when there are no flows.
+    """
+    items = iter(items)
+    totals, pending, size = None, [], 0
+    while True:
+        chunk = list(islice(items, CLUSTER_CHUNK))
+        if chunk:
+            pending.append(_chunk_totals(flow_columns(chunk)))
+            size += len(pending[-1]['ports'])
+        if pending and (not chunk or size >= (len(totals['ports']) if totals else CLUSTER_CHUNK)):
+            totals = _merge_totals(([totals] if totals else []) + pending)
+            pending, size = [], 0
+        if not chunk:
+            return totals
+
+
+def source_features(totals):
+    """(source addresses, feature matrix, feature names) - one row per source of source_totals()"""
+    sources = totals['src']
+    flows, packets = totals['flows'], totals['packets']
+    start = totals['start']
+    values = {
+        'flows': flows,
+        'destinations': _pairs_per_source(totals['destinations'], 32, sources),
+        'dst_ports': _pairs_per_source(totals['ports'], 16, sources),
+        'packets_per_flow': packets / flows,
+        'bytes_per_packet': totals['bytes'] / np.maximum(packets, 1),
+        'reply_ratio': totals['replies'] / np.maximum(packets + totals['replies'], 1),
+        'tcp_share': totals['tcp'] / flows,
+        'flow_rate': flows / np.maximum(totals['end'] - start, 1.0),
+        'flow_duration': totals['duration'] / flows,
+        'first_seen': start - start.min()
+    }
+    names = [name for name, _ in SOURCE_FEATURES]
+    logged = {name for name, log in SOURCE_FEATURES if log}
+    matrix = np.column_stack([np.log1p(values[name]) if name in logged else values[name] for name in names])
+    return sources, matrix, names
+
+
+def _pairs_per_source(pairs, shift, sources):
+    """Distinct (source << shift | value) pairs per source"""
+    return np.bincount(np.searchsorted(sources, pairs >> np.uint64(shift)), minlength=len(sources))
+
+
+def standardize(matrix):
+    """Zero-mean unit-variance columns; constant columns stay at zero"""
+    mean = matrix.mean(axis=0)
+    scale = matrix.std(axis=0)
+    scale[scale == 0] = 1.0
+    return (matrix - mean) / scale, mean, scale
+
+
+def _assign(points, centroids):
+    """Nearest centroid and squared distance per point, in chunks"""
+    labels = np.empty(len(points), dtype=np.int64)
+    distances = np.empty(len(points))
+    norms = (centroids ** 2).sum(axis=1)
+    for start in range(0, len(points), CLUSTER_CHUNK):
+        chunk = points[start:start + CLUSTER_CHUNK]
+        d = norms - 2 * chunk @ centroids.T
+        labels[start:start + len(chunk)] = d.argmin(axis=1)
+        distances[start:start + len(chunk)] = d.min(axis=1)
+    distances += (points ** 2).sum(axis=1)
+    return labels, np.maximum(distances, 0)
+
+
+def kmeans(points, k, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Lloyd's k-means with k-means++ seeding on a sample
+
+    Assignment is one matrix product per chunk and the centroid update one
+    bincount per feature, so a pass stays linear in the number of points.
+    Empty clusters are re-seeded with the point farthest from its centroid.
+    Returns (labels, centroids, squared distances).
+    """
+    rng = np.random.default_rng(seed)
+    n = len(points)
+    sample = points[rng.choice(n, min(n, KMEANS_SEED_SAMPLE), replace=False)]
+    centroids = [sample[rng.integers(len(sample))]]
+    closest = ((sample - centroids[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = closest.sum()
+        if total <= 0:
+            break
+        centroids.append(sample[rng.choice(len(sample), p=closest / total)])
+        closest = np.minimum(closest, ((sample - centroids[-1]) ** 2).sum(axis=1))
+    centroids = np.array(centroids)
+    k = len(centroids)
+
+    labels = None
+    for _ in range(iterations):
+        new_labels, distances = _assign(points, centroids)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        counts = np.bincount(labels, minlength=k)
+        for column in range(points.shape[1]):
+            centroids[:, column] = np.bincount(labels, weights=points[:, column], minlength=k) / np.maximum(counts, 1)
+        for empty in np.flatnonzero(counts == 0):
+            farthest = distances.argmax()
+            centroids[empty] = points[farthest]
+            distances[farthest] = 0
+    labels, distances = _assign(points, centroids)
+    return labels, centroids, distances
+
+
+def cluster_sources(conversations, k=CLUSTER_COUNT):
+    """
+    Behaviour clusters of the sources in a conversation table, largest first
+
+    Each cluster reports its size, spread (RMS distance to the centroid in
+    standardized units), the feature centroid in original units, the members
+    closest to the centroid and the destination ports its flows used most.
+    Addresses are integers. The flows are streamed (source_totals()), so a
+    spilled table gives the same clusters as an in-memory one; a sketched
+    table is skipped (the reason is in 'skipped'): it lacks the light flows.
+    """
+    result = {'sources': 0, 'features': [], 'clusters': [], 'skipped': None}
+    if isinstance(conversations, SpaceSavingTable):
+        result['skipped'] = 'sketched'
+    if result['skipped'] or not NUMPY_AVAILABLE:
+        return result
+
+    totals = source_totals(conversations.items())
+    if totals is None:
+        return result
+    sources, matrix, names = source_features(totals)
+    result['sources'] = len(sources)
+    result['features'] = names
+    if len(sources) < MIN_CLUSTER_SOURCES:
+        return result
+
+    points, mean, scale = standardize(matrix)
+    k = max(1, min(k, len(sources) // MIN_CLUSTER_SOURCES))
+    labels, centroids, distances = kmeans(points, k)
+    k = len(centroids)
+    sizes = np.bincount(labels, minlength=k)
+    spread = np.sqrt(np.bincount(labels, weights=distances, minlength=k) / np.maximum(sizes, 1))
+
+    # Members nearest each centroid
+    order = np.lexsort((distances, labels))
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    # Destination ports by flows of each cluster's members
+    pair_cluster = labels[np.searchsorted(sources, totals['ports'] >> np.uint64(16))]
+    port_keys, slots = np.unique(pair_cluster << 16 | (totals['ports'] & np.uint64(0xffff)).astype(np.int64),
+                                 return_inverse=True)
+    port_flows = np.bincount(slots, weights=totals['port_flows'], minlength=len(port_keys)).astype(np.int64)
+
+    logged = {name for name, log in SOURCE_FEATURES if log}
+    centres = centroids * scale + mean
+    for cluster in np.argsort(sizes)[::-1]:
+        if not sizes[cluster]:
+            continue
+        members = order[offsets[cluster]:offsets[cluster] + min(sizes[cluster], CLUSTER_REPRESENTATIVES)]
+        in_cluster = (port_keys >> 16) == cluster
+        top = np.argsort(port_flows[in_cluster])[::-1][:CLUSTER_TOP_PORTS]
+        result['clusters'].append({
+            'size': int(sizes[cluster]),
+            'share': float(sizes[cluster] / len(sources)),
+            'spread': float(spread[cluster]),
+            'coordinated': bool(sizes[cluster] >= COORDINATED_MIN_SOURCES and spread[cluster] <= COORDINATED_MAX_SPREAD),
+            # Features are non-negative; clamp rounding noise (no "-0%")
+            'centroid': {name: max(0.0, float(np.expm1(value) if name in logged else value))
+                         for name, value in zip(names, centres[cluster])},
+            'representatives': [int(sources[i]) for i in members],
+            'top_ports': [(int(port_keys[in_cluster][i] & 0xffff), int(port_flows[in_cluster][i])) for i in top]
+        })
+    return result
+
+
+def print_source_clusters(report, limit=8):
+    """Print behaviour clusters, coordinated groups flagged"""
+    if report.get('skipped'):
+        print(f"\n  🧬 Source clustering skipped: {CLUSTER_SKIPPED[report['skipped']]}")
+        return
+    if not NUMPY_AVAILABLE or not report['clusters']:
+        return
+
+    print(f"\n  🧬 Source behaviour clusters ({report['sources']:,} sources, k-means on {len(report['features'])} features):")
+    for cluster in report['clusters'][:limit]:
+        c = cluster['centroid']
+        marker = '🔴' if cluster['coordinated'] else '  '
+        print(f"    {marker} {cluster['size']:>7,} sources ({cluster['share'] * 100:4.1f}%)  spread {cluster['spread']:.2f}  "
+              f"{c['flows']:.1f} flows, {c['destinations']:.1f} dsts, {c['dst_ports']:.1f} ports, "
+              f"{c['packets_per_flow']:.1f} pkts/flow, {c['bytes_per_packet']:.0f} B/pkt, "
+              f"reply {c['reply_ratio'] * 100:.0f}%" + (f", {c['flow_rate']:.2f} flows/s" if 'flow_rate' in c else ''))
+        ports = ', '.join(f"{port} ({flows:,})" for port, flows in cluster['top_ports'])
+        print(f"         ports: {ports}  e.g. {', '.join(int_to_ip(ip) for ip in cluster['representatives'][:3])}")
+    coordinated = [cluster for cluster in report['clusters'] if cluster['coordinated']]
+    if coordinated:
+        print(f"\n  🔴 {len(coordinated)} tight cluster(s) of {sum(c['size'] for c in coordinated):,} sources behaving alike "
+              f"(possible botnet / coordinated sources)")
+
+
+if __name__ == '__main__':
+    print("Source Clustering Module")
+    print("Import this module into pcap_analyzer_v3.py")
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+DNS Analysis Module
+Scores queried names for DNS tunneling and DGA traits: label length,
+character entropy and bigram rarity (computed in batch over unique names
+with numpy), unique subdomains per parent domain (HyperLogLog-backed) and
+TXT/NULL query volume
+"""
+
+from collections import Counter
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from sketches import DistinctCounter
+
+QTYPE_NAMES = {1: 'A', 2: 'NS', 5: 'CNAME', 6: 'SOA', 10: 'NULL', 12: 'PTR', 15: 'MX', 16: 'TXT',
+               28: 'AAAA', 33: 'SRV', 65: 'HTTPS', 255: 'ANY'}
+
+# Query types favoured by tunnels for their large payloads
+TUNNEL_QTYPES = {10, 16}
+
+# Second-level labels under which registrations happen (co.uk, com.au, ...)
+SECOND_LEVEL_LABELS = {'co', 'com', 'net', 'org', 'gov', 'ac', 'edu', 'ne', 'or'}
+
+# Parent domains need this many unique subdomains to be scored as tunnels
+DNS_MIN_SUBDOMAINS = 20
+TUNNEL_MIN_SCORE = 0.5
+DGA_MIN_SCORE = 0.6
+DGA_MIN_LENGTH = 8
+
+# Memory bounds: unique names and parent domains tracked
+MAX_DNS_NAMES = 200000
+MAX_DNS_PARENTS = 50000
+MAX_DNS_FINDINGS = 50
+
+# Characters of a hostname label; everything else shares the last index
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789-'
+_PAD = len(ALPHABET) + 1
+
+# Reference text for the bigram model: words common in legitimate hostnames
+REFERENCE_TEXT = (
+    'www mail smtp imap pop api app apps cdn static assets images img media video stream update updates '
+    'download downloads login auth account accounts secure portal admin support help docs status service '
+    'services cloud server servers storage backup data analytics metrics telemetry events tracking ads '
+    'news shop store search maps drive calendar office online web mobile edge global prod staging dev test '
+    'internal corp vpn proxy gateway router dns ntp time sync push notify notifications chat message '
+    'google amazon amazonaws microsoft windows apple icloud facebook instagram twitter linkedin github '
+    'gitlab slack zoom dropbox adobe oracle akamai cloudflare fastly azure office365 outlook live yahoo '
+    'netflix spotify youtube wikipedia reddit ubuntu debian fedora mozilla firefox chrome android '
+    'the and for with from this that have more about home page group world north south east west central '
+    'international network networks system systems security center company business market finance bank '
+    'health care school university library travel hotel music sport sports games game software hardware '
+    'digital solutions technology media energy power water weather'
+)
+
+
+def parent_domain(name):
+    """Registered domain of a query name: last two labels, three under co.uk-style suffixes"""
+    labels = name.rstrip('.').lower().split('.')
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_LABELS:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+
+def bigram_model(text=REFERENCE_TEXT):
+    """Log2 probabilities of next-character given character (add-one smoothed), pad rows/columns included"""
+    counts = np.ones((_PAD + 1, _PAD + 1))
+    for word in text.split():
+        codes = [ALPHABET.find(c) for c in word]
+        for a, b in zip(codes, codes[1:]):
+            counts[a, b] += 1
+    return np.log2(counts / counts.sum(axis=1, keepdims=True))
+
+
+def encode_names(names, width=64):
+    """(names x width) matrix of alphabet indexes, dots and padding as _PAD"""
+    table = np.full(256, len(ALPHABET), dtype=np.uint8)
+    table[np.frombuffer(ALPHABET.encode(), dtype=np.uint8)] = np.arange(len(ALPHABET), dtype=np.uint8)
+    table[ord('.')] = _PAD
+    # Right-aligned so the registered label survives truncation of long names
+    packed = b''.join(name.encode('ascii', errors='replace')[-width:].rjust(width, b'.') for name in names)
+    return table[np.frombuffer(packed, dtype=np.uint8).reshape(len(names), width)]
+
+
+def name_features(names, model=None):
+    """
+    Batch features of the labels left of each registered domain's TLD part
+
+    Returns dict of arrays: length (characters scored), longest label,
+    entropy (bits per character) and rarity (mean -log2 bigram probability
+    under the reference model).
+    """
+    model = bigram_model() if model is None else model
+    codes = encode_names(names)
+    rows, width = codes.shape
+    valid = codes != _PAD
+    length = valid.sum(axis=1)
+
+    # Character entropy from per-row histograms
+    histogram = np.bincount((np.arange(rows)[:, None] * (_PAD + 1) + codes).ravel(),
+                            minlength=rows * (_PAD + 1)).reshape(rows, _PAD + 1)[:, :_PAD]
+    p = histogram / np.maximum(length, 1)[:, None]
+    entropy = -(p * np.log2(np.where(p > 0, p, 1))).sum(axis=1)
+
+    # Bigram rarity within labels
+    pairs = valid[:, :-1] & valid[:, 1:]
+    logp = model[codes[:, :-1], codes[:, 1:]]
+    rarity = -(logp * pairs).sum(axis=1) / np.maximum(pairs.sum(axis=1), 1)
+
+    # Longest run of label characters
+    breaks = np.concatenate([np.zeros((rows, 1), dtype=bool), ~valid, np.zeros((rows, 1), dtype=bool)], axis=1)
+    position = np.where(breaks, np.arange(width + 2), 0)
+    last_break = np.maximum.accumulate(position, axis=1)[:, 1:-1]
+    longest = np.where(valid, np.arange(1, width + 1) - last_break, 0).max(axis=1)
+
+    return {'length': length, 'longest_label': longest, 'entropy': entropy, 'rarity': rarity}
+
+
+def _scaled(values, low, high):
+    return np.clip((values - low) / (high - low), 0, 1)
+
+
+class DnsTracker:
+    """
+    Streaming DNS query state fed by observe() for every query
+
+    Unique names keep a count and the first querying host (bounded); each
+    parent domain keeps queries, TXT/NULL queries and a DistinctCounter of
+    subdomains (exact while small, HyperLogLog beyond), so cardinality stays
+    accurate even after the name table is full. Scoring is deferred to
+    report(), which works on unique names in numpy batches.
+    """
+
+    def __init__(self, max_names=MAX_DNS_NAMES):
+        self.max_names = max_names
+        self.names = {}
+        self.parents = {}
+        self.qtypes = Counter()
+        self.queries = 0
+        self.untracked = 0
+
+    def observe(self, src, qname, qtype=1):
+        name = qname.rstrip('.').lower()
+        if not name:
+            return
+        self.queries += 1
+        self.qtypes[qtype] += 1
+
+        entry = self.names.get(name)
+        if entry is not None:
+            entry[0] += 1
+        elif len(self.names) < self.max_names:
+            self.names[name] = [1, src]
+        else:
+            self.untracked += 1
+
+        parent = parent_domain(name)
+        stats = self.parents.get(parent)
+        if stats is None:
+            if len(self.parents) >= MAX_DNS_PARENTS:
+                return
+            # queries, TXT/NULL queries, distinct subdomains, distinct sources
+            stats = self.parents[parent] = [0, 0, DistinctCounter(), DistinctCounter(limit=16)]
+        stats[0] += 1
+        if qtype in TUNNEL_QTYPES:
+            stats[1] += 1
+        if name != parent:
+            stats[2].add(name[:-len(parent) - 1])
+        stats[3].add(src)
+
+    def report(self):
+        """Tunneling suspects per parent domain and DGA-like names, highest score first"""
+        result = {
+            'queries': self.queries,
+            'unique_names': len(self.names),
+            'untracked': self.untracked,
+            'qtypes': {QTYPE_NAMES.get(qtype, str(qtype)): count for qtype, count in self.qtypes.most_common()},
+            'tunneling': [],
+            'dga': [],
+            'dga_sources': []
+        }
+        if not NUMPY_AVAILABLE or not self.names:
+            return result
+
+        names = list(self.names)
+        parents = [parent_domain(name) for name in names]
+        parent_index = {parent: index for index, parent in enumerate(dict.fromkeys(parents))}
+        groups = np.fromiter((parent_index[parent] for parent in parents), dtype=np.int64, count=len(parents))
+        labels = [parent.split('.')[0] for parent in parent_index]
+
+        # Names scored on the part left of the public suffix: subdomains plus the registered label
+        features = name_features([name[:-len(parent)] + label for name, parent, label
+                                  in zip(names, parents, (labels[g] for g in groups))])
+        tunnel_name = (_scaled(features['entropy'], 2.5, 4.0) + _scaled(features['rarity'], 4.4, 5.8)
+                       + _scaled(features['longest_label'], 20, 50)) / 3
+        name_mean = np.bincount(groups, weights=tunnel_name) / np.bincount(groups)
+        longest = np.zeros(len(parent_index), dtype=np.int64)
+        np.maximum.at(longest, groups, features['longest_label'])
+
+        for parent, index in parent_index.items():
+            stats = self.parents.get(parent)
+            if stats is None:
+                continue
+            queries, tunnel_queries, subdomains, sources = stats
+            unique = len(subdomains)
+            if unique < DNS_MIN_SUBDOMAINS:
+                continue
+            score = (0.4 * name_mean[index] + 0.3 * min(1.0, np.log10(unique) / 3)
+                     + 0.3 * min(1.0, 2 * tunnel_queries / queries))
+            if score >= TUNNEL_MIN_SCORE:
+                result['tunneling'].append({
+                    'domain': parent, 'score': float(score), 'queries': queries, 'unique_subdomains': unique,
+                    'txt_null_queries': tunnel_queries, 'sources': len(sources),
+                    'longest_label': int(longest[index]), 'name_score': float(name_mean[index])
+                })
+        result['tunneling'].sort(key=lambda row: row['score'], reverse=True)
+        del result['tunneling'][MAX_DNS_FINDINGS:]
+
+        # DGA: the registered label itself looks random (tunnels randomize subdomains instead)
+        label_features = name_features(labels)
+        dga_score = (0.7 * _scaled(label_features['rarity'], 4.4, 5.4)
+                     + 0.3 * _scaled(label_features['entropy'], 2.5, 3.5))
+        flagged = (dga_score >= DGA_MIN_SCORE) & (label_features['length'] >= DGA_MIN_LENGTH)
+        if flagged.any():
+            domains = list(parent_index)
+            per_source = Counter(self.names[names[i]][1] for i in np.flatnonzero(flagged[groups]))
+            first_source = {}
+            for i in np.flatnonzero(flagged[groups]):
+                first_source.setdefault(groups[i], self.names[names[i]][1])
+            for index in np.flatnonzero(flagged)[np.argsort(dga_score[flagged])[::-1]][:MAX_DNS_FINDINGS]:
+                stats = self.parents.get(domains[index])
+                result['dga'].append({
+                    'domain': domains[index], 'score': float(dga_score[index]),
+                    'queries': stats[0] if stats else 0, 'first_source': first_source[index],
+                    'entropy': float(label_features['entropy'][index]),
+                    'rarity': float(label_features['rarity'][index])
+                })
+            result['dga_sources'] = per_source.most_common(10)
+        return result
+
+
+def print_dns_threats(report, limit=10):
+    """Print tunneling and DGA findings"""
+    if not NUMPY_AVAILABLE or not report['queries']:
+        return
+
+    print(f"\n  📍 Query names: {report['queries']:,} queries, {report['unique_names']:,} unique names")
+    tunnel_types = {name: count for name, count in report['qtypes'].items() if name in ('TXT', 'NULL')}
+    if tunnel_types:
+        print(f"    TXT/NULL queries: {', '.join(f'{name} {count:,}' for name, count in tunnel_types.items())}")
+    if report['untracked']:
+        print(f"    ({report['untracked']:,} names beyond the {MAX_DNS_NAMES:,}-name limit not scored)")
+
+    if report['tunneling']:
+        print(f"\n  🔴 Possible DNS tunneling ({len(report['tunneling'])} domain(s)):")
+        for row in report['tunneling'][:limit]:
+            print(f"    {row['domain']:<32} score {row['score']:.2f}  {row['unique_subdomains']:,} unique subdomains, "
+                  f"{row['queries']:,} queries ({row['txt_null_queries']:,} TXT/NULL), "
+                  f"longest label {row['longest_label']}, {row['sources']} source(s)")
+    else:
+        print("\n  ✓ No DNS tunneling indicators")
+
+    if report['dga']:
+        print(f"\n  ⚠️  DGA-like domains ({len(report['dga'])}):")
+        for row in report['dga'][:limit]:
+            print(f"    {row['domain']:<32} score {row['score']:.2f}  entropy {row['entropy']:.2f}, "
+                  f"bigram rarity {row['rarity']:.1f}, {row['queries']} queries (first from {row['first_source']})")
+        if report['dga_sources']:
+            print(f"    Hosts resolving them: " + ', '.join(f"{src} ({count})" for src, count in report['dga_sources']))
+
+
+if __name__ == '__main__':
+    print("DNS Analysis Module")
+    print("Import this module into pcap_analyzer_v3.py")
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Flood Detection Module
+Vectorized sliding-window SYN/UDP/ICMP flood detection (numpy) over packet
+timestamp columns, in aggregate and per target / per source, reported as
+episodes with peak rates and top talkers
+"""
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from timeseries import FLAG_SYN, PROTO_CODES
+
+# Sliding window widths in seconds - short windows catch sub-second bursts
+FLOOD_WINDOWS = (0.1, 1.0, 10.0)
+
+# Packets per second (sustained over any one window) that make a flood
+FLOOD_THRESHOLDS = {
+    'total': {'syn': 1000, 'udp': 5000, 'icmp': 1000},
+    'target': {'syn': 500, 'udp': 2000, 'icmp': 500},
+    'source': {'syn': 200, 'udp': 1000, 'icmp': 200}
+}
+
+FLOOD_KINDS = {'syn': 'TCP SYN flood', 'udp': 'UDP flood', 'icmp': 'ICMP flood'}
+FLOOD_SCOPES = {'total': 'all traffic', 'target': 'per target', 'source': 'per source'}
+
+MAX_FLOOD_EPISODES = 50
+TOP_FLOOD_TALKERS = 3
+
+
+def flood_masks(columns):
+    """Per-packet masks selecting SYNs, UDP and ICMP from PacketColumns (timeseries.py)"""
+    proto = np.frombuffer(columns.proto, dtype=np.uint8)
+    flags = np.frombuffer(columns.flags, dtype=np.uint8)
+    return {
+        'syn': (proto == PROTO_CODES['TCP']) & ((flags & FLAG_SYN) > 0),
+        'udp': proto == PROTO_CODES['UDP'],
+        'icmp': proto == PROTO_CODES['ICMP']
+    }
+
+
+def _top(values, n=TOP_FLOOD_TALKERS):
+    keys, counts = np.unique(values, return_counts=True)
+    order = np.argsort(counts)[::-1][:n]
+    return [(int(keys[i]), int(counts[i])) for i in order]
+
+
+def window_starts(micros, groups, width):
+    """
+    Index of the first packet of the same group less than `width` earlier, per packet
+
+    A searchsorted(side='right') of (group, time - width) over the sorted
+    (group, time) pairs, done as one lexsort of packets and queries so group
+    and time never share a packed key (no overflow on long spans).
+    """
+    n = len(micros)
+    is_query = np.concatenate([np.zeros(n, dtype=bool), np.ones(n, dtype=bool)])
+    order = np.lexsort((is_query, np.concatenate([micros, micros - width]), np.concatenate([groups, groups])))
+    packets_before = np.cumsum(~is_query[order])
+    queries = is_query[order]
+    left = np.empty(n, dtype=np.int64)
+    left[order[queries] - n] = packets_before[queries]
+    return left
+
+
+def window_episodes(micros, groups, window, threshold):
+    """
+    Episodes where a group's packets in a trailing window reach `threshold`
+
+    micros: int64 microsecond times and groups: int64 group ids, both sorted
+    by (group, time). The count in the window ending at each packet comes
+    from window_starts(). Returns a list of (first index, last index, peak
+    count) slices into the sorted arrays.
+    """
+    width = int(round(window * 1e6))
+    left = window_starts(micros, groups, width)
+    counts = np.arange(len(micros)) - left + 1
+    flagged = np.flatnonzero(counts >= threshold)
+    if not len(flagged):
+        return []
+
+    # Consecutive flagged packets within one window of each other form an episode
+    breaks = np.flatnonzero((np.diff(groups[flagged]) != 0) | (np.diff(micros[flagged]) > width)) + 1
+    episodes = []
+    for run in np.split(flagged, breaks):
+        first, last = int(left[run[0]]), int(run[-1])
+        episodes.append((first, last, int(counts[run].max())))
+    return episodes
+
+
+def detect_floods(columns, windows=FLOOD_WINDOWS, thresholds=None):
+    """
+    Flood episodes for each kind (syn/udp/icmp) and scope (total/target/source)
+
+    thresholds overrides FLOOD_THRESHOLDS per scope and kind (packets/sec).
+    Episodes found with several window widths are merged when they overlap;
+    peak_rate is the highest rate seen in any window. At most
+    MAX_FLOOD_EPISODES per kind and scope, highest peak first; addresses are
+    32-bit integers.
+    """
+    if not NUMPY_AVAILABLE or not len(columns):
+        return []
+
+    limits = {scope: dict(kinds) for scope, kinds in FLOOD_THRESHOLDS.items()}
+    for scope, kinds in (thresholds or {}).items():
+        limits.setdefault(scope, {}).update(kinds)
+
+    ts = np.frombuffer(columns.ts, dtype=np.float64)
+    src = np.frombuffer(columns.src, dtype=np.uint32)
+    dst = np.frombuffer(columns.dst, dtype=np.uint32)
+    micros_all = np.rint((ts - ts.min()) * 1e6).astype(np.int64)
+    start = float(ts.min())
+
+    episodes = []
+    for kind, mask in flood_masks(columns).items():
+        selected = np.flatnonzero(mask)
+        if not len(selected):
+            continue
+        for scope, by in (('total', None), ('target', dst), ('source', src)):
+            rate = limits.get(scope, {}).get(kind)
+            if not rate:
+                continue
+            needed = [(window, max(2, int(np.ceil(rate * window)))) for window in windows]
+
+            if by is None:
+                index = selected[np.argsort(micros_all[selected], kind='stable')]
+                groups = np.zeros(len(index), dtype=np.int64)
+            else:
+                # Only groups with enough packets for the smallest window can flood
+                values, inverse, totals = np.unique(by[selected], return_inverse=True, return_counts=True)
+                keep = totals[inverse] >= min(n for _, n in needed)
+                if not keep.any():
+                    continue
+                candidates, group_ids = selected[keep], inverse[keep].astype(np.int64)
+                order = np.lexsort((micros_all[candidates], group_ids))
+                index, groups = candidates[order], group_ids[order]
+            micros = micros_all[index]
+
+            found = []
+            for window, count in needed:
+                for first, last, peak in window_episodes(micros, groups, window, count):
+                    found.append([first, last, peak / window, window])
+
+            # Merge overlapping episodes of the same group across window widths
+            found.sort(key=lambda e: (int(groups[e[0]]), e[0]))
+            merged = []
+            for episode in found:
+                previous = merged[-1] if merged else None
+                if previous and groups[previous[0]] == groups[episode[0]] and episode[0] <= previous[1]:
+                    previous[1] = max(previous[1], episode[1])
+                    previous[2] = max(previous[2], episode[2])
+                    previous[3].add(episode[3])
+                else:
+                    merged.append([episode[0], episode[1], episode[2], {episode[3]}])
+
+            merged.sort(key=lambda e: e[2], reverse=True)
+            for first, last, peak_rate, fired in merged[:MAX_FLOOD_EPISODES]:
+                packets = index[first:last + 1]
+                episodes.append({
+                    'kind': kind,
+                    'scope': scope,
+                    'key': None if by is None else int(by[packets[0]]),
+                    'start': start + float(micros[first]) / 1e6,
+                    'end': start + float(micros[last]) / 1e6,
+                    'packets': len(packets),
+                    'peak_rate': float(peak_rate),
+                    'windows': sorted(fired),
+                    'top_sources': _top(src[packets]),
+                    'top_targets': _top(dst[packets])
+                })
+
+    return episodes
+
+
+if __name__ == '__main__':
+    print("Flood Detection Module")
+    print("Import this module into pcap_analyzer_v3.py")
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Flow Database Module
+Stores canonical bidirectional flow records and per-second aggregates from
+one or many captures in SQLite for ad-hoc SQL (pcap_analyzer_v3.py ingest/query)
+"""
+
+import hashlib
+import os
+import sqlite3
+from datetime import datetime
+
+from flow_table import PROTO_NUMBERS, FlowRecord, flow_endpoints, flow_key, ip_to_int
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    fingerprint TEXT NOT NULL UNIQUE,
+    packets INTEGER DEFAULT 0,
+    bytes INTEGER DEFAULT 0,
+    first_seen REAL,
+    last_seen REAL,
+    ingested_at TEXT
+);
+CREATE TABLE IF NOT EXISTS flows (
+    capture_id INTEGER NOT NULL,
+    proto TEXT NOT NULL,
+    ip_a TEXT NOT NULL,
+    port_a INTEGER NOT NULL,
+    ip_b TEXT NOT NULL,
+    port_b INTEGER NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    packets_ab INTEGER NOT NULL,
+    bytes_ab INTEGER NOT NULL,
+    packets_ba INTEGER NOT NULL,
+    bytes_ba INTEGER NOT NULL,
+    syn INTEGER NOT NULL,
+    synack INTEGER NOT NULL,
+    rst INTEGER NOT NULL,
+    fin INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS seconds (
+    capture_id INTEGER NOT NULL,
+    second INTEGER NOT NULL,
+    packets INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    tcp INTEGER NOT NULL,
+    udp INTEGER NOT NULL,
+    icmp INTEGER NOT NULL,
+    syn INTEGER NOT NULL,
+    rst INTEGER NOT NULL,
+    new_flows INTEGER NOT NULL
+);
+"""
+
+# Created after the first bulk load into an empty database - inserting into
+# indexed tables is several times slower, but rebuilding them over a large
+# database costs more than maintaining them, so later loads keep them
+INDEXES = {
+    'idx_flows_ip_a': 'flows(ip_a)',
+    'idx_flows_ip_b': 'flows(ip_b)',
+    'idx_flows_ports': 'flows(port_b, port_a)',
+    'idx_flows_time': 'flows(capture_id, first_seen)',
+    'idx_seconds_time': 'seconds(capture_id, second)'
+}
+
+# A flow idle for this long is written out; later packets start a new record
+FLOW_IDLE_TIMEOUT = 120.0
+BATCH_SIZE = 5000
+SWEEP_EVERY = 100000
+
+# Canned queries matching the text report sections; {where} filters by capture
+CANNED_QUERIES = {
+    'captures': ("Ingested captures",
+                 "SELECT id, name, packets, bytes, datetime(first_seen, 'unixepoch') AS start, "
+                 "round(last_seen - first_seen, 1) AS duration_s FROM captures ORDER BY id"),
+    'protocols': ("Protocol distribution (flows / packets / bytes)",
+                  "SELECT proto, count(*) AS flows, sum(packets_ab + packets_ba) AS packets, "
+                  "sum(bytes_ab + bytes_ba) AS bytes FROM flows {where} GROUP BY proto ORDER BY packets DESC"),
+    'conversations': ("Top conversations by packets",
+                      "SELECT proto, ip_a || ':' || port_a AS endpoint_a, ip_b || ':' || port_b AS endpoint_b, "
+                      "sum(packets_ab + packets_ba) AS packets, sum(bytes_ab + bytes_ba) AS bytes "
+                      "FROM flows {where} GROUP BY proto, ip_a, port_a, ip_b, port_b ORDER BY packets DESC"),
+    'talkers': ("Top talkers by bytes (either direction)",
+                "SELECT ip, sum(packets) AS packets, sum(bytes) AS bytes FROM ("
+                "SELECT ip_a AS ip, packets_ab + packets_ba AS packets, bytes_ab + bytes_ba AS bytes FROM flows {where} "
+                "UNION ALL SELECT ip_b, packets_ab + packets_ba, bytes_ab + bytes_ba FROM flows {where}) "
+                "GROUP BY ip ORDER BY bytes DESC"),
+    'ports': ("Top server ports by flows",
+              "SELECT proto, port_b AS port, count(*) AS flows, count(DISTINCT ip_a) AS clients, "
+              "sum(packets_ab + packets_ba) AS packets FROM flows {where} "
+              "GROUP BY proto, port_b ORDER BY flows DESC"),
+    'handshakes': ("TCP handshake success by server",
+                   "SELECT ip_b AS server, port_b AS port, sum(syn) AS syn, sum(synack) AS synack, "
+                   "round(100.0 * sum(synack) / max(sum(syn), 1), 1) AS success_pct "
+                   "FROM flows {where_and} proto = 'TCP' AND syn > 0 GROUP BY ip_b, port_b ORDER BY syn DESC"),
+    'resets': ("Flows ending in RST",
+               "SELECT ip_a || ':' || port_a AS endpoint_a, ip_b || ':' || port_b AS endpoint_b, rst, "
+               "packets_ab + packets_ba AS packets FROM flows {where_and} rst > 0 ORDER BY rst DESC"),
+    'timeline': ("Per-second traffic",
+                 "SELECT datetime(second, 'unixepoch') AS time, sum(packets) AS packets, sum(bytes) AS bytes, "
+                 "sum(syn) AS syn, sum(rst) AS rst, sum(new_flows) AS new_flows "
+                 "FROM seconds {where} GROUP BY second ORDER BY second")
+}
+
+
+def content_fingerprint(pcap_file, chunk=1 << 20):
+    """Content fingerprint: size plus the first and last MB (cheap on huge files)"""
+    size = os.path.getsize(pcap_file)
+    digest = hashlib.sha256(str(size).encode())
+    with open(pcap_file, 'rb') as f:
+        digest.update(f.read(chunk))
+        if size > chunk:
+            f.seek(max(chunk, size - chunk))
+            digest.update(f.read(chunk))
+    return digest.hexdigest()
+
+
+class FlowDatabase:
+    """SQLite flow store with batched, transactional inserts"""
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(SCHEMA)
+        self.capture_id = None
+
+    def close(self):
+        self.conn.close()
+
+    def has_capture(self, fingerprint):
+        return self.conn.execute("SELECT 1 FROM captures WHERE fingerprint = ?", (fingerprint,)).fetchone() is not None
+
+    def begin_capture(self, pcap_file, fingerprint):
+        """Start ingesting a capture
+
+        Into an empty database the indexes are left out until finish_capture();
+        otherwise they stay and rows go in as batched executemany() calls, one
+        transaction per batch.
+        """
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.execute("PRAGMA journal_mode = MEMORY")
+        if self.conn.execute("SELECT 1 FROM flows LIMIT 1").fetchone() is None:
+            for name in INDEXES:
+                self.conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+        cursor = self.conn.execute(
+            "INSERT INTO captures (name, path, fingerprint, ingested_at) VALUES (?, ?, ?, ?)",
+            (os.path.basename(pcap_file), os.path.abspath(pcap_file), fingerprint,
+             datetime.now().isoformat(timespec='seconds')))
+        self.capture_id = cursor.lastrowid
+        self.flows = {}
+        self.seconds = {}
+        self.pending = []
+        self.packets = 0
+        self.bytes = 0
+        self.first_seen = None
+        self.last_seen = None
+
+    def add_packet(self, ts, proto, src, sport, dst, dport, size, flags=0):
+        """Account one packet to its flow; both directions share one record
+
+        Records are flow_table.FlowRecord entries under the packed canonical
+        key, written with side A as the initiator (normally the client).
+        """
+        self.packets += 1
+        self.bytes += size
+        if self.first_seen is None:
+            self.first_seen = ts
+        self.last_seen = ts
+
+        key, forward = flow_key(PROTO_NUMBERS[proto], ip_to_int(src), sport, ip_to_int(dst), dport)
+        flow = self.flows.get(key)
+        new_flow = flow is None or ts - flow.last_seen > FLOW_IDLE_TIMEOUT
+        if new_flow:
+            if flow is not None:
+                self._queue_flow(key, flow)
+            flow = self.flows[key] = FlowRecord(ts, forward, flags)
+        flow.update(ts, forward, size, flags)
+
+        syn = flags & 0x12 == 0x02
+
+        second = self.seconds.get(int(ts))
+        if second is None:
+            # packets, bytes, tcp, udp, icmp, syn, rst, new_flows
+            second = self.seconds[int(ts)] = [0, 0, 0, 0, 0, 0, 0, 0]
+        second[0] += 1
+        second[1] += size
+        if proto == 'TCP':
+            second[2] += 1
+        elif proto == 'UDP':
+            second[3] += 1
+        elif proto == 'ICMP':
+            second[4] += 1
+        if syn:
+            second[5] += 1
+        if flags & 0x04:
+            second[6] += 1
+        if new_flow:
+            second[7] += 1
+
+        if self.packets % SWEEP_EVERY == 0:
+            self._sweep_idle(ts)
+
+    def _queue_flow(self, key, flow):
+        """Queue a FlowRecord as a row with side A = the initiator"""
+        if flow.initiator_is_a:
+            counters = (flow.packets_ab, flow.bytes_ab, flow.packets_ba, flow.bytes_ba)
+        else:
+            counters = (flow.packets_ba, flow.bytes_ba, flow.packets_ab, flow.bytes_ab)
+        self.pending.append((self.capture_id,) + flow_endpoints(key, flow.initiator_is_a)
+                            + (flow.first_seen, flow.last_seen) + counters
+                            + (flow.syn, flow.synack, flow.rst, flow.fin))
+        if len(self.pending) >= BATCH_SIZE:
+            self._flush()
+
+    def _sweep_idle(self, now):
+        """Write out flows that have gone idle so memory tracks active flows only"""
+        idle = [key for key, flow in self.flows.items() if now - flow.last_seen > FLOW_IDLE_TIMEOUT]
+        for key in idle:
+            self._queue_flow(key, self.flows.pop(key))
+
+    def _flush(self):
+        if self.pending:
+            with self.conn:
+                self.conn.executemany("INSERT INTO flows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                      self.pending)
+            self.pending = []
+
+    def finish_capture(self):
+        """Flush remaining flows and per-second rows, then build the indexes"""
+        for key, flow in self.flows.items():
+            self._queue_flow(key, flow)
+        self.flows = {}
+        self._flush()
+
+        rows = [(self.capture_id, second) + tuple(values) for second, values in sorted(self.seconds.items())]
+        with self.conn:
+            for start in range(0, len(rows), BATCH_SIZE):
+                self.conn.executemany("INSERT INTO seconds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                      rows[start:start + BATCH_SIZE])
+            self.conn.execute("UPDATE captures SET packets = ?, bytes = ?, first_seen = ?, last_seen = ? WHERE id = ?",
+                              (self.packets, self.bytes, self.first_seen, self.last_seen, self.capture_id))
+        self.seconds = {}
+        self.build_indexes()
+
+    def abort_capture(self):
+        """Forget a partially ingested capture so a later run re-ingests it"""
+        self.pending = []
+        with self.conn:
+            for table in ('flows', 'seconds'):
+                self.conn.execute(f"DELETE FROM {table} WHERE capture_id = ?", (self.capture_id,))
+            self.conn.execute("DELETE FROM captures WHERE id = ?", (self.capture_id,))
+        self.build_indexes()
+
+    def build_indexes(self):
+        with self.conn:
+            for name, target in INDEXES.items():
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+
+    def query(self, sql, params=()):
+        cursor = self.conn.execute(sql, params)
+        columns = [d[0] for d in cursor.description] if cursor.description else []
+        return columns, cursor.fetchall()
+
+
+def canned_sql(name, capture=None, limit=20):
+    """SQL (and parameters) for a canned query, optionally limited to one capture"""
+    title, sql = CANNED_QUERIES[name]
+    params = ()
+    where, where_and = "", "WHERE"
+    if capture is not None and name != 'captures':
+        where = "WHERE capture_id = (SELECT id FROM captures WHERE name = ? OR id = ?)"
+        where_and = where + " AND"
+        params = (capture, capture) * sql.count('{where}') + (capture, capture) * sql.count('{where_and}')
+    sql = sql.format(where=where, where_and=where_and)
+    if limit and name != 'captures':
+        sql += f" LIMIT {int(limit)}"
+    return title, sql, params
+
+
+def print_rows(columns, rows):
+    """Print query results as an aligned text table"""
+    if not columns:
+        print("  (no result set)")
+        return
+    grouped = [not ('port' in c or c == 'id') for c in columns]
+    cells = [[("" if v is None else f"{v:,}" if isinstance(v, int) and g else str(v)) for v, g in zip(row, grouped)]
+             for row in rows]
+    widths = [max([len(c)] + [len(r[i]) for r in cells]) for i, c in enumerate(columns)]
+    print("  " + "  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    print("  " + "  ".join('-' * w for w in widths))
+    for row in cells:
+        print("  " + "  ".join(v.ljust(w) for v, w in zip(row, widths)))
+    print(f"\n  {len(rows):,} row(s)")
+
+
+if __name__ == '__main__':
+    print("Flow Database Module")
+    print("Import this module into pcap_analyzer_v3.py")
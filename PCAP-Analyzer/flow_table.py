@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Flow Table Module
+Canonical bidirectional flow records keyed by a packed integer 5-tuple; both
+directions of a connection share one record with per-direction counters,
+first/last timestamps, TCP flags seen and a small TCP state machine
+"""
+
+import heapq
+import socket
+import struct
+from collections import Counter
+from operator import attrgetter
+
+from spill import SpillTable, write_json_object
+
+PROTO_NUMBERS = {'ICMP': 1, 'TCP': 6, 'UDP': 17}
+PROTO_NAMES = {number: name for name, number in PROTO_NUMBERS.items()}
+
+# TCP connection states (non-TCP flows stay NEW)
+STATE_NEW = 0
+STATE_SYN_SENT = 1
+STATE_SYN_RECEIVED = 2
+STATE_ESTABLISHED = 3
+STATE_CLOSING = 4
+STATE_CLOSED = 5
+STATE_RESET = 6
+STATE_NAMES = ('new', 'syn_sent', 'syn_received', 'established', 'closing', 'closed', 'reset')
+
+TCP_FLAG_LETTERS = 'FSRPAUEC'
+
+# The TCP state machine runs over extended states (state | FIN seen A->B |
+# FIN seen B->A). A record holds the transition map of all its packets,
+# interned as an index into _MAPS, so two records of one flow built
+# separately (spilled runs) compose to the state a single record would have.
+_FIN_AB = 8
+_FIN_BA = 16
+_EXTENDED_STATES = 32
+_STATE_FLAGS = 0x17  # FIN, SYN, RST, ACK - the bits the state machine reads
+
+_MAPS = [bytes(range(_EXTENDED_STATES))]
+_MAP_INDEX = {_MAPS[0]: 0}
+_STEPS = {}
+_COMPOSED = {}
+
+
+def ip_to_int(ip):
+    return struct.unpack('!I', socket.inet_aton(ip))[0]
+
+
+def int_to_ip(value):
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+def flow_key(proto, src, sport, dst, dport):
+    """Packed direction-independent key and whether src is side A
+
+    proto is an IP protocol number and src/dst are 32-bit addresses. Side A
+    is the lower (address, port) endpoint: proto << 96 | A << 64 | port A << 48
+    | B << 16 | port B.
+    """
+    if (src, sport) <= (dst, dport):
+        return (proto << 96) | (src << 64) | (sport << 48) | (dst << 16) | dport, True
+    return (proto << 96) | (dst << 64) | (dport << 48) | (src << 16) | sport, False
+
+
+def unpack_flow_key(key):
+    """(proto, ip_a, port_a, ip_b, port_b) with integer addresses"""
+    return (key >> 96, (key >> 64) & 0xffffffff, (key >> 48) & 0xffff, (key >> 16) & 0xffffffff, key & 0xffff)
+
+
+def flow_endpoints(key, initiator_is_a=True):
+    """(proto name, client ip, client port, server ip, server port) - initiator first"""
+    proto, ip_a, port_a, ip_b, port_b = unpack_flow_key(key)
+    name = PROTO_NAMES.get(proto, str(proto))
+    if initiator_is_a:
+        return name, int_to_ip(ip_a), port_a, int_to_ip(ip_b), port_b
+    return name, int_to_ip(ip_b), port_b, int_to_ip(ip_a), port_a
+
+
+def flow_label(key, initiator_is_a=True):
+    proto, src, sport, dst, dport = flow_endpoints(key, initiator_is_a)
+    return f"{proto} {src}:{sport} <-> {dst}:{dport}"
+
+
+def flag_string(bits):
+    return ''.join(letter for index, letter in enumerate(TCP_FLAG_LETTERS) if bits & (1 << index))
+
+
+def _tcp_state(state, flags, other_fin):
+    """Next TCP state after a packet; other_fin: the other direction has sent a FIN"""
+    if flags & 0x04:
+        state = STATE_RESET
+    elif flags & 0x12 == 0x02:
+        if state in (STATE_NEW, STATE_CLOSED, STATE_RESET):
+            state = STATE_SYN_SENT
+    elif flags & 0x12 == 0x12:
+        if state in (STATE_NEW, STATE_SYN_SENT):
+            state = STATE_SYN_RECEIVED
+    elif flags & 0x10 and state in (STATE_NEW, STATE_SYN_RECEIVED):
+        state = STATE_ESTABLISHED
+
+    if flags & 0x01 and state != STATE_RESET:
+        state = STATE_CLOSED if other_fin else STATE_CLOSING
+    return state
+
+
+def _intern(transitions):
+    index = _MAP_INDEX.get(transitions)
+    if index is None:
+        index = _MAP_INDEX[transitions] = len(_MAPS)
+        _MAPS.append(transitions)
+    return index
+
+
+def _packet_table(forward, flags):
+    """bytes.translate() table of one packet over the extended states"""
+    table = bytearray(range(256))
+    own, other = (_FIN_AB, _FIN_BA) if forward else (_FIN_BA, _FIN_AB)
+    for extended in range(_EXTENDED_STATES):
+        fins = extended & (_FIN_AB | _FIN_BA)
+        if flags & 0x01:
+            fins |= own
+        table[extended] = _tcp_state(extended & 7, flags, extended & other) | fins
+    return bytes(table)
+
+
+def _step(index, forward, flags):
+    """Transition map index after one more packet"""
+    key = (index << 6) | (bool(forward) << 5) | (flags & _STATE_FLAGS)
+    result = _STEPS.get(key)
+    if result is None:
+        result = _STEPS[key] = _intern(_MAPS[index].translate(_packet_table(forward, flags & _STATE_FLAGS)))
+    return result
+
+
+def _compose(first, then):
+    """Transition map index of the packets of `first` followed by those of `then`"""
+    result = _COMPOSED.get((first, then))
+    if result is None:
+        table = _MAPS[then] + bytes(range(_EXTENDED_STATES, 256))
+        result = _COMPOSED[(first, then)] = _intern(_MAPS[first].translate(table))
+    return result
+
+
+class FlowRecord:
+    """
+    Both directions of one flow; _ab counters are side A -> side B of the key
+
+    merge() folds in a later record of the same flow and encode()/decode()
+    round-trip every field as text, so a flow split across spilled runs
+    (spill.SpillTable) merges back into the record one table would hold.
+    """
+    __slots__ = ('first_seen', 'last_seen', 'packets_ab', 'bytes_ab', 'packets_ba', 'bytes_ba',
+                 'flags_ab', 'flags_ba', 'syn', 'synack', 'rst', 'fin', 'transitions', 'initiator_is_a')
+
+    def __init__(self, ts, forward, flags=0):
+        self.first_seen = self.last_seen = ts
+        self.packets_ab = self.bytes_ab = self.packets_ba = self.bytes_ba = 0
+        self.flags_ab = self.flags_ba = 0
+        self.syn = self.synack = self.rst = self.fin = 0
+        self.transitions = 0
+        # A SYN-ACK as the first packet means the capture missed the client's SYN
+        self.initiator_is_a = forward if flags & 0x12 != 0x12 else not forward
+
+    def update(self, ts, forward, size, flags=0):
+        self.last_seen = ts
+        if forward:
+            self.packets_ab += 1
+            self.bytes_ab += size
+            self.flags_ab |= flags
+        else:
+            self.packets_ba += 1
+            self.bytes_ba += size
+            self.flags_ba |= flags
+        if not flags:
+            return
+
+        if flags & 0x04:
+            self.rst += 1
+        elif flags & 0x12 == 0x02:
+            self.syn += 1
+        elif flags & 0x12 == 0x12:
+            self.synack += 1
+        if flags & 0x01:
+            self.fin += 1
+        self.transitions = _step(self.transitions, forward, flags)
+
+    @property
+    def state(self):
+        """TCP state (STATE_*) reached from STATE_NEW"""
+        return _MAPS[self.transitions][0] & 7
+
+    def merge(self, later):
+        """Fold in a record of the same flow that began after this one; returns self"""
+        self.first_seen = min(self.first_seen, later.first_seen)
+        self.last_seen = max(self.last_seen, later.last_seen)
+        self.packets_ab += later.packets_ab
+        self.bytes_ab += later.bytes_ab
+        self.packets_ba += later.packets_ba
+        self.bytes_ba += later.bytes_ba
+        self.flags_ab |= later.flags_ab
+        self.flags_ba |= later.flags_ba
+        self.syn += later.syn
+        self.synack += later.synack
+        self.rst += later.rst
+        self.fin += later.fin
+        self.transitions = _compose(self.transitions, later.transitions)
+        return self
+
+    def encode(self):
+        """Fields as strings (the transition map as hex, timestamps with repr)"""
+        return [repr(self.first_seen), repr(self.last_seen), str(self.packets_ab), str(self.bytes_ab),
+                str(self.packets_ba), str(self.bytes_ba), str(self.flags_ab), str(self.flags_ba),
+                str(self.syn), str(self.synack), str(self.rst), str(self.fin),
+                _MAPS[self.transitions].hex(), str(int(self.initiator_is_a))]
+
+    @classmethod
+    def decode(cls, values):
+        record = cls.__new__(cls)
+        record.first_seen, record.last_seen = float(values[0]), float(values[1])
+        (record.packets_ab, record.bytes_ab, record.packets_ba, record.bytes_ba, record.flags_ab,
+         record.flags_ba, record.syn, record.synack, record.rst, record.fin) = map(int, values[2:12])
+        record.transitions = _intern(bytes.fromhex(values[12]))
+        record.initiator_is_a = values[13] == '1'
+        return record
+
+    @property
+    def packets(self):
+        return self.packets_ab + self.packets_ba
+
+    @property
+    def bytes(self):
+        return self.bytes_ab + self.bytes_ba
+
+    def summary(self, key):
+        """Report/export row oriented initiator -> responder"""
+        proto, src, sport, dst, dport = flow_endpoints(key, self.initiator_is_a)
+        if self.initiator_is_a:
+            fwd = (self.packets_ab, self.bytes_ab, self.flags_ab)
+            rev = (self.packets_ba, self.bytes_ba, self.flags_ba)
+        else:
+            fwd = (self.packets_ba, self.bytes_ba, self.flags_ba)
+            rev = (self.packets_ab, self.bytes_ab, self.flags_ab)
+        row = {
+            'proto': proto, 'src': src, 'sport': sport, 'dst': dst, 'dport': dport,
+            'packets': self.packets, 'bytes': self.bytes,
+            'packets_fwd': fwd[0], 'bytes_fwd': fwd[1], 'packets_rev': rev[0], 'bytes_rev': rev[1],
+            'first_seen': self.first_seen, 'last_seen': self.last_seen
+        }
+        if proto == 'TCP':
+            row.update(state=STATE_NAMES[self.state], flags_fwd=flag_string(fwd[2]), flags_rev=flag_string(rev[2]))
+        return row
+
+
+class FlowTable:
+    """
+    Exact flow table: packed key -> FlowRecord
+
+    update() accounts one packet and returns (record, is_new_flow). Reading
+    follows the conversation-table interface used by the report sections
+    (items(), most_common(), len()).
+
+    With max_rows the records live in a spill.SpillTable: past max_rows they
+    are written to sorted runs on disk and reading merges every segment of a
+    flow back into one record, so all results match the in-memory table.
+    A flow that returns after its record spilled starts a new segment and
+    update() reports it as new again; resumed() lists those segments.
+    """
+
+    def __init__(self, max_rows=None, tmpdir=None):
+        if max_rows:
+            self.flows = SpillTable(max_rows, rank=attrgetter('packets'), tmpdir=tmpdir, codec=FlowRecord)
+        else:
+            self.flows = {}
+
+    def update(self, ts, proto, src, sport, dst, dport, size, flags=0):
+        key, forward = flow_key(proto, src, sport, dst, dport)
+        record = self.flows.get(key)
+        new = record is None
+        if new:
+            record = self.flows[key] = FlowRecord(ts, forward, flags)
+        record.update(ts, forward, size, flags)
+        return record, new
+
+    def __len__(self):
+        return len(self.flows)
+
+    def __contains__(self, key):
+        """Membership among records held in memory"""
+        return key in self.flows
+
+    def get(self, key, default=None):
+        return self.flows.get(key, default)
+
+    def items(self):
+        return self.flows.items()
+
+    def most_common(self, n=None):
+        """Top flows by packets (both directions), ties in first-seen order"""
+        if self.spilled:
+            return self.flows.most_common(n)
+        if n is None:
+            return sorted(self.flows.items(), key=lambda kv: kv[1].packets, reverse=True)
+        return heapq.nlargest(n, self.flows.items(), key=lambda kv: kv[1].packets)
+
+    def state_counts(self):
+        """TCP flows per connection state"""
+        return Counter(STATE_NAMES[record.state] for key, record in self.flows.items()
+                       if key >> 96 == PROTO_NUMBERS['TCP'])
+
+    @property
+    def spilled(self):
+        return isinstance(self.flows, SpillTable) and self.flows.spilled
+
+    @property
+    def runs(self):
+        return self.flows.runs if isinstance(self.flows, SpillTable) else []
+
+    def resumed(self):
+        """(key, record) of each later segment of a flow that spilled and came back"""
+        return self.flows.resumed() if self.spilled else iter(())
+
+    def write_json(self, f, indent=2, level=1, transform=None):
+        """Stream the records as a JSON object (see spill.write_json_object())"""
+        write_json_object(f, self.items(), indent, level, transform)
+
+    def close(self):
+        """Remove spilled runs"""
+        if isinstance(self.flows, SpillTable):
+            self.flows.close()
+
+
+if __name__ == '__main__':
+    print("Flow Table Module")
+    print("Import this module into pcap_analyzer_v3.py")
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+ICMP Error Attribution Module
+Maps ICMP unreachable / time-exceeded messages back to the original flow
+through the IP and L4 header they quote: per-flow PMTU problems, blocked
+destination ports and TTL expiry patterns (routing loops vs traceroute)
+"""
+
+from collections import Counter
+
+from sketches import DistinctCounter
+
+ICMP_ERROR_KINDS = {
+    (3, 0): 'net_unreachable',
+    (3, 1): 'host_unreachable',
+    (3, 2): 'protocol_unreachable',
+    (3, 3): 'port_unreachable',
+    (3, 4): 'frag_needed',
+    (3, 9): 'admin_prohibited',
+    (3, 10): 'admin_prohibited',
+    (3, 13): 'admin_prohibited',
+    (11, 0): 'ttl_exceeded',
+    (11, 1): 'reassembly_timeout'
+}
+
+BLOCKING_KINDS = ('port_unreachable', 'protocol_unreachable', 'admin_prohibited')
+
+# A flow getting this many TTL-exceeded messages from at most LOOP_REPORTERS
+# routers is looping; many routers answering one destination is a traceroute
+LOOP_MIN_MESSAGES = 3
+LOOP_REPORTERS = 2
+TRACEROUTE_REPORTERS = 3
+
+# Bound on flows and destination ports tracked (further ones are only counted)
+MAX_ICMP_FLOWS = 50000
+
+
+def error_kind(icmp_type, code):
+    return ICMP_ERROR_KINDS.get((icmp_type, code), f"type{icmp_type}_code{code}")
+
+
+class FlowErrors:
+    """ICMP errors attributed to one original flow"""
+    __slots__ = ('first_seen', 'last_seen', 'kinds', 'reporters', 'mtu', 'size', 'ttls')
+
+    def __init__(self, ts):
+        self.first_seen = self.last_seen = ts
+        self.kinds = Counter()
+        self.reporters = DistinctCounter()
+        self.mtu = None
+        self.size = 0
+        self.ttls = set()
+
+
+class IcmpErrorTracker:
+    """
+    Streaming attribution fed by observe() for every ICMP error carrying a
+    quoted header
+
+    flow is the quoted (proto, src, sport, dst, dport) of the packet that
+    triggered the error, i.e. the original sender's view. Per flow it keeps
+    the error kinds, the reporting routers/hosts, the smallest next-hop MTU
+    and the largest quoted packet; per (proto, dst, dport) it counts blocking
+    errors and distinct blocked sources.
+    """
+
+    def __init__(self, max_flows=MAX_ICMP_FLOWS):
+        self.max_flows = max_flows
+        self.flows = {}
+        self.ports = {}
+        self.kinds = Counter()
+        self.untracked = 0
+
+    def observe(self, ts, reporter, icmp_type, code, flow, quoted_len=0, quoted_ttl=None, mtu=0):
+        kind = error_kind(icmp_type, code)
+        self.kinds[kind] += 1
+
+        state = self.flows.get(flow)
+        if state is None:
+            if len(self.flows) >= self.max_flows:
+                self.untracked += 1
+                return
+            state = self.flows[flow] = FlowErrors(ts)
+        state.last_seen = ts
+        state.kinds[kind] += 1
+        state.reporters.add(reporter)
+        state.size = max(state.size, quoted_len)
+        if quoted_ttl is not None and len(state.ttls) < 32:
+            state.ttls.add(quoted_ttl)
+        if kind == 'frag_needed' and mtu:
+            state.mtu = mtu if state.mtu is None else min(state.mtu, mtu)
+
+        if kind in BLOCKING_KINDS:
+            proto, src, _, dst, dport = flow
+            service = (proto, dst, dport)
+            blocked = self.ports.get(service)
+            if blocked is None:
+                if len(self.ports) >= self.max_flows:
+                    return
+                blocked = self.ports[service] = {'kinds': Counter(), 'sources': DistinctCounter(),
+                                                 'reporters': DistinctCounter()}
+            blocked['kinds'][kind] += 1
+            blocked['sources'].add(src)
+            blocked['reporters'].add(reporter)
+
+    def pmtu_problems(self):
+        """Flows told to fragment: smallest next-hop MTU vs largest packet sent"""
+        rows = []
+        for flow, state in self.flows.items():
+            count = state.kinds['frag_needed']
+            if count:
+                rows.append({'flow': flow, 'messages': count, 'mtu': state.mtu, 'size': state.size,
+                             'repeated': count > 1, 'reporters': len(state.reporters),
+                             'duration': state.last_seen - state.first_seen})
+        return sorted(rows, key=lambda r: r['messages'], reverse=True)
+
+    def blocked_ports(self):
+        """Destination services answered with port unreachable / prohibited"""
+        rows = [{'proto': proto, 'dst': dst, 'dport': dport, 'messages': sum(b['kinds'].values()),
+                 'kinds': dict(b['kinds']), 'sources': len(b['sources']), 'reporters': len(b['reporters'])}
+                for (proto, dst, dport), b in self.ports.items()]
+        return sorted(rows, key=lambda r: r['messages'], reverse=True)
+
+    def ttl_patterns(self):
+        """TTL-exceeded flows grouped by destination, classified as loop or traceroute"""
+        destinations = {}
+        for flow, state in self.flows.items():
+            count = state.kinds['ttl_exceeded']
+            if not count:
+                continue
+            dst = flow[3]
+            entry = destinations.setdefault(dst, {'dst': dst, 'messages': 0, 'flows': 0, 'looping_flows': 0,
+                                                  'reporters': DistinctCounter(), 'ttls': set()})
+            entry['messages'] += count
+            entry['flows'] += 1
+            entry['reporters'].merge(state.reporters)
+            entry['ttls'] |= state.ttls
+            if count >= LOOP_MIN_MESSAGES and len(state.reporters) <= LOOP_REPORTERS:
+                entry['looping_flows'] += 1
+
+        rows = []
+        for entry in destinations.values():
+            reporters = len(entry['reporters'])
+            if entry['looping_flows']:
+                pattern = 'routing_loop'
+            elif reporters >= TRACEROUTE_REPORTERS and entry['flows'] >= TRACEROUTE_REPORTERS:
+                pattern = 'traceroute'
+            else:
+                pattern = 'ttl_too_small'
+            rows.append(dict(entry, reporters=reporters, ttls=sorted(entry['ttls']), pattern=pattern))
+        return sorted(rows, key=lambda r: r['messages'], reverse=True)
+
+    def report(self):
+        return {
+            'messages': dict(self.kinds),
+            'flows': len(self.flows),
+            'untracked': self.untracked,
+            'pmtu': self.pmtu_problems(),
+            'blocked_ports': self.blocked_ports(),
+            'ttl': self.ttl_patterns()
+        }
+
+
+def format_flow(flow):
+    proto, src, sport, dst, dport = flow
+    if proto in ('TCP', 'UDP'):
+        return f"{proto} {src}:{sport} -> {dst}:{dport}"
+    return f"{proto} {src} -> {dst}"
+
+
+def print_icmp_attribution(report, limit=10):
+    """Print ICMP errors attributed to their original flows"""
+    if not report['messages']:
+        return
+
+    print(f"\n  📍 ICMP errors by quoted flow ({sum(report['messages'].values()):,} messages, "
+          f"{report['flows']:,} flows):")
+    for kind, count in Counter(report['messages']).most_common():
+        print(f"    {kind.replace('_', ' '):<24} {count:>8,}")
+    if report['untracked']:
+        print(f"    ({report['untracked']:,} messages beyond the {MAX_ICMP_FLOWS:,}-flow limit not attributed)")
+
+    if report['pmtu']:
+        print(f"\n  📍 Path MTU problems ({len(report['pmtu'])} flow(s) told to fragment):")
+        for row in report['pmtu'][:limit]:
+            note = " - sender keeps sending oversized packets" if row['repeated'] else ""
+            mtu = row['mtu'] if row['mtu'] else '?'
+            print(f"    {format_flow(row['flow']):<55} next-hop MTU {mtu}, sent {row['size']} bytes, "
+                  f"{row['messages']} message(s){note}")
+
+    if report['blocked_ports']:
+        print(f"\n  📍 Blocked destination ports ({len(report['blocked_ports'])} services):")
+        for row in report['blocked_ports'][:limit]:
+            kinds = ', '.join(f"{k.replace('_', ' ')} {v}" for k, v in row['kinds'].items())
+            target = f"{row['dst']}:{row['dport']}" if row['proto'] in ('TCP', 'UDP') else row['dst']
+            print(f"    {row['proto']:<5} {target:<22} {row['messages']:>6,} msgs ({kinds}) "
+                  f"from {row['sources']} source(s), {row['reporters']} reporter(s)")
+
+    if report['ttl']:
+        print(f"\n  📍 TTL expiry patterns ({len(report['ttl'])} destinations):")
+        labels = {'routing_loop': '🔴 routing loop', 'traceroute': 'traceroute', 'ttl_too_small': 'TTL too small'}
+        for row in report['ttl'][:limit]:
+            ttls = ','.join(str(t) for t in row['ttls'][:8])
+            print(f"    {row['dst']:<18} {labels[row['pattern']]:<16} {row['messages']:>6,} msgs, "
+                  f"{row['flows']} flow(s), {row['reporters']} router(s), quoted TTL {ttls or '?'}")
+
+
+if __name__ == '__main__':
+    print("ICMP Error Attribution Module")
+    print("Import this module into pcap_analyzer_v3.py")
@@ -50,7 +50,8 @@ def install_dependencies():
         'matplotlib',
         'networkx',
         'ipwhois',
-        'requests'
+        'requests',
+        'numpy'
     ]
     
     try:
@@ -96,7 +97,21 @@ def copy_files(tools_dir):
     files = [
         'pcap_analyzer_v3.py',
         'aws_detection.py',
-        'security_analysis.py'
+        'security_analysis.py',
+        'sketches.py',
+        'flow_table.py',
+        'flow_db.py',
+        'spill.py',
+        'scan_detection.py',
+        'timeseries.py',
+        'anomaly_detection.py',
+        'icmp_errors.py',
+        'arp_analysis.py',
+        'flood_detection.py',
+        'signatures.py',
+        'beaconing.py',
+        'dns_analysis.py',
+        'clustering.py'
     ]
     
     script_dir = Path(__file__).parent
@@ -48,7 +48,7 @@ echo "✓ tcpdump found"
 echo ""
 echo "📦 Installing Python dependencies..."
 $PYTHON -m pip install --quiet --upgrade pip
-$PYTHON -m pip install --quiet scapy matplotlib networkx ipwhois requests pillow
+$PYTHON -m pip install --quiet scapy matplotlib networkx ipwhois requests pillow numpy
 
 echo "✓ Python packages installed"
 
@@ -62,6 +62,9 @@ echo ""
 echo "📄 Installing analyzer script..."
 if [ -f "pcap_analyzer_v3.py" ]; then
     cp pcap_analyzer_v3.py ~/.pcap_tools/
+    for module in aws_detection.py security_analysis.py sketches.py flow_table.py flow_db.py spill.py scan_detection.py timeseries.py anomaly_detection.py icmp_errors.py arp_analysis.py flood_detection.py signatures.py beaconing.py dns_analysis.py clustering.py; do
+        [ -f "$module" ] && cp "$module" ~/.pcap_tools/
+    done
     echo "✓ Analyzer installed to ~/.pcap_tools/"
 else
     echo "⚠️  pcap_analyzer_v3.py not found in current directory"
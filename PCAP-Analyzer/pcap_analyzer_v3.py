@@ -9,19 +9,42 @@ Features: Protocol analysis, payload extraction, conversation tracking, statisti
 import subprocess
 import sys
 import re
+import heapq
 import json
 import argparse
 import os
+import random
+import sqlite3
+import struct
+import time
+import zlib
+from bisect import bisect_right
 from collections import Counter, defaultdict
 from datetime import datetime
 from pathlib import Path
+from stat import S_ISREG
+
+from anomaly_detection import SERIES_LABELS, detect_anomalies
+from arp_analysis import ArpTracker, print_arp_analysis
+from beaconing import ConnectionStarts, detect_beacons, print_beacons
+from clustering import cluster_sources, print_source_clusters
+from dns_analysis import DnsTracker, print_dns_threats
+from flow_db import CANNED_QUERIES, FlowDatabase, canned_sql, content_fingerprint, print_rows
+from flow_table import (PROTO_NUMBERS, FlowRecord, FlowTable, flow_endpoints, flow_key, flow_label,
+                        int_to_ip, ip_to_int, unpack_flow_key)
+from icmp_errors import IcmpErrorTracker, print_icmp_attribution
+from scan_detection import ScanDetector, print_scan_analysis
+from sketches import DistinctCounter, SpaceSaving, SpaceSavingTable
+from spill import ROW_BYTES, SpillTable, parse_size
+from timeseries import (NUMPY_AVAILABLE, PROTO_CODES, FLAG_SYN, FLAG_RST, FLAG_FIN, FLAG_NEW_FLOW, FLAG_TCP_ISSUE,
+                        FLAG_ICMP_UNREACH, BucketCounters, PacketColumns, write_buckets_csv, write_buckets_npz)
 
 # Set output directory to Desktop
 OUTPUT_DIR = Path.home() / "Desktop" / "pcap_analysis_output"
 OUTPUT_DIR.mkdir(exist_ok=True)
 
 try:
-    from scapy.all import rdpcap, IP, TCP, UDP, ICMP, DNS, Raw, ARP
+    from scapy.all import RawPcapReader, conf, Ether, IP, TCP, UDP, ICMP, DNS, Raw, ARP, IPerror, TCPerror, UDPerror
     SCAPY_AVAILABLE = True
 except ImportError:
     SCAPY_AVAILABLE = False
@@ -50,9 +73,44 @@ try:
 except ImportError:
     REQUESTS_AVAILABLE = False
 
+def capture_files(pcap_file):
+    """A capture argument (one path or a list of paths) as a list of paths"""
+    return list(pcap_file) if isinstance(pcap_file, (list, tuple)) else [pcap_file]
+
+def capture_name(pcap_file):
+    return ', '.join(Path(f).name for f in capture_files(pcap_file))
+
+def capture_stem(pcap_file):
+    """Base name for output files; merged inputs are named after the first one"""
+    files = capture_files(pcap_file)
+    stem = Path(files[0]).stem
+    return stem if len(files) == 1 else f"{stem}_merged{len(files)}"
+
 def run_tcpdump(pcap_file, filter_expr='', count=None):
-    """Run tcpdump and return output lines"""
+    """Run tcpdump and return output lines (several captures: merged by timestamp)
+    
+    Several captures are read with -tt and merged on the epoch timestamps, so
+    the order holds across midnight and dates; the merged lines then get
+    tcpdump's usual HH:MM:SS.ffffff prefix back.
+    """
+    files = capture_files(pcap_file)
+    if len(files) > 1:
+        outputs = [_epoch_lines(_tcpdump_lines(f, filter_expr, count, epoch=True)) for f in files]
+        lines = []
+        for epoch, line in heapq.merge(*outputs, key=lambda item: item[0]):
+            prefix, _, rest = line.partition(' ')
+            if rest and prefix.replace('.', '', 1).isdigit():
+                line = f"{datetime.fromtimestamp(float(prefix)).strftime('%H:%M:%S.%f')} {rest}"
+            lines.append(line)
+            if count and len(lines) >= count:
+                break
+        return lines
+    return _tcpdump_lines(files[0], filter_expr, count)
+
+def _tcpdump_lines(pcap_file, filter_expr='', count=None, epoch=False):
     cmd = ['tcpdump', '-r', pcap_file, '-nn']
+    if epoch:
+        cmd.append('-tt')
     if count:
         cmd.extend(['-c', str(count)])
     if filter_expr:
@@ -63,21 +121,197 @@ def run_tcpdump(pcap_file, filter_expr='', count=None):
              if line.strip() and not line.startswith('reading from file') and 'link-type' not in line]
     return lines
 
-def analyze_with_scapy(pcap_file):
-    """Deep packet analysis using Scapy"""
-    if not SCAPY_AVAILABLE:
+def _epoch_lines(lines):
+    """(epoch, line) pairs; lines without a timestamp sort with the line before them"""
+    epoch = 0.0
+    for line in lines:
+        try:
+            epoch = float(line.split(' ', 1)[0])
+        except ValueError:
+            pass
+        yield epoch, line
+
+# Tunnel encapsulations decapsulated during the Scapy pass (UDP dport -> name)
+TUNNEL_PORTS = {4789: 'VXLAN', 6081: 'Geneve'}
+
+# AWS Gateway Load Balancer Geneve option class and TLV types
+GWLB_OPTION_CLASS = 0x0108
+GWLB_OPTION_TYPES = {1: 'vpc_endpoint', 2: 'attachment', 3: 'flow_cookie'}
+
+def decapsulate_tunnel(pkt):
+    """Strip VXLAN/Geneve encapsulation from a packet.
+
+    Returns (inner_packet, tunnel_info). tunnel_info is None for packets that
+    are not tunneled; otherwise it describes the outermost tunnel (type, VNI,
+    outer endpoints and any GWLB TLV options).
+    """
+    tunnel = None
+    for _ in range(2):  # Allow one level of nested encapsulation
+        if IP not in pkt or UDP not in pkt or pkt[UDP].dport not in TUNNEL_PORTS:
+            break
+        
+        tunnel_type = TUNNEL_PORTS[pkt[UDP].dport]
+        data = bytes(pkt[UDP].payload)
+        if len(data) < 8:
+            break
+        
+        vni = int.from_bytes(data[4:7], 'big')
+        gwlb = {}
+        if tunnel_type == 'VXLAN':
+            if not data[0] & 0x08:  # VNI-valid flag must be set
+                break
+            inner_cls, offset = Ether, 8
+        else:
+            if data[0] >> 6 != 0:  # Unknown Geneve version
+                break
+            offset = 8 + (data[0] & 0x3f) * 4
+            
+            # Walk TLV options (class, type, length in 4-byte words)
+            pos = 8
+            while pos + 4 <= offset:
+                opt_class = int.from_bytes(data[pos:pos + 2], 'big')
+                opt_type = data[pos + 2] & 0x7f
+                opt_len = (data[pos + 3] & 0x1f) * 4
+                value = data[pos + 4:pos + 4 + opt_len]
+                if opt_class == GWLB_OPTION_CLASS and opt_type in GWLB_OPTION_TYPES and value:
+                    gwlb[GWLB_OPTION_TYPES[opt_type]] = int.from_bytes(value, 'big')
+                pos += 4 + opt_len
+            
+            ether_type = int.from_bytes(data[2:4], 'big')
+            inner_cls = {0x6558: Ether, 0x0800: IP}.get(ether_type)
+            if inner_cls is None:
+                break
+        
+        try:
+            inner = inner_cls(data[offset:])
+        except Exception:
+            break
+        
+        if tunnel is None:
+            tunnel = {
+                'type': tunnel_type,
+                'vni': vni,
+                'outer_src': pkt[IP].src,
+                'outer_dst': pkt[IP].dst,
+                'gwlb': gwlb
+            }
+        pkt = inner
+    
+    return pkt, tunnel
+
+# Unanswered SYNs remembered for handshake latency (bounds memory on SYN floods)
+MAX_PENDING_SYNS = 100000
+
+ICMP_TYPE_NAMES = {0: 'echo_reply', 3: 'unreachable', 5: 'redirect', 8: 'echo_request', 11: 'time_exceeded'}
+
+def quoted_flow(pkt):
+    """Original flow quoted by an ICMP error: ((proto, src, sport, dst, dport), ip length, ttl)"""
+    if IPerror not in pkt:
         return None
+    quoted = pkt[IPerror]
+    if TCPerror in pkt:
+        proto, sport, dport = 'TCP', pkt[TCPerror].sport, pkt[TCPerror].dport
+    elif UDPerror in pkt:
+        proto, sport, dport = 'UDP', pkt[UDPerror].sport, pkt[UDPerror].dport
+    else:
+        proto, sport, dport = {1: 'ICMP'}.get(quoted.proto, str(quoted.proto)), 0, 0
+    return (proto, quoted.src, sport, quoted.dst, dport), quoted.len, quoted.ttl
+
+# Frame size classes for the bandwidth histogram (Wireshark "Packet Lengths" buckets)
+SIZE_CLASS_EDGES = [20, 40, 80, 160, 320, 640, 1280, 2560]
+SIZE_CLASS_LABELS = ['0-19', '20-39', '40-79', '80-159', '160-319', '320-639', '640-1279', '1280-2559', '2560+']
+BANDWIDTH_SUBNET_BITS = 24
+
+# Row fields of the bounded bandwidth tables (--sketch / --max-memory), ranked by total bytes
+BANDWIDTH_FIELDS = ('packets_out', 'bytes_out', 'packets_in', 'bytes_in', 'bytes')
+BANDWIDTH_TABLES = ('ips', 'subnets', 'pairs')
+
+def new_bandwidth_stats(sketch=None, max_rows=None):
+    """Byte/packet accumulators keyed by 32-bit addresses.
+    
+    ips/subnets rows: [packets sent, bytes sent, packets received, bytes received]
+    pairs rows (key low_ip << 32 | high_ip): [packets low->high, bytes, packets high->low, bytes]
+    
+    The tables are exact dicts by default. With sketch (dict(capacity=,
+    precision=)) they are SpaceSavingTables and with max_rows SpillTables,
+    both holding BANDWIDTH_FIELDS rows ranked by bytes, so a
+    spoofed-source flood cannot grow them without bound.
+    """
+    if sketch:
+        tables = {name: SpaceSavingTable(sketch['capacity'], sketch['precision'], BANDWIDTH_FIELDS, 'bytes')
+                  for name in BANDWIDTH_TABLES}
+    elif max_rows:
+        tables = {name: SpillTable(max_rows, BANDWIDTH_FIELDS, 'bytes') for name in BANDWIDTH_TABLES}
+    else:
+        tables = {name: {} for name in BANDWIDTH_TABLES}
+    return dict({
+        'packets': 0,
+        'bytes': 0,
+        'min_size': None,
+        'max_size': 0,
+        'size_classes': [[0, 0] for _ in SIZE_CLASS_LABELS]
+    }, **tables)
+
+def _account_bandwidth_row(table, key, offset, size):
+    """Add a frame to one row: offset 0 counts sent (low->high), 2 received (high->low)"""
+    if isinstance(table, dict):
+        row = table.get(key)
+        if row is None:
+            row = table[key] = [0, 0, 0, 0]
+        row[offset] += 1
+        row[offset + 1] += size
+        return
+    row = table[key]
+    row[BANDWIDTH_FIELDS[offset]] += 1
+    row[BANDWIDTH_FIELDS[offset + 1]] += size
+    row['bytes'] += size
+
+def account_bandwidth(bandwidth, size, src=None, dst=None):
+    """Add one frame of `size` wire bytes; src/dst are integer IPv4 addresses"""
+    bandwidth['packets'] += 1
+    bandwidth['bytes'] += size
+    if bandwidth['min_size'] is None or size < bandwidth['min_size']:
+        bandwidth['min_size'] = size
+    if size > bandwidth['max_size']:
+        bandwidth['max_size'] = size
+    size_class = bandwidth['size_classes'][bisect_right(SIZE_CLASS_EDGES, size)]
+    size_class[0] += 1
+    size_class[1] += size
+    if src is None:
+        return
     
-    print("\n" + "="*100)
-    print("SCAPY DEEP PACKET ANALYSIS")
-    print("="*100)
-    
-    packets = rdpcap(pcap_file)
+    shift = 32 - BANDWIDTH_SUBNET_BITS
+    for table, sender, receiver in ((bandwidth['ips'], src, dst),
+                                    (bandwidth['subnets'], src >> shift, dst >> shift)):
+        _account_bandwidth_row(table, sender, 0, size)
+        _account_bandwidth_row(table, receiver, 2, size)
     
+    if src <= dst:
+        _account_bandwidth_row(bandwidth['pairs'], (src << 32) | dst, 0, size)
+    else:
+        _account_bandwidth_row(bandwidth['pairs'], (dst << 32) | src, 2, size)
+
+def top_bandwidth(table, n=10):
+    """Largest rows of a bandwidth table by total bytes (both directions) as (int key, 4-value row)"""
+    if isinstance(table, dict):
+        return heapq.nlargest(n, table.items(), key=lambda item: item[1][1] + item[1][3])
+    return [(key, [row[field] for field in BANDWIDTH_FIELDS[:4]]) for key, row in table.most_common(n)]
+
+def new_scapy_analysis(sketch=None, max_memory=None, buckets=None):
+    """Create the empty aggregate tables filled by update_scapy_analysis()
+    
+    sketch: optional dict(capacity=, precision=) - bound the talker, port and
+    conversation tables with SpaceSaving + HyperLogLog sketches (sketches.py)
+    max_memory: optional byte budget for the conversation and bandwidth
+    tables (half for conversations, the rest shared by the bandwidth tables);
+    past it the tables spill sorted runs to disk and results stay exact (spill.py)
+    buckets: optional dict(interval=, top_hosts=) - count fixed-interval
+    buckets for export_buckets() during the pass (timeseries.BucketCounters)
+    """
     analysis = {
-        'total_packets': len(packets),
+        'total_packets': 0,
         'protocols': Counter(),
-        'conversations': defaultdict(lambda: {'packets': 0, 'bytes': 0}),
+        'conversations': FlowTable(),
         'src_ips': Counter(),
         'dst_ips': Counter(),
         'src_ports': Counter(),
@@ -87,121 +321,449 @@ def analyze_with_scapy(pcap_file):
         'http_responses': [],
         'dns_queries': [],
         'dns_responses': [],
-        'tcp_streams': defaultdict(list),
+        'dns': DnsTracker(),
         'payloads': [],
-        'timestamps': []
+        'timestamps': [],
+        'tcp_flags': Counter(),
+        'pending_syns': {},
+        'handshake_rtts': [],
+        'icmp_types': Counter(),
+        'icmp_errors': IcmpErrorTracker(),
+        'arp': ArpTracker(),
+        'scans': ScanDetector(),
+        'bandwidth': new_bandwidth_stats(),
+        'packet_columns': PacketColumns(),
+        'connection_starts': ConnectionStarts(),
+        'buckets': BucketCounters(**buckets) if buckets else None,
+        'tunnels': {
+            'packets': Counter(),
+            'by_vni': defaultdict(lambda: {'packets': 0, 'bytes': 0, 'inner_src_ips': Counter()}),
+            'endpoints': Counter(),
+            'gwlb_endpoints': Counter(),
+            'gwlb_attachments': Counter(),
+            'gwlb_flows': DistinctCounter()
+        }
     }
     
-    for pkt in packets:
-        # Protocol detection
+    if sketch:
+        capacity, precision = sketch['capacity'], sketch['precision']
+        for table in ('src_ips', 'dst_ips', 'src_ports', 'dst_ports'):
+            analysis[table] = SpaceSaving(capacity, precision)
+        analysis['conversations'] = SpaceSavingTable(capacity, precision)
+        analysis['bandwidth'] = new_bandwidth_stats(sketch=sketch)
+        analysis['sketch'] = dict(sketch)
+    elif max_memory:
+        rows = max(2, max_memory // ROW_BYTES)
+        analysis['conversations'] = FlowTable(max_rows=rows // 2)
+        analysis['bandwidth'] = new_bandwidth_stats(max_rows=max(1, rows // (2 * len(BANDWIDTH_TABLES))))
+        analysis['max_memory'] = max_memory
+    
+    # Per-packet columns grow with the capture, so bounded modes do not keep them
+    if per_packet_skipped(analysis):
+        analysis['packet_columns'] = analysis['connection_starts'] = None
+    
+    return analysis
+
+def per_packet_skipped(analysis):
+    """Why the per-packet columns (timeline anomalies, beaconing) are not kept, or None"""
+    if analysis.get('sketch'):
+        return "--sketch keeps only bounded tables"
+    if analysis.get('max_memory'):
+        return "--max-memory keeps only budgeted tables"
+    return None
+
+def track_flow(analysis, ts, proto, src, sport, dst, dport, size, flags=0):
+    """Account a packet to its canonical flow; True for the first packet of a flow
+    
+    The table is a FlowTable (spilling to disk under --max-memory, where a
+    flow that returns after its record spilled is reported as new again -
+    see resumed_udp_flows()); the bounded --sketch table holds packets/bytes
+    rows under the same packed key.
+    """
+    table = analysis['conversations']
+    if isinstance(table, FlowTable):
+        return table.update(ts, PROTO_NUMBERS[proto], src, sport, dst, dport, size, flags)[1]
+    key = flow_key(PROTO_NUMBERS[proto], src, sport, dst, dport)[0]
+    row = table[key]
+    row['packets'] += 1
+    row['bytes'] += size
+    return row['packets'] == 1
+
+def update_scapy_analysis(analysis, pkt, pkt_time):
+    """Fold one dissected packet into the aggregate tables"""
+    analysis['total_packets'] += 1
+    
+    # Wire size belongs to the outer frame
+    wire_len = len(pkt)
+    
+    # Tunnel decapsulation - every section below sees the inner packet
+    pkt, tunnel = decapsulate_tunnel(pkt)
+    if tunnel:
+        tunnels = analysis['tunnels']
+        tunnels['packets'][tunnel['type']] += 1
+        tunnels['endpoints'][f"{tunnel['outer_src']} -> {tunnel['outer_dst']}"] += 1
+        vni_stats = tunnels['by_vni'][f"{tunnel['type']} VNI {tunnel['vni']}"]
+        vni_stats['packets'] += 1
+        vni_stats['bytes'] += wire_len
         if IP in pkt:
-            analysis['protocols']['IP'] += 1
-            analysis['src_ips'][pkt[IP].src] += 1
-            analysis['dst_ips'][pkt[IP].dst] += 1
-            analysis['packet_sizes'].append(len(pkt))
+            vni_stats['inner_src_ips'][pkt[IP].src] += 1
+        
+        gwlb = tunnel['gwlb']
+        if 'vpc_endpoint' in gwlb:
+            tunnels['gwlb_endpoints'][f"vpce-{gwlb['vpc_endpoint']:017x}"] += 1
+        if 'attachment' in gwlb:
+            tunnels['gwlb_attachments'][f"{gwlb['attachment']:#018x}"] += 1
+        if 'flow_cookie' in gwlb:
+            tunnels['gwlb_flows'].add(gwlb['flow_cookie'])
+        analysis['protocols'][tunnel['type']] += 1
+    
+    # Exact bandwidth accounting on wire bytes (inner addresses for tunnels)
+    src_int = dst_int = 0
+    if IP in pkt:
+        src_int, dst_int = ip_to_int(pkt[IP].src), ip_to_int(pkt[IP].dst)
+        account_bandwidth(analysis['bandwidth'], wire_len, src_int, dst_int)
+    else:
+        account_bandwidth(analysis['bandwidth'], wire_len)
+    
+    # Per-packet time-series columns and bucket counters
+    series_proto, series_flags = PROTO_CODES['Other'], 0
+    
+    # Protocol detection
+    if IP in pkt:
+        analysis['protocols']['IP'] += 1
+        analysis['src_ips'][pkt[IP].src] += 1
+        analysis['dst_ips'][pkt[IP].dst] += 1
+        analysis['packet_sizes'].append(len(pkt))
+        
+        # Conversation tracking
+        if TCP in pkt:
+            analysis['protocols']['TCP'] += 1
+            analysis['src_ports'][pkt[TCP].sport] += 1
+            analysis['dst_ports'][pkt[TCP].dport] += 1
             
-            # Conversation tracking
-            if TCP in pkt:
-                analysis['protocols']['TCP'] += 1
-                analysis['src_ports'][pkt[TCP].sport] += 1
-                analysis['dst_ports'][pkt[TCP].dport] += 1
-                
-                conv_key = f"{pkt[IP].src}:{pkt[TCP].sport} <-> {pkt[IP].dst}:{pkt[TCP].dport}"
-                analysis['conversations'][conv_key]['packets'] += 1
-                analysis['conversations'][conv_key]['bytes'] += len(pkt)
-                
-                # TCP stream tracking
-                stream_key = f"{pkt[IP].src}:{pkt[TCP].sport}-{pkt[IP].dst}:{pkt[TCP].dport}"
-                analysis['tcp_streams'][stream_key].append(pkt)
-                
-                # HTTP detection
-                if Raw in pkt:
-                    payload = pkt[Raw].load
-                    try:
-                        payload_str = payload.decode('utf-8', errors='ignore')
-                        
-                        # HTTP Request
-                        if payload_str.startswith(('GET ', 'POST ', 'PUT ', 'DELETE ', 'HEAD ', 'OPTIONS ')):
-                            lines = payload_str.split('\r\n')
-                            analysis['http_requests'].append({
-                                'src': f"{pkt[IP].src}:{pkt[TCP].sport}",
-                                'dst': f"{pkt[IP].dst}:{pkt[TCP].dport}",
-                                'method': lines[0].split()[0] if lines else '',
-                                'uri': lines[0].split()[1] if len(lines[0].split()) > 1 else '',
-                                'headers': lines[1:10]
-                            })
-                        
-                        # HTTP Response
-                        if payload_str.startswith('HTTP/'):
-                            lines = payload_str.split('\r\n')
-                            status_match = re.search(r'HTTP/\d\.\d\s+(\d{3})', lines[0])
-                            analysis['http_responses'].append({
-                                'src': f"{pkt[IP].src}:{pkt[TCP].sport}",
-                                'dst': f"{pkt[IP].dst}:{pkt[TCP].dport}",
-                                'status': status_match.group(1) if status_match else 'Unknown',
-                                'headers': lines[1:10]
-                            })
-                        
-                        # Store payload samples
-                        if len(analysis['payloads']) < 50 and len(payload_str) > 20:
-                            analysis['payloads'].append({
-                                'src': f"{pkt[IP].src}",
-                                'dst': f"{pkt[IP].dst}",
-                                'protocol': 'TCP',
-                                'port': pkt[TCP].dport,
-                                'data': payload_str[:200]
-                            })
-                    except:
-                        pass
+            # Handshake tracking (SYN -> SYN-ACK latency)
+            flags = int(pkt[TCP].flags)
+            track_flow(analysis, pkt_time, 'TCP', src_int, pkt[TCP].sport, dst_int, pkt[TCP].dport, len(pkt), flags)
+            series_proto = PROTO_CODES['TCP']
+            if flags & 0x02 and not flags & 0x10:  # SYN
+                analysis['tcp_flags']['SYN'] += 1
+                series_flags |= FLAG_SYN
+                syn_key = (pkt[IP].src, pkt[TCP].sport, pkt[IP].dst, pkt[TCP].dport)
+                if syn_key in analysis['pending_syns']:
+                    series_flags |= FLAG_TCP_ISSUE  # SYN retransmission
+                else:
+                    series_flags |= FLAG_NEW_FLOW
+                    if analysis['connection_starts'] is not None:
+                        analysis['connection_starts'].append(pkt_time, src_int, dst_int, pkt[TCP].dport)
+                    if len(analysis['pending_syns']) < MAX_PENDING_SYNS:
+                        analysis['pending_syns'][syn_key] = pkt_time
+            elif flags & 0x12 == 0x12:  # SYN-ACK
+                analysis['tcp_flags']['SYN-ACK'] += 1
+                syn_time = analysis['pending_syns'].pop(
+                    (pkt[IP].dst, pkt[TCP].dport, pkt[IP].src, pkt[TCP].sport), None)
+                if syn_time is not None:
+                    analysis['handshake_rtts'].append((pkt_time - syn_time) * 1000)
+            if flags & 0x04:
+                analysis['tcp_flags']['RST'] += 1
+                series_flags |= FLAG_RST
+            if flags & 0x01:
+                analysis['tcp_flags']['FIN'] += 1
+                series_flags |= FLAG_FIN
+            if pkt[TCP].window == 0 and not flags & 0x06:  # Zero window
+                series_flags |= FLAG_TCP_ISSUE
+            analysis['scans'].observe(pkt_time, 'TCP', pkt[IP].src, pkt[IP].dst,
+                                      pkt[TCP].sport, pkt[TCP].dport, flags)
             
-            elif UDP in pkt:
-                analysis['protocols']['UDP'] += 1
-                analysis['src_ports'][pkt[UDP].sport] += 1
-                analysis['dst_ports'][pkt[UDP].dport] += 1
-                
-                conv_key = f"{pkt[IP].src}:{pkt[UDP].sport} <-> {pkt[IP].dst}:{pkt[UDP].dport}"
-                analysis['conversations'][conv_key]['packets'] += 1
-                analysis['conversations'][conv_key]['bytes'] += len(pkt)
-                
-                # DNS detection
-                if DNS in pkt:
-                    analysis['protocols']['DNS'] += 1
-                    if pkt[DNS].qr == 0:  # Query
-                        analysis['dns_queries'].append({
-                            'src': pkt[IP].src,
-                            'query': pkt[DNS].qd.qname.decode() if pkt[DNS].qd else 'Unknown'
+            # HTTP detection
+            if Raw in pkt:
+                payload = pkt[Raw].load
+                try:
+                    payload_str = payload.decode('utf-8', errors='ignore')
+                    
+                    # HTTP Request
+                    if payload_str.startswith(('GET ', 'POST ', 'PUT ', 'DELETE ', 'HEAD ', 'OPTIONS ')):
+                        lines = payload_str.split('\r\n')
+                        analysis['http_requests'].append({
+                            'src': f"{pkt[IP].src}:{pkt[TCP].sport}",
+                            'dst': f"{pkt[IP].dst}:{pkt[TCP].dport}",
+                            'method': lines[0].split()[0] if lines else '',
+                            'uri': lines[0].split()[1] if len(lines[0].split()) > 1 else '',
+                            'headers': lines[1:10]
                         })
-                    else:  # Response
-                        analysis['dns_responses'].append({
-                            'src': pkt[IP].src,
-                            'query': pkt[DNS].qd.qname.decode() if pkt[DNS].qd else 'Unknown',
-                            'answers': pkt[DNS].an.rdata if pkt[DNS].an else None
+                    
+                    # HTTP Response
+                    if payload_str.startswith('HTTP/'):
+                        lines = payload_str.split('\r\n')
+                        status_match = re.search(r'HTTP/\d\.\d\s+(\d{3})', lines[0])
+                        analysis['http_responses'].append({
+                            'src': f"{pkt[IP].src}:{pkt[TCP].sport}",
+                            'dst': f"{pkt[IP].dst}:{pkt[TCP].dport}",
+                            'status': status_match.group(1) if status_match else 'Unknown',
+                            'headers': lines[1:10]
                         })
-                
-                # UDP payload
-                if Raw in pkt and len(analysis['payloads']) < 50:
-                    try:
-                        payload_str = pkt[Raw].load.decode('utf-8', errors='ignore')
-                        if len(payload_str) > 20:
-                            analysis['payloads'].append({
-                                'src': f"{pkt[IP].src}",
-                                'dst': f"{pkt[IP].dst}",
-                                'protocol': 'UDP',
-                                'port': pkt[UDP].dport,
-                                'data': payload_str[:200]
-                            })
-                    except:
-                        pass
+                    
+                    # Store payload samples
+                    if len(analysis['payloads']) < 50 and len(payload_str) > 20:
+                        analysis['payloads'].append({
+                            'src': f"{pkt[IP].src}",
+                            'dst': f"{pkt[IP].dst}",
+                            'protocol': 'TCP',
+                            'port': pkt[TCP].dport,
+                            'data': payload_str[:200]
+                        })
+                except:
+                    pass
+        
+        elif UDP in pkt:
+            analysis['protocols']['UDP'] += 1
+            analysis['src_ports'][pkt[UDP].sport] += 1
+            analysis['dst_ports'][pkt[UDP].dport] += 1
             
-            elif ICMP in pkt:
-                analysis['protocols']['ICMP'] += 1
+            series_proto = PROTO_CODES['UDP']
+            if track_flow(analysis, pkt_time, 'UDP', src_int, pkt[UDP].sport, dst_int, pkt[UDP].dport, len(pkt)):
+                series_flags |= FLAG_NEW_FLOW
+                if analysis['connection_starts'] is not None:
+                    analysis['connection_starts'].append(pkt_time, src_int, dst_int, pkt[UDP].dport)
+            analysis['scans'].observe(pkt_time, 'UDP', pkt[IP].src, pkt[IP].dst, pkt[UDP].sport, pkt[UDP].dport)
+            
+            # DNS detection
+            if DNS in pkt:
+                analysis['protocols']['DNS'] += 1
+                if pkt[DNS].qr == 0:  # Query
+                    analysis['dns_queries'].append({
+                        'src': pkt[IP].src,
+                        'query': pkt[DNS].qd.qname.decode() if pkt[DNS].qd else 'Unknown'
+                    })
+                    if pkt[DNS].qd:
+                        analysis['dns'].observe(pkt[IP].src, pkt[DNS].qd.qname.decode(errors='replace'),
+                                                pkt[DNS].qd.qtype)
+                else:  # Response
+                    analysis['dns_responses'].append({
+                        'src': pkt[IP].src,
+                        'query': pkt[DNS].qd.qname.decode() if pkt[DNS].qd else 'Unknown',
+                        'answers': pkt[DNS].an.rdata if pkt[DNS].an else None
+                    })
+            
+            # UDP payload
+            if Raw in pkt and len(analysis['payloads']) < 50:
+                try:
+                    payload_str = pkt[Raw].load.decode('utf-8', errors='ignore')
+                    if len(payload_str) > 20:
+                        analysis['payloads'].append({
+                            'src': f"{pkt[IP].src}",
+                            'dst': f"{pkt[IP].dst}",
+                            'protocol': 'UDP',
+                            'port': pkt[UDP].dport,
+                            'data': payload_str[:200]
+                        })
+                except:
+                    pass
+        
+        elif ICMP in pkt:
+            analysis['protocols']['ICMP'] += 1
+            analysis['icmp_types'][ICMP_TYPE_NAMES.get(pkt[ICMP].type, 'other')] += 1
+            if pkt[ICMP].type == 3:
+                series_flags |= FLAG_ICMP_UNREACH
+            if pkt[ICMP].type in (3, 11):
+                quoted = quoted_flow(pkt)
+                if quoted:
+                    flow, length, ttl = quoted
+                    analysis['icmp_errors'].observe(pkt_time, pkt[IP].src, pkt[ICMP].type, pkt[ICMP].code,
+                                                    flow, length, ttl, pkt[ICMP].nexthopmtu)
+    
+    elif ARP in pkt:
+        analysis['protocols']['ARP'] += 1
+        arp = pkt[ARP]
+        analysis['arp'].observe(pkt_time, arp.op, pkt[Ether].src if Ether in pkt else None,
+                                arp.hwsrc, arp.psrc, arp.hwdst, arp.pdst)
+    
+    if ICMP in pkt and series_proto == PROTO_CODES['Other']:
+        series_proto = PROTO_CODES['ICMP']
+    if analysis['packet_columns'] is not None:
+        analysis['packet_columns'].append(pkt_time, wire_len, series_proto, series_flags, src_int, dst_int)
+    if analysis['buckets'] is not None:
+        analysis['buckets'].add(pkt_time, wire_len, series_proto, series_flags, src_int, dst_int)
+    
+    # Timestamp tracking
+    analysis['timestamps'].append(pkt_time)
+
+def iter_pcap_records(pcap_file):
+    """Stream (timestamp, linktype, frame bytes) records without dissecting them"""
+    with RawPcapReader(pcap_file) as reader:
+        for data, meta in reader:
+            if hasattr(meta, 'tsresol'):  # pcapng
+                ts = ((meta.tshigh << 32) + meta.tslow) / meta.tsresol
+                linktype = meta.linktype
+            else:
+                ts = meta.sec + meta.usec / (1e9 if reader.nano else 1e6)
+                linktype = reader.linktype
+            yield ts, linktype, data
+
+def iter_capture_records(pcap_file):
+    """Records of one capture, or of several merged lazily into one timeline.
+    
+    heapq.merge keeps one pending record per input, so k captures are
+    interleaved by timestamp in O(log k) per record without an intermediate
+    merged file (as mergecap would write).
+    """
+    files = capture_files(pcap_file)
+    if len(files) == 1:
+        return iter_pcap_records(files[0])
+    return heapq.merge(*(iter_pcap_records(f) for f in files), key=lambda record: record[0])
+
+def dissect_frame(linktype, data):
+    """Dissect a raw frame with the Scapy layer for its link type"""
+    return conf.l2types.num2layer.get(linktype, conf.raw_layer)(data)
+
+def ipv4_offset(linktype, data):
+    """Offset of the IPv4 header in a raw frame, or None for non-IPv4 frames"""
+    if linktype == 1:  # Ethernet (with optional 802.1Q / QinQ tags)
+        offset, ether_type = 14, data[12:14]
+        while ether_type in (b'\x81\x00', b'\x88\xa8') and len(data) >= offset + 4:
+            ether_type = data[offset + 2:offset + 4]
+            offset += 4
+        return offset if ether_type == b'\x08\x00' else None
+    if linktype in (101, 228):  # Raw IP / raw IPv4
+        return 0 if data[:1] and data[0] >> 4 == 4 else None
+    if linktype == 113:  # Linux cooked capture
+        return 16 if data[14:16] == b'\x08\x00' else None
+    return None
+
+def raw_flow_hash(linktype, data):
+    """Direction-independent hash of a raw frame's 5-tuple (None if not IPv4)
+
+    Parsed straight from the frame bytes so sampling never pays for a Scapy
+    dissection. For VXLAN/Geneve the outer UDP source port is derived from the
+    inner flow, so whole inner flows are kept together as well.
+    """
+    offset = ipv4_offset(linktype, data)
+    if offset is None or len(data) < offset + 20:
+        return None
+    
+    proto = data[offset + 9]
+    ihl = (data[offset] & 0x0f) * 4
+    src = data[offset + 12:offset + 16]
+    dst = data[offset + 16:offset + 20]
+    ports = data[offset + ihl:offset + ihl + 4] if proto in (6, 17) else b''
+    a = src + ports[:2]
+    b = dst + ports[2:4]
+    return zlib.crc32(min(a, b) + max(a, b) + bytes([proto]))
+
+SAMPLE_MODES = {
+    'packet': 'uniform 1-in-N packets',
+    'flow': 'flow-hash (whole flows)',
+    'time': 'time-slice'
+}
+
+def make_sampler(mode, rate, slice_seconds=1.0):
+    """Build a record filter keeping roughly 1-in-rate of the capture.
+
+    The returned callable takes (index, ts, linktype, data) and returns the
+    sampling cluster the record belongs to, or None when it is skipped.
+    Clusters (single packets, flows or time slices) drive the error bounds.
+    """
+    # Random (not every-Nth) selection so periodic traffic cannot alias with
+    # the sampling interval; seeded so repeated runs give identical output
+    rng = random.Random(0)
+    
+    if mode == 'packet':
+        return lambda index, ts, linktype, data: index if rng.random() * rate < 1 else None
+    
+    if mode == 'flow':
+        def flow_sampler(index, ts, linktype, data):
+            flow = raw_flow_hash(linktype, data)
+            if flow is None:  # Non-IP frames fall back to packet sampling
+                return ('pkt', index) if rng.random() * rate < 1 else None
+            return flow if flow % rate == 0 else None
+        return flow_sampler
+    
+    if mode == 'time':
+        def time_sampler(index, ts, linktype, data):
+            time_slice = int(ts // slice_seconds)
+            return time_slice if zlib.crc32(str(time_slice).encode()) % rate == 0 else None
+        return time_sampler
+    
+    raise ValueError(f"Unknown sample mode: {mode}")
+
+def new_sampling_stats(sample):
+    """Per-cluster totals used to scale sampled counts and bound their error"""
+    return {
+        'mode': sample['mode'],
+        'rate': sample['rate'],
+        'slice_seconds': sample.get('slice_seconds', 1.0),
+        'records_seen': 0,
+        'sumsq': Counter(),  # Packet mode: every packet is its own cluster
+        'clusters': defaultdict(Counter)
+    }
+
+def record_sample(sampling, cluster, pkt, size):
+    """Add a sampled packet's metrics to its cluster"""
+    metrics = {'Packets': 1, 'Bytes': size}
+    for layer in (TCP, UDP, ICMP, ARP):
+        if layer in pkt:
+            metrics[layer.__name__] = 1
+            break
+    
+    if sampling['mode'] == 'packet':
+        for metric, value in metrics.items():
+            sampling['sumsq'][metric] += value * value
+        sampling['clusters']['all'].update(metrics)
+    else:
+        sampling['clusters'][cluster].update(metrics)
+
+def sampling_estimates(sampling, z=1.96):
+    """Scale sampled totals to the full capture with confidence intervals.
+
+    Horvitz-Thompson estimate: total = sample_total / p. Variance of a
+    cluster sample is (1 - p) / p^2 * sum(cluster_total^2), which reduces to
+    the binomial bound for packet sampling. Returns {metric: (estimate, +/-)}.
+    """
+    p = 1.0 / sampling['rate']
+    totals = Counter()
+    sumsq = Counter(sampling['sumsq'])
+    for cluster_totals in sampling['clusters'].values():
+        totals.update(cluster_totals)
+        if sampling['mode'] != 'packet':
+            for metric, value in cluster_totals.items():
+                sumsq[metric] += value * value
+    
+    estimates = {}
+    for metric, total in totals.items():
+        variance = (1 - p) / (p * p) * sumsq[metric]
+        estimates[metric] = (total / p, z * variance ** 0.5)
+    return estimates
+
+def analyze_with_scapy(pcap_file, sample=None, sketch=None, max_memory=None, buckets=None):
+    """Deep packet analysis using Scapy
+    
+    sample: optional dict(mode=, rate=, slice_seconds=) - see make_sampler()
+    sketch, max_memory, buckets: bound table memory / count export buckets - see new_scapy_analysis()
+    """
+    if not SCAPY_AVAILABLE:
+        return None
+    
+    print("\n" + "="*100)
+    print("SCAPY DEEP PACKET ANALYSIS")
+    print("="*100)
+    
+    analysis = new_scapy_analysis(sketch, max_memory, buckets)
+    sampler = make_sampler(**sample) if sample else None
+    if sampler:
+        analysis['sampling'] = new_sampling_stats(sample)
+    
+    for index, (ts, linktype, data) in enumerate(iter_capture_records(pcap_file)):
+        # Sampling decision is made on the raw record - unsampled frames are never dissected
+        if sampler:
+            analysis['sampling']['records_seen'] += 1
+            cluster = sampler(index, ts, linktype, data)
+            if cluster is None:
+                continue
         
-        elif ARP in pkt:
-            analysis['protocols']['ARP'] += 1
+        pkt = dissect_frame(linktype, data)
+        update_scapy_analysis(analysis, pkt, ts)
         
-        # Timestamp tracking
-        if hasattr(pkt, 'time'):
-            analysis['timestamps'].append(float(pkt.time))
+        if sampler:
+            record_sample(analysis['sampling'], cluster, pkt, len(data))
     
     return analysis
 
@@ -210,6 +772,48 @@ def print_scapy_analysis(analysis):
     if not analysis:
         return
     
+    # Sampling estimates
+    sampling = analysis.get('sampling')
+    if sampling:
+        mode = SAMPLE_MODES[sampling['mode']]
+        if sampling['mode'] == 'time':
+            mode += f" ({sampling['slice_seconds']:g}s slices)"
+        print(f"\n📐 Sampled Analysis: {mode}, 1-in-{sampling['rate']}")
+        print(f"  Records read: {sampling['records_seen']:,} | Dissected: {analysis['total_packets']:,}")
+        print(f"  ℹ️  Counts below are raw sample counts; percentages estimate the full capture")
+        print(f"\n  Estimated capture totals (95% confidence):")
+        for metric, (estimate, margin) in sorted(sampling_estimates(sampling).items(),
+                                                 key=lambda x: x[1][0], reverse=True):
+            print(f"    {metric:<10} {estimate:>14,.0f}  ± {margin:,.0f}")
+    
+    # Sketch error bounds
+    if analysis.get('sketch'):
+        print(f"\n🧮 Sketch Mode: top-{analysis['sketch']['capacity']:,} SpaceSaving per table, "
+              f"HyperLogLog 2^{analysis['sketch']['precision']} registers")
+        print(f"  Unique counts: ±{analysis['src_ips'].distinct.relative_error*100:.1f}% (1 std. error)")
+        for table in ('src_ips', 'dst_ips', 'src_ports', 'dst_ports', 'conversations'):
+            error = analysis[table].max_error
+            if error:
+                print(f"  {table}: counts overestimate by at most {error:,.0f} packets")
+            else:
+                print(f"  {table}: exact (fewer keys than sketch capacity)")
+        for table in BANDWIDTH_TABLES:
+            error = analysis['bandwidth'][table].max_error
+            if error:
+                print(f"  bandwidth {table}: bytes overestimate by at most {format_bytes(error)}")
+    
+    # Spill-to-disk status
+    if analysis.get('max_memory'):
+        conversations = analysis['conversations']
+        if conversations.spilled:
+            print(f"\n💽 Conversation table exceeded the {analysis['max_memory'] / 2**20:,.0f} MB budget: "
+                  f"{len(conversations.runs)} sorted runs merged from disk (results are exact)")
+        else:
+            print(f"\n💽 Conversation table fit in the {analysis['max_memory'] / 2**20:,.0f} MB budget")
+        spilled = [table for table in BANDWIDTH_TABLES if analysis['bandwidth'][table].spilled]
+        if spilled:
+            print(f"  Bandwidth tables spilled to disk: {', '.join(spilled)} (results are exact)")
+    
     # Protocol Distribution
     print("\n📊 Protocol Distribution:")
     for proto, count in analysis['protocols'].most_common():
@@ -218,10 +822,18 @@ def print_scapy_analysis(analysis):
     
     # Top Conversations
     print("\n💬 Top 10 Conversations (by packet count):")
-    sorted_convs = sorted(analysis['conversations'].items(), key=lambda x: x[1]['packets'], reverse=True)
-    for conv, stats in sorted_convs[:10]:
+    for conv, stats in top_conversations(analysis['conversations'], 10):
         print(f"  {conv}")
-        print(f"    Packets: {stats['packets']:,} | Bytes: {stats['bytes']:,}")
+        if 'packets_fwd' in stats:
+            state = f" | {stats['state']}" if 'state' in stats else ""
+            print(f"    Packets: {stats['packets']:,} (→ {stats['packets_fwd']:,} / ← {stats['packets_rev']:,}) | "
+                  f"Bytes: {stats['bytes']:,} (→ {stats['bytes_fwd']:,} / ← {stats['bytes_rev']:,}){state}")
+        else:
+            print(f"    Packets: {stats['packets']:,} | Bytes: {stats['bytes']:,}")
+    if isinstance(analysis['conversations'], FlowTable):
+        states = analysis['conversations'].state_counts()
+        if states:
+            print(f"\n  TCP flow states: " + ', '.join(f"{state} {count:,}" for state, count in states.most_common()))
     
     # Top Talkers
     print("\n🔝 Top 10 Source IPs:")
@@ -301,6 +913,11 @@ def print_scapy_analysis(analysis):
             for pkt_idx, rate in bursts[:5]:
                 burst_time = analysis['timestamps'][pkt_idx]
                 print(f"    Packet {pkt_idx}: {rate:.0f} packets/sec at {datetime.fromtimestamp(burst_time).strftime('%H:%M:%S')}")
+        
+        if per_packet_skipped(analysis):
+            print(f"\n  ℹ️  Timeline anomalies skipped: {per_packet_skipped(analysis)}")
+        else:
+            print_anomalies(timeline_anomalies(analysis))
     
     # HTTP Analysis
     if analysis['http_requests']:
@@ -331,6 +948,7 @@ def print_scapy_analysis(analysis):
         print(f"\n🔍 DNS Queries ({len(analysis['dns_queries'])} total, showing first 10):")
         for query in analysis['dns_queries'][:10]:
             print(f"  {query['src']} -> {query['query']}")
+        print_dns_threats(analysis['dns'].report())
     
     # Payload Samples
     if analysis['payloads']:
@@ -351,7 +969,7 @@ def export_analysis(analysis, output_file):
     export_data = {
         'total_packets': analysis['total_packets'],
         'protocols': dict(analysis['protocols']),
-        'conversations': {k: v for k, v in analysis['conversations'].items()},
+        'conversations': analysis['conversations'],
         'top_src_ips': dict(analysis['src_ips'].most_common(20)),
         'top_dst_ips': dict(analysis['dst_ips'].most_common(20)),
         'top_src_ports': dict(analysis['src_ports'].most_common(20)),
@@ -359,6 +977,59 @@ def export_analysis(analysis, output_file):
         'http_requests': analysis['http_requests'],
         'http_responses': analysis['http_responses'],
         'dns_queries': analysis['dns_queries'][:100],
+        'dns_threats': analysis['dns'].report(),
+        'scans': analysis['scans'].scans()[:100],
+        'arp': analysis['arp'].report(),
+        'icmp_errors': {key: value[:100] if isinstance(value, list) else value
+                        for key, value in analysis['icmp_errors'].report().items()},
+        'anomalies': [dict(finding, hosts={int_to_ip(ip): count for ip, count in finding['hosts']})
+                      for finding in timeline_anomalies(analysis)],
+        'beacons': [dict(beacon, src=int_to_ip(beacon['src']), dst=int_to_ip(beacon['dst']))
+                    for beacon in capture_beacons(analysis)],
+        'per_packet_skipped': per_packet_skipped(analysis),
+        'source_clusters': dict(capture_clusters(analysis), clusters=[
+            dict(cluster, representatives=[int_to_ip(ip) for ip in cluster['representatives']])
+            for cluster in capture_clusters(analysis)['clusters']]),
+        'bandwidth': {
+            'packets': analysis['bandwidth']['packets'],
+            'bytes': analysis['bandwidth']['bytes'],
+            'size_classes': {label: {'packets': packets, 'bytes': size}
+                             for label, (packets, size) in zip(SIZE_CLASS_LABELS, analysis['bandwidth']['size_classes'])},
+            'top_ips': {int_to_ip(ip): dict(zip(('packets_sent', 'bytes_sent', 'packets_received', 'bytes_received'), row))
+                        for ip, row in top_bandwidth(analysis['bandwidth']['ips'], 20)},
+            'top_subnets': {f"{int_to_ip(net << (32 - BANDWIDTH_SUBNET_BITS))}/{BANDWIDTH_SUBNET_BITS}":
+                            dict(zip(('packets_sent', 'bytes_sent', 'packets_received', 'bytes_received'), row))
+                            for net, row in top_bandwidth(analysis['bandwidth']['subnets'], 20)},
+            'top_conversations': {f"{int_to_ip(key >> 32)} <-> {int_to_ip(key & 0xffffffff)}":
+                                  dict(zip(('packets_a_to_b', 'bytes_a_to_b', 'packets_b_to_a', 'bytes_b_to_a'), row))
+                                  for key, row in top_bandwidth(analysis['bandwidth']['pairs'], 20)}
+        },
+        'tunnels': {
+            'packets': dict(analysis['tunnels']['packets']),
+            'by_vni': {vni: {'packets': v['packets'], 'bytes': v['bytes'],
+                             'top_inner_src_ips': dict(v['inner_src_ips'].most_common(10))}
+                       for vni, v in analysis['tunnels']['by_vni'].items()},
+            'endpoints': dict(analysis['tunnels']['endpoints']),
+            'gwlb_endpoints': dict(analysis['tunnels']['gwlb_endpoints']),
+            'gwlb_attachments': dict(analysis['tunnels']['gwlb_attachments']),
+            'gwlb_flow_count': len(analysis['tunnels']['gwlb_flows'])
+        },
+        'sampling': {
+            'mode': analysis['sampling']['mode'],
+            'rate': analysis['sampling']['rate'],
+            'records_seen': analysis['sampling']['records_seen'],
+            'estimates': {metric: {'estimate': est, 'ci95': margin}
+                          for metric, (est, margin) in sampling_estimates(analysis['sampling']).items()}
+        } if analysis.get('sampling') else None,
+        'sketch': {
+            'capacity': analysis['sketch']['capacity'],
+            'precision': analysis['sketch']['precision'],
+            'unique_src_ips': len(analysis['src_ips']),
+            'unique_dst_ips': len(analysis['dst_ips']),
+            'unique_conversations': len(analysis['conversations']),
+            'max_count_error': {table: analysis[table].max_error
+                                for table in ('src_ips', 'dst_ips', 'src_ports', 'dst_ports', 'conversations')}
+        } if analysis.get('sketch') else None,
         'packet_size_stats': {
             'min': min(analysis['packet_sizes']) if analysis['packet_sizes'] else 0,
             'max': max(analysis['packet_sizes']) if analysis['packet_sizes'] else 0,
@@ -367,10 +1038,403 @@ def export_analysis(analysis, output_file):
     }
     
     with open(output_file, 'w') as f:
-        json.dump(export_data, f, indent=2)
+        if isinstance(export_data['conversations'], FlowTable) and export_data['conversations'].spilled:
+            # Stream the merged conversation table instead of building it in memory
+            f.write('{')
+            for index, (key, value) in enumerate(export_data.items()):
+                f.write((',\n' if index else '\n') + f"  {json.dumps(key)}: ")
+                if key == 'conversations':
+                    value.write_json(f, indent=2, level=1, transform=conversation_row)
+                else:
+                    f.write(json.dumps(value, indent=2).replace('\n', '\n  '))
+            f.write('\n}')
+        else:
+            export_data['conversations'] = dict(conversation_row(key, row)
+                                                for key, row in export_data['conversations'].items())
+            json.dump(export_data, f, indent=2)
     
     print(f"\n💾 Analysis exported to: {output_file}")
 
+# Bump when the summary layout changes so stale caches are rebuilt
+SUMMARY_VERSION = 2
+SUMMARY_TOP_N = 5000
+
+def timeline_anomalies(analysis):
+    """Per-second anomaly findings (cached until more packets arrive; empty when per-packet columns are skipped)"""
+    if analysis['packet_columns'] is None:
+        return []
+    cached = analysis.get('anomalies')
+    if cached is None or cached[0] != analysis['total_packets']:
+        cached = analysis['anomalies'] = (analysis['total_packets'], detect_anomalies(analysis['packet_columns']))
+    return cached[1]
+
+def capture_beacons(analysis):
+    """Beaconing candidates (cached until more packets arrive; empty when per-packet columns are skipped)"""
+    if analysis['connection_starts'] is None:
+        return []
+    cached = analysis.get('beacons')
+    if cached is None or cached[0] != analysis['total_packets']:
+        cached = analysis['beacons'] = (analysis['total_packets'], detect_beacons(analysis['connection_starts']))
+    return cached[1]
+
+def capture_clusters(analysis):
+    """Source behaviour clusters (cached until more packets arrive)"""
+    cached = analysis.get('source_clusters')
+    if cached is None or cached[0] != analysis['total_packets']:
+        cached = analysis['source_clusters'] = (analysis['total_packets'], cluster_sources(analysis['conversations']))
+    return cached[1]
+
+def print_anomalies(findings, limit=15):
+    """Print timeline anomalies with their windows and top contributing hosts"""
+    if not NUMPY_AVAILABLE:
+        return
+    if not findings:
+        print(f"\n  ✓ No timeline anomalies (per-second spikes or level shifts)")
+        return
+    
+    print(f"\n  📉 Timeline Anomalies ({len(findings)} found, robust z-score / change-point):")
+    for finding in sorted(findings, key=lambda f: f['score'], reverse=True)[:limit]:
+        start = datetime.fromtimestamp(finding['start']).strftime('%H:%M:%S')
+        end = datetime.fromtimestamp(finding['end']).strftime('%H:%M:%S')
+        kind = {'spike': 'spike', 'level_up': 'level shift ↑', 'level_down': 'level shift ↓'}[finding['kind']]
+        print(f"    {start}-{end}  {SERIES_LABELS[finding['metric']]:<22} {kind:<14} "
+              f"{finding['baseline']:,.1f} → {finding['value']:,.1f} (score {finding['score']:.1f})")
+        if finding['hosts']:
+            print(f"      Top sources: " + ', '.join(f"{int_to_ip(ip)} ({count:,})" for ip, count in finding['hosts']))
+
+def export_buckets(analysis, stem):
+    """Write the bucket counters (all / per protocol / per top host) as CSV and .npz"""
+    if not NUMPY_AVAILABLE:
+        print("\n⚠ Bucket export requires numpy. Install with: pip3 install numpy")
+        return
+    
+    bins = analysis['buckets'].bins(resumed_udp_flows(analysis))
+    if bins is None:
+        return
+    
+    interval = bins['interval']
+    hosts = bins['host_ids']
+    host_names = [int_to_ip(ip) for ip in hosts]
+    csv_file = OUTPUT_DIR / f"{stem}_buckets.csv"
+    npz_file = OUTPUT_DIR / f"{stem}_buckets.npz"
+    write_buckets_csv(bins, csv_file, host_names)
+    write_buckets_npz(bins, npz_file, host_names)
+    
+    print(f"\n📈 Time buckets ({interval:g}s x {len(bins['bucket_start']):,} non-empty, top {len(hosts)} hosts) exported to:")
+    print(f"   {csv_file}")
+    print(f"   {npz_file}")
+
+def resumed_udp_flows(analysis):
+    """(ts, proto code, src, dst) of the first packets of UDP flows that came back after spilling
+    
+    track_flow() flagged them FLAG_NEW_FLOW although the flow had been seen;
+    the bucket export takes them out of new_flows again.
+    """
+    conversations = analysis['conversations']
+    if not isinstance(conversations, FlowTable):
+        return
+    udp = PROTO_NUMBERS['UDP']
+    for key, record in conversations.resumed():
+        proto, ip_a, _, ip_b, _ = unpack_flow_key(key)
+        if proto == udp:
+            src, dst = (ip_a, ip_b) if record.initiator_is_a else (ip_b, ip_a)
+            yield record.first_seen, PROTO_CODES['UDP'], src, dst
+
+def format_bytes(value):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if value < 1024 or unit == 'GB':
+            return f"{value:,.0f} {unit}" if unit == 'B' else f"{value:,.1f} {unit}"
+        value /= 1024
+
+def print_bandwidth_analysis(bandwidth, duration):
+    """Print full-capture bandwidth tables (top-K estimates under --sketch)"""
+    if not bandwidth['packets']:
+        print("\n  No packets")
+        return
+    
+    total_bytes = bandwidth['bytes']
+    rate = f", {total_bytes * 8 / duration / 1e6:,.2f} Mbit/s average" if duration > 0 else ""
+    print(f"\n  Total Data: {total_bytes:,} bytes ({format_bytes(total_bytes)}) in {bandwidth['packets']:,} frames{rate}")
+    print(f"  Average Packet Size: {total_bytes / bandwidth['packets']:.1f} bytes")
+    print(f"  Smallest Packet: {bandwidth['min_size']} bytes")
+    print(f"  Largest Packet: {bandwidth['max_size']} bytes")
+    
+    print(f"\n  📊 Packet Size Distribution:")
+    for label, (packets, size) in zip(SIZE_CLASS_LABELS, bandwidth['size_classes']):
+        if packets:
+            print(f"    {label:>10} bytes: {packets:>10,} packets ({packets / bandwidth['packets'] * 100:5.1f}%) "
+                  f"{format_bytes(size):>12} ({size / total_bytes * 100:5.1f}% of bytes)")
+    
+    print(f"\n  📍 Top 10 Bandwidth Consumers (by IP):")
+    print(f"    {'IP':<18} {'Total':>12} {'Sent':>12} {'Received':>12} {'Packets':>10}")
+    for ip, (pkts_out, bytes_out, pkts_in, bytes_in) in top_bandwidth(bandwidth['ips']):
+        print(f"    {int_to_ip(ip):<18} {format_bytes(bytes_out + bytes_in):>12} {format_bytes(bytes_out):>12} "
+              f"{format_bytes(bytes_in):>12} {pkts_out + pkts_in:>10,}")
+    
+    shift = 32 - BANDWIDTH_SUBNET_BITS
+    print(f"\n  🌐 Top 10 Subnets (/{BANDWIDTH_SUBNET_BITS}):")
+    print(f"    {'Subnet':<18} {'Total':>12} {'Sent':>12} {'Received':>12} {'Packets':>10}")
+    for net, (pkts_out, bytes_out, pkts_in, bytes_in) in top_bandwidth(bandwidth['subnets']):
+        subnet = f"{int_to_ip(net << shift)}/{BANDWIDTH_SUBNET_BITS}"
+        print(f"    {subnet:<18} {format_bytes(bytes_out + bytes_in):>12} {format_bytes(bytes_out):>12} "
+              f"{format_bytes(bytes_in):>12} {pkts_out + pkts_in:>10,}")
+    
+    print(f"\n  💬 Top 10 Conversations (IP pairs, bytes each way):")
+    for key, (pkts_ab, bytes_ab, pkts_ba, bytes_ba) in top_bandwidth(bandwidth['pairs']):
+        print(f"    {int_to_ip(key >> 32):>15} <-> {int_to_ip(key & 0xffffffff):<15} "
+              f"{format_bytes(bytes_ab + bytes_ba):>12}  (→ {format_bytes(bytes_ab)} / ← {format_bytes(bytes_ba)}, "
+              f"{pkts_ab + pkts_ba:,} packets)")
+
+def conversation_row(key, row):
+    """(label, stats) for a flow-table entry or a --sketch packets/bytes row"""
+    if isinstance(row, FlowRecord):
+        return flow_label(key, row.initiator_is_a), row.summary(key)
+    proto, src, sport, dst, dport = flow_endpoints(key)
+    return flow_label(key), dict(row, proto=proto, src=src, sport=sport, dst=dst, dport=dport)
+
+def top_conversations(conversations, n):
+    """Top-n (label, stats) by packets from the flow table or sketch"""
+    return [conversation_row(key, row) for key, row in conversations.most_common(n)]
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def summary_path(pcap_file):
+    """Location of the cached summary for a capture"""
+    return OUTPUT_DIR / (capture_stem(pcap_file) + '_summary.json')
+
+def capture_fingerprint(pcap_file):
+    files = capture_files(pcap_file)
+    if len(files) > 1:
+        return {'name': capture_stem(pcap_file), 'files': [capture_fingerprint(f) for f in files]}
+    stat = os.stat(files[0])
+    return {'name': Path(files[0]).name, 'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+def build_summary(analysis, pcap_file):
+    """Compact, comparable digest of one analysis (used by the diff command)"""
+    total = analysis['total_packets']
+    flags = analysis['tcp_flags']
+    rtts = sorted(analysis['handshake_rtts'])
+    timestamps = analysis['timestamps']
+    hosts = Counter()
+    for table in ('src_ips', 'dst_ips'):
+        for ip, count in analysis[table].most_common(SUMMARY_TOP_N):
+            hosts[ip] += count
+    
+    return {
+        'version': SUMMARY_VERSION,
+        'source': capture_fingerprint(pcap_file),
+        'total_packets': total,
+        'total_bytes': sum(analysis['packet_sizes']),
+        'duration': timestamps[-1] - timestamps[0] if len(timestamps) > 1 else 0,
+        'protocols': dict(analysis['protocols']),
+        'hosts': dict(hosts.most_common(SUMMARY_TOP_N)),
+        'dst_ports': {str(port): count for port, count in analysis['dst_ports'].most_common(SUMMARY_TOP_N)},
+        'tcp_flags': dict(flags),
+        'handshake_success_rate': handshake_success_rate(analysis),
+        'rst_rate': flags['RST'] / total * 100 if total else 0,
+        'icmp_unreachable_rate': analysis['icmp_types']['unreachable'] / total * 100 if total else 0,
+        'handshake_rtt_ms': {f"p{pct}": percentile(rtts, pct) for pct in (50, 90, 99)}
+    }
+
+def handshake_success_rate(analysis):
+    """Percent of TCP flows with a SYN that got a SYN-ACK
+    
+    Counted per flow from the FlowTable so SYN/SYN-ACK retransmissions do not
+    skew it. The --sketch table keeps no handshake state, so there it falls
+    back to the SYN-ACK/SYN packet ratio (capped at 100).
+    """
+    conversations = analysis['conversations']
+    if isinstance(conversations, FlowTable):
+        tcp = PROTO_NUMBERS['TCP']
+        attempted = answered = 0
+        for key, record in conversations.items():
+            if record.syn and key >> 96 == tcp:
+                attempted += 1
+                answered += record.synack > 0
+        return answered / attempted * 100 if attempted else None
+    flags = analysis['tcp_flags']
+    return min(100.0, flags['SYN-ACK'] / flags['SYN'] * 100) if flags['SYN'] else None
+
+def save_summary(analysis, pcap_file):
+    """Cache the summary next to the other outputs"""
+    output_file = summary_path(pcap_file)
+    with open(output_file, 'w') as f:
+        json.dump(build_summary(analysis, pcap_file), f, indent=2)
+    return output_file
+
+def load_summary(capture):
+    """Load a summary JSON, or the cached summary of a pcap (analyzing it once if needed)"""
+    if capture.endswith('.json'):
+        with open(capture) as f:
+            return json.load(f)
+    
+    cached = summary_path(capture)
+    if cached.exists():
+        with open(cached) as f:
+            summary = json.load(f)
+        if summary.get('version') == SUMMARY_VERSION and summary.get('source') == capture_fingerprint(capture):
+            return summary
+    
+    print(f"  ℹ️  No current summary for {capture} - analyzing once")
+    analysis = analyze_with_scapy(capture)
+    save_summary(analysis, capture)
+    return build_summary(analysis, capture)
+
+def _share(table, key, total):
+    return table.get(key, 0) / total * 100 if total else 0
+
+def diff_summaries(baseline, other, top=10):
+    """Print how `other` differs from `baseline` (rates are normalized per packet)"""
+    base_total, other_total = baseline['total_packets'], other['total_packets']
+    
+    print(f"\n{'='*100}")
+    print(f"CAPTURE DIFF: {baseline['source']['name']}  →  {other['source']['name']}")
+    print(f"{'='*100}")
+    
+    print(f"\n📊 Volume:")
+    print(f"  Packets:  {base_total:>12,} → {other_total:>12,}")
+    print(f"  Bytes:    {baseline['total_bytes']:>12,} → {other['total_bytes']:>12,}")
+    print(f"  Duration: {baseline['duration']:>11.1f}s → {other['duration']:>11.1f}s")
+    
+    print(f"\n🔌 TCP Health:")
+    rows = [('Handshake success %', 'handshake_success_rate'), ('RST rate %', 'rst_rate'),
+            ('ICMP unreachable %', 'icmp_unreachable_rate')]
+    for label, key in rows:
+        before, after = baseline[key], other[key]
+        if before is None or after is None:
+            print(f"  {label:<22} {'n/a' if before is None else f'{before:.2f}':>8} → {'n/a' if after is None else f'{after:.2f}':>8}")
+        else:
+            marker = '⚠' if abs(after - before) >= 5 else ' '
+            print(f"  {label:<22} {before:>8.2f} → {after:>8.2f}  ({after - before:+.2f} pts) {marker}")
+    
+    for pct, before in baseline['handshake_rtt_ms'].items():
+        after = other['handshake_rtt_ms'].get(pct)
+        if before is not None and after is not None:
+            print(f"  Handshake RTT {pct:<8} {before:>8.2f} → {after:>8.2f} ms ({after - before:+.2f})")
+    
+    print(f"\n📡 Protocol Share (% of packets):")
+    for proto in sorted(set(baseline['protocols']) | set(other['protocols'])):
+        before = _share(baseline['protocols'], proto, base_total)
+        after = _share(other['protocols'], proto, other_total)
+        print(f"  {proto:<10} {before:>6.1f}% → {after:>6.1f}%  ({after - before:+.1f})")
+    
+    print(f"\n🔌 Largest Destination Port Shifts (% of packets):")
+    ports = set(baseline['dst_ports']) | set(other['dst_ports'])
+    shifts = sorted(((_share(other['dst_ports'], p, other_total) - _share(baseline['dst_ports'], p, base_total), p)
+                     for p in ports), key=lambda x: abs(x[0]), reverse=True)
+    for delta, port in shifts[:top]:
+        print(f"  Port {port:<7} {_share(baseline['dst_ports'], port, base_total):>6.2f}% → "
+              f"{_share(other['dst_ports'], port, other_total):>6.2f}%  ({delta:+.2f})")
+    
+    new_hosts = Counter({ip: n for ip, n in other['hosts'].items() if ip not in baseline['hosts']})
+    gone_hosts = Counter({ip: n for ip, n in baseline['hosts'].items() if ip not in other['hosts']})
+    print(f"\n🆕 New Talkers: {len(new_hosts):,}")
+    for ip, count in new_hosts.most_common(top):
+        print(f"  {ip:<20} {count:>10,} packets")
+    print(f"\n👻 Vanished Talkers: {len(gone_hosts):,}")
+    for ip, count in gone_hosts.most_common(top):
+        print(f"  {ip:<20} {count:>10,} packets (in baseline)")
+
+def diff_captures(baseline, others):
+    """Compare one or more captures against a baseline using cached summaries"""
+    base_summary = load_summary(baseline)
+    for capture in others:
+        diff_summaries(base_summary, load_summary(capture))
+    print()
+
+def ingest_capture(db, pcap_file):
+    """Stream one capture into the flow database (tunnels are decapsulated)"""
+    fingerprint = content_fingerprint(pcap_file)
+    if db.has_capture(fingerprint):
+        print(f"  ⏭️  {pcap_file}: already ingested - skipping")
+        return False
+
+    start = time.time()
+    db.begin_capture(pcap_file, fingerprint)
+    try:
+        for ts, linktype, data in iter_pcap_records(pcap_file):
+            try:
+                pkt, _ = decapsulate_tunnel(dissect_frame(linktype, data))
+            except Exception:
+                continue
+            if IP not in pkt:
+                continue
+
+            ip = pkt[IP]
+            if TCP in pkt:
+                db.add_packet(ts, 'TCP', ip.src, pkt[TCP].sport, ip.dst, pkt[TCP].dport, len(data), int(pkt[TCP].flags))
+            elif UDP in pkt:
+                db.add_packet(ts, 'UDP', ip.src, pkt[UDP].sport, ip.dst, pkt[UDP].dport, len(data))
+            elif ICMP in pkt:
+                db.add_packet(ts, 'ICMP', ip.src, 0, ip.dst, 0, len(data))
+            else:
+                db.add_packet(ts, f"IP/{ip.proto}", ip.src, 0, ip.dst, 0, len(data))
+    except BaseException:
+        db.abort_capture()
+        raise
+    db.finish_capture()
+
+    print(f"  ✓ {pcap_file}: {db.packets:,} packets in {time.time() - start:.1f}s")
+    return True
+
+def ingest_main(argv):
+    """Entry point for: pcap_analyzer_v3.py ingest DATABASE CAPTURE [CAPTURE ...]"""
+    parser = argparse.ArgumentParser(
+        prog='pcap_analyzer_v3.py ingest',
+        description='Load flow records and per-second aggregates into a SQLite database')
+    parser.add_argument('database', help='SQLite database file (created if missing)')
+    parser.add_argument('captures', nargs='+', help='Captures to ingest (already ingested ones are skipped)')
+    args = parser.parse_args(argv)
+
+    if not SCAPY_AVAILABLE:
+        print("❌ Ingest requires Scapy. Install with: pip3 install scapy")
+        sys.exit(1)
+
+    print(f"\n🗄️  Ingesting into {args.database}")
+    db = FlowDatabase(args.database)
+    try:
+        ingested = sum(ingest_capture(db, capture) for capture in args.captures)
+    finally:
+        db.close()
+    print(f"\n✓ {ingested} capture(s) ingested, {len(args.captures) - ingested} skipped")
+
+def query_main(argv):
+    """Entry point for: pcap_analyzer_v3.py query DATABASE [NAME | SQL]"""
+    parser = argparse.ArgumentParser(
+        prog='pcap_analyzer_v3.py query',
+        description='Query an ingested flow database. Canned queries: ' + ', '.join(CANNED_QUERIES))
+    parser.add_argument('database', help='SQLite database written by the ingest command')
+    parser.add_argument('query', nargs='?', default='captures', help='Canned query name or a SQL statement')
+    parser.add_argument('--capture', help='Restrict a canned query to one capture (name or id)')
+    parser.add_argument('--limit', type=int, default=20, help='Rows for canned queries (default: 20, 0 = all)')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        print(f"❌ Database not found: {args.database}")
+        sys.exit(1)
+
+    db = FlowDatabase(args.database)
+    try:
+        if args.query in CANNED_QUERIES:
+            title, sql, params = canned_sql(args.query, args.capture, args.limit)
+        else:
+            title, sql, params = "Query", args.query, ()
+        print(f"\n📊 {title}")
+        print("="*100)
+        try:
+            columns, rows = db.query(sql, params)
+        except sqlite3.Error as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print_rows(columns, rows)
+    finally:
+        db.close()
+
 def get_whois_info(ip, cache={}):
     """Get whois information for an IP (with caching)"""
     if not WHOIS_AVAILABLE:
@@ -420,14 +1484,13 @@ def generate_network_diagram(analysis, output_file):
     G = nx.DiGraph()
     
     # Add top conversations to graph
-    top_convs = sorted(analysis['conversations'].items(), 
-                      key=lambda x: x[1]['packets'], reverse=True)[:30]
+    top_convs = top_conversations(analysis['conversations'], 30)
     
     for conv, stats in top_convs:
-        parts = conv.split(' <-> ')
-        if len(parts) == 2:
-            src = parts[0].split(':')[0]
-            dst = parts[1].split(':')[0]
+        src, dst = stats['src'], stats['dst']
+        if G.has_edge(src, dst):
+            G[src][dst]['weight'] += stats['packets']
+        else:
             G.add_edge(src, dst, weight=stats['packets'])
     
     # Create figure
@@ -511,7 +1574,7 @@ def generate_interactive_html(analysis, pcap_file, output_file):
 <!DOCTYPE html>
 <html>
 <head>
-    <title>PCAP Analysis Report - {Path(pcap_file).name}</title>
+    <title>PCAP Analysis Report - {capture_name(pcap_file)}</title>
     <style>
         body {{ font-family: Arial, sans-serif; margin: 20px; background: #f5f5f5; }}
         .container {{ max-width: 1400px; margin: 0 auto; background: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
@@ -535,7 +1598,7 @@ def generate_interactive_html(analysis, pcap_file, output_file):
 <body>
     <div class="container">
         <h1>📊 PCAP Analysis Report</h1>
-        <p><strong>File:</strong> {Path(pcap_file).name}</p>
+        <p><strong>File:</strong> {capture_name(pcap_file)}</p>
         <p><strong>Generated:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
         
         <div class="stats">
@@ -572,8 +1635,7 @@ def generate_interactive_html(analysis, pcap_file, output_file):
         <h2>💬 Top Conversations</h2>
 """
     
-    top_convs = sorted(analysis['conversations'].items(), 
-                      key=lambda x: x[1]['packets'], reverse=True)[:15]
+    top_convs = top_conversations(analysis['conversations'], 15)
     
     for conv, stats in top_convs:
         html_content += f"""
@@ -606,15 +1668,216 @@ def generate_interactive_html(analysis, pcap_file, output_file):
     
     print(f"✓ Interactive HTML saved: {output_file}")
 
-def analyze_pcap(pcap_file, export_json=False, enable_whois=False, enable_tor=False, enable_visual=False):
-    """Main analysis function"""
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e6), b'\xa1\xb2\xc3\xd4': ('>', 1e6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e9), b'\xa1\xb2\x3c\x4d': ('>', 1e9)
+}
+
+# Global header plus the first record header - changes when a file is rewritten in place
+PCAP_SIGNATURE_BYTES = 40
+
+class PcapFollower:
+    """Incrementally read the complete records appended to a classic pcap file.
+    
+    Remembers the byte offset of the last complete record, so each poll only
+    reads what tcpdump -w wrote since the previous one. A partially flushed
+    record is left for the next poll. A file that was replaced (new inode),
+    truncated, or rewritten in place (-C/-W ring slot: the global header or
+    first record header differs) is read again from the start.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.endian = None
+        self.ts_divisor = None
+        self.linktype = None
+        self.inode = None
+        self.signature = b''
+    
+    def has_new_data(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return stat.st_size != self.offset or stat.st_ino != self.inode
+    
+    def read_new(self):
+        """Yield (timestamp, linktype, frame bytes) for records not yet returned"""
+        try:
+            f = open(self.path, 'rb')
+        except OSError:
+            return
+        
+        with f:
+            stat = os.fstat(f.fileno())
+            head = f.read(PCAP_SIGNATURE_BYTES)
+            if self.endian is not None and (stat.st_ino != self.inode or stat.st_size < self.offset
+                                            or head[:len(self.signature)] != self.signature):
+                self.offset, self.endian = 0, None  # Replaced/truncated/rewritten - start over
+            
+            if self.endian is None:
+                if len(head) < 24 or head[:4] not in PCAP_MAGIC:
+                    return  # Not (yet) a classic pcap file
+                self.endian, self.ts_divisor = PCAP_MAGIC[head[:4]]
+                self.linktype = struct.unpack(self.endian + 'I', head[20:24])[0] & 0x0fffffff
+                self.inode = stat.st_ino
+                self.signature = b''
+                self.offset = 24
+            if len(head) > len(self.signature):
+                self.signature = head
+            
+            f.seek(self.offset)
+            record_header = struct.Struct(self.endian + 'IIII')
+            while True:
+                header = f.read(16)
+                if len(header) < 16:
+                    break
+                sec, frac, caplen, _ = record_header.unpack(header)
+                data = f.read(caplen)
+                if len(data) < caplen:
+                    break
+                self.offset += 16 + caplen
+                yield sec + frac / self.ts_divisor, self.linktype, data
+
+def rotation_files(path):
+    """Regular files of a rotation directory, oldest first
+    
+    Files rotated away between listing and stat are skipped.
+    """
+    files = []
+    for entry in path.iterdir():
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        if S_ISREG(stat.st_mode):
+            files.append((stat.st_mtime, entry.name, entry))
+    return [entry for _, _, entry in sorted(files)]
+
+def follow_capture(path, interval=5.0, export_json=False, sketch=None, max_memory=None, buckets=None):
+    """Live analysis of a capture that is still being written.
+    
+    path may be a single pcap or a directory of tcpdump -C/-G rotations; new
+    files are picked up as they appear. Every interval seconds only the newly
+    appended records are dissected and folded into the running aggregates,
+    and the refresh summary (and its JSON) is built from running counters
+    only. The full report, JSON export and whole-capture analytics (anomalies,
+    beacons, clusters) run once, when Ctrl-C stops following.
+    """
+    if not SCAPY_AVAILABLE:
+        print("⚠ Follow mode requires Scapy. Install with: pip3 install scapy")
+        return
+    
+    path = Path(path)
+    analysis = new_scapy_analysis(sketch, max_memory, buckets)
+    followers = {}
+    stem = path.name if path.is_dir() else path.stem
+    json_name = stem + '_live_analysis.json'
+    
+    print("\n" + "="*100)
+    print(f"FOLLOW MODE: {path} (refresh every {interval:g}s, Ctrl-C to stop)")
+    print("="*100)
+    
+    try:
+        while True:
+            started = time.time()
+            files = rotation_files(path) if path.is_dir() else [path]
+            # Forget rotated-away files
+            for gone in set(followers) - set(files):
+                del followers[gone]
+            
+            new_packets = 0
+            for capture in files:
+                follower = followers.setdefault(capture, PcapFollower(capture))
+                if not follower.has_new_data():
+                    continue
+                for ts, linktype, data in follower.read_new():
+                    update_scapy_analysis(analysis, dissect_frame(linktype, data), ts)
+                    new_packets += 1
+            
+            summary = live_summary(analysis, new_packets, interval, len([f for f in followers.values() if f.endian]))
+            print_live_summary(summary)
+            if export_json and new_packets:
+                export_live_summary(summary, stem + '_live_summary.json')
+            
+            time.sleep(max(0.0, interval - (time.time() - started)))
+    except KeyboardInterrupt:
+        print("\n\n⏹  Follow mode stopped - final report:")
+        if analysis['total_packets']:
+            print_scapy_analysis(analysis)
+            if export_json:
+                export_analysis(analysis, json_name)
+            if buckets:
+                export_buckets(analysis, Path(json_name).stem.replace('_analysis', ''))
+
+def live_summary(analysis, new_packets, interval, file_count, top=5):
+    """One refresh of follow mode - running counters only, never a pass over the data"""
+    return {
+        'updated': datetime.now().isoformat(timespec='seconds'),
+        'files': file_count,
+        'total_packets': analysis['total_packets'],
+        'new_packets': new_packets,
+        'packets_per_second': new_packets / interval,
+        'protocols': dict(analysis['protocols'].most_common(top)),
+        'top_src_ips': dict(analysis['src_ips'].most_common(top)),
+        'top_dst_ports': {str(port): count for port, count in analysis['dst_ports'].most_common(top)},
+        'tcp_flags': dict(analysis['tcp_flags'])
+    }
+
+def export_live_summary(summary, output_file):
+    """Rewrite the refresh JSON atomically so readers never see a partial file"""
+    output_file = OUTPUT_DIR / Path(output_file).name
+    partial = output_file.with_name(output_file.name + '.tmp')
+    with open(partial, 'w') as f:
+        json.dump(summary, f, indent=2)
+    os.replace(partial, output_file)
+
+def print_live_summary(summary):
+    """Print one refresh of follow mode"""
+    total = summary['total_packets']
+    print(f"\n🔄 [{summary['updated'][11:]}] {total:,} packets "
+          f"(+{summary['new_packets']:,}, ~{summary['packets_per_second']:,.1f} pps) from {summary['files']} file(s)")
+    if not total:
+        return
+    
+    protocols = ', '.join(f"{proto} {count / total * 100:.0f}%" for proto, count in summary['protocols'].items())
+    print(f"  Protocols: {protocols}")
+    print(f"  Top sources: " + ', '.join(f"{ip} ({count:,})" for ip, count in summary['top_src_ips'].items()))
+    print(f"  Top dest ports: " + ', '.join(f"{port} ({count:,})" for port, count in summary['top_dst_ports'].items()))
+
+def analyze_pcap(pcap_file, export_json=False, enable_whois=False, enable_tor=False, enable_visual=False,
+                 sample=None, sketch=None, max_memory=None, buckets=None):
+    """Main analysis function (pcap_file may be a list - analyzed as one merged timeline)"""
     
     print("\n" + "="*100)
     print(f"COMPREHENSIVE PCAP ANALYSIS v3")
-    print(f"File: {pcap_file}")
+    if len(capture_files(pcap_file)) > 1:
+        print(f"Files (merged by timestamp): {capture_name(pcap_file)}")
+    else:
+        print(f"File: {pcap_file}")
     print(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*100)
     
+    # SAMPLED TRIAGE - only sampled records are read past the record header,
+    # so the full-capture tcpdump passes below are skipped
+    if sample:
+        if not SCAPY_AVAILABLE:
+            print("\n⚠ Sampling requires Scapy. Install with: pip3 install scapy")
+            return
+        
+        scapy_analysis = analyze_with_scapy(pcap_file, sample=sample, sketch=sketch, max_memory=max_memory,
+                                            buckets=buckets)
+        print_scapy_analysis(scapy_analysis)
+        if export_json:
+            export_analysis(scapy_analysis, capture_stem(pcap_file) + '_analysis.json')
+        if buckets:
+            export_buckets(scapy_analysis, capture_stem(pcap_file))
+        
+        print(f"\n  ℹ️  Sampling mode: tcpdump full-capture sections skipped. Re-run without --sample for exact results.")
+        print()
+        return
+    
     # TCP FLAGS REFERENCE
     print("\n" + "="*100)
     print("TCP FLAGS REFERENCE")
@@ -828,13 +2091,16 @@ Common Flag Combinations:
     # SCAPY DEEP ANALYSIS
     scapy_analysis = None
     if SCAPY_AVAILABLE:
-        scapy_analysis = analyze_with_scapy(pcap_file)
+        scapy_analysis = analyze_with_scapy(pcap_file, sketch=sketch, max_memory=max_memory, buckets=buckets)
         if scapy_analysis:
             print_scapy_analysis(scapy_analysis)
+            save_summary(scapy_analysis, pcap_file)
             
             if export_json:
-                output_file = Path(pcap_file).stem + '_analysis.json'
+                output_file = capture_stem(pcap_file) + '_analysis.json'
                 export_analysis(scapy_analysis, output_file)
+            if buckets:
+                export_buckets(scapy_analysis, capture_stem(pcap_file))
     
     # WHOIS LOOKUP
     if enable_whois and WHOIS_AVAILABLE and scapy_analysis:
@@ -1016,7 +2282,10 @@ Common Flag Combinations:
             for ip, count in requested_ips.most_common(10):
                 print(f"    {ip}: {count} requests")
         
-        # Detect potential ARP spoofing (multiple MACs for same IP)
+        # Binding tables, conflicts and storms from the Scapy pass
+        if SCAPY_AVAILABLE and scapy_analysis:
+            print_arp_analysis(scapy_analysis['arp'].report())
+        
         if len(arp_replies) > 0:
             print(f"\n  Sample ARP replies:")
             for pkt in arp_replies[:5]:
@@ -1029,11 +2298,16 @@ Common Flag Combinations:
     print("BANDWIDTH ANALYSIS")
     print("="*100)
     
-    # Get packet sizes from all packets
+    if SCAPY_AVAILABLE and scapy_analysis:
+        timestamps = scapy_analysis['timestamps']
+        duration = timestamps[-1] - timestamps[0] if len(timestamps) > 1 else 0
+        print_bandwidth_analysis(scapy_analysis['bandwidth'], duration)
+    
+    # Without Scapy, estimate from the first 1000 tcpdump lines
     bandwidth_by_ip = defaultdict(int)
     packet_sizes = []
     
-    for pkt in all_packets[:1000]:  # Sample first 1000 for performance
+    for pkt in ([] if SCAPY_AVAILABLE and scapy_analysis else all_packets[:1000]):
         # Extract length from tcpdump output
         length_match = re.search(r'length (\d+)', pkt)
         if length_match:
@@ -1122,7 +2396,7 @@ Common Flag Combinations:
             20: 'FTP-Data', 21: 'FTP', 22: 'SSH', 23: 'Telnet', 25: 'SMTP',
             53: 'DNS', 67: 'DHCP', 68: 'DHCP', 80: 'HTTP', 110: 'POP3',
             123: 'NTP', 143: 'IMAP', 161: 'SNMP', 443: 'HTTPS', 445: 'SMB',
-            3306: 'MySQL', 3389: 'RDP', 5432: 'PostgreSQL', 6081: 'Geneve',
+            3306: 'MySQL', 3389: 'RDP', 4789: 'VXLAN', 5432: 'PostgreSQL', 6081: 'Geneve',
             8080: 'HTTP-Alt', 8443: 'HTTPS-Alt', 9090: 'HTTP-Proxy'
         }
         
@@ -1144,30 +2418,27 @@ Common Flag Combinations:
         print(f"  {'-'*90}")
         
         # Get top conversations
-        top_convs = sorted(scapy_analysis['conversations'].items(), 
-                          key=lambda x: x[1]['packets'], reverse=True)[:15]
+        top_convs = top_conversations(scapy_analysis['conversations'], 15)
         
         for conv, stats in top_convs:
-            parts = conv.split(' <-> ')
-            if len(parts) == 2:
-                src = parts[0]
-                dst = parts[1]
-                packets = stats['packets']
-                bytes_val = stats['bytes']
-                
-                # Visual representation
-                if packets > 100:
-                    arrow = '═══════>'
-                elif packets > 50:
-                    arrow = '══════>'
-                elif packets > 10:
-                    arrow = '═════>'
-                else:
-                    arrow = '────>'
-                
-                print(f"  {src:<30} {arrow} {dst:<30}")
-                print(f"  {'':30} {packets:>6,} pkts | {bytes_val:>10,} bytes")
-                print()
+            src = f"{stats['src']}:{stats['sport']}"
+            dst = f"{stats['dst']}:{stats['dport']}"
+            packets = stats['packets']
+            bytes_val = stats['bytes']
+            
+            # Visual representation
+            if packets > 100:
+                arrow = '═══════>'
+            elif packets > 50:
+                arrow = '══════>'
+            elif packets > 10:
+                arrow = '═════>'
+            else:
+                arrow = '────>'
+            
+            print(f"  {src:<30} {arrow} {dst:<30} {stats['proto']}")
+            print(f"  {'':30} {packets:>6,} pkts | {bytes_val:>10,} bytes")
+            print()
         
         # Network summary
         print(f"\n  📊 Network Summary:")
@@ -1211,38 +2482,68 @@ Common Flag Combinations:
         print(f"\n  ⚠ Install Scapy for detailed network visualization")
         print(f"    pip3 install scapy")
     
-    # GENEVE PROTOCOL ANALYSIS
+    # TUNNEL ENCAPSULATION ANALYSIS
     print("\n" + "="*100)
-    print("GENEVE PROTOCOL ANALYSIS")
+    print("TUNNEL ENCAPSULATION ANALYSIS (VXLAN / GENEVE)")
     print("="*100)
     
-    geneve_packets = run_tcpdump(pcap_file, 'udp port 6081')
-    
-    if geneve_packets:
-        print(f"\n✓ Geneve encapsulation detected: {len(geneve_packets)} packets")
-        
-        # Extract Geneve endpoints
-        geneve_sources = Counter()
-        geneve_dests = Counter()
-        for pkt in geneve_packets:
-            ips = re.findall(r'(\d+\.\d+\.\d+\.\d+)', pkt)
-            if len(ips) >= 2:
-                geneve_sources[ips[0]] += 1
-                geneve_dests[ips[1]] += 1
-        
-        print(f"\n  📍 Geneve Tunnel Sources:")
-        for ip, count in geneve_sources.most_common(5):
-            print(f"    {ip}: {count} packets")
-        
-        print(f"\n  📍 Geneve Tunnel Destinations:")
-        for ip, count in geneve_dests.most_common(5):
-            print(f"    {ip}: {count} packets")
-        
-        print(f"\n  Packet samples (first 10):")
-        for pkt in geneve_packets[:10]:
-            print(f"    {pkt}")
+    tunnels = scapy_analysis['tunnels'] if SCAPY_AVAILABLE and scapy_analysis else None
+    
+    if tunnels and tunnels['packets']:
+        # Scapy pass already decapsulated these - report per-tunnel attribution
+        for tunnel_type, count in tunnels['packets'].most_common():
+            print(f"\n✓ {tunnel_type} encapsulation decapsulated: {count:,} packets")
+        print(f"  ℹ️  Scapy sections above report the inner (client) flows; tcpdump sections count outer headers")
+        
+        print(f"\n  📍 Per-VNI Breakdown:")
+        sorted_vnis = sorted(tunnels['by_vni'].items(), key=lambda x: x[1]['packets'], reverse=True)
+        for vni, stats in sorted_vnis[:10]:
+            top_inner = ', '.join(ip for ip, _ in stats['inner_src_ips'].most_common(3))
+            print(f"    {vni}: {stats['packets']:,} packets | {stats['bytes']:,} bytes")
+            if top_inner:
+                print(f"      Top inner sources: {top_inner}")
+        
+        print(f"\n  📍 Tunnel Endpoints (outer):")
+        for endpoints, count in tunnels['endpoints'].most_common(5):
+            print(f"    {endpoints}: {count:,} packets")
+        
+        if tunnels['gwlb_endpoints'] or tunnels['gwlb_attachments']:
+            print(f"\n  📍 Gateway Load Balancer (Geneve TLVs):")
+            for vpce, count in tunnels['gwlb_endpoints'].most_common(5):
+                print(f"    GWLB Endpoint {vpce}: {count:,} packets")
+            for attachment, count in tunnels['gwlb_attachments'].most_common(5):
+                print(f"    Attachment {attachment}: {count:,} packets")
+            if tunnels['gwlb_flows']:
+                approx = '' if tunnels['gwlb_flows'].exact else '~'
+                print(f"    Distinct flow cookies: {approx}{len(tunnels['gwlb_flows']):,}")
     else:
-        print("\n✓ No Geneve encapsulation detected")
+        geneve_packets = run_tcpdump(pcap_file, 'udp port 6081 or udp port 4789')
+        
+        if geneve_packets:
+            print(f"\n✓ VXLAN/Geneve encapsulation detected: {len(geneve_packets)} packets")
+            
+            # Extract tunnel endpoints
+            geneve_sources = Counter()
+            geneve_dests = Counter()
+            for pkt in geneve_packets:
+                ips = re.findall(r'(\d+\.\d+\.\d+\.\d+)', pkt)
+                if len(ips) >= 2:
+                    geneve_sources[ips[0]] += 1
+                    geneve_dests[ips[1]] += 1
+            
+            print(f"\n  📍 Tunnel Sources:")
+            for ip, count in geneve_sources.most_common(5):
+                print(f"    {ip}: {count} packets")
+            
+            print(f"\n  📍 Tunnel Destinations:")
+            for ip, count in geneve_dests.most_common(5):
+                print(f"    {ip}: {count} packets")
+            
+            print(f"\n  Packet samples (first 10):")
+            for pkt in geneve_packets[:10]:
+                print(f"    {pkt}")
+        else:
+            print("\n✓ No VXLAN/Geneve encapsulation detected")
     
     # UDP ERRORS (ICMP)
     print("\n" + "="*100)
@@ -1263,6 +2564,10 @@ Common Flag Combinations:
         if icmp_time_exceeded:
             print(f"\n⚠ ICMP Time Exceeded (TTL=0): {len(icmp_time_exceeded)} packets")
         
+        # Attribution by the quoted header (collected in the Scapy pass)
+        if SCAPY_AVAILABLE and scapy_analysis:
+            print_icmp_attribution(scapy_analysis['icmp_errors'].report())
+        
         port_unreach = [l for l in icmp_unreach if 'port unreachable' in l.lower()]
         host_unreach = [l for l in icmp_unreach if 'host unreachable' in l.lower()]
         net_unreach = [l for l in icmp_unreach if 'net unreachable' in l.lower()]
@@ -1410,20 +2715,22 @@ Common Flag Combinations:
             }.get(port, 'Unknown')
             print(f"    Port {port} ({port_name}): {count} blocks")
     
-    # Check for port scanning behavior
+    # Port scan detection (indexed per source during the Scapy pass)
+    scans = scapy_analysis['scans'].scans() if SCAPY_AVAILABLE and scapy_analysis else []
     if SCAPY_AVAILABLE and scapy_analysis:
-        # Detect if single source is hitting many ports on same dest
-        for conv, stats in scapy_analysis['conversations'].items():
-            if stats['packets'] < 5:  # Few packets per port = scanning
-                parts = conv.split(' <-> ')
-                if len(parts) == 2:
-                    src_ip = parts[0].split(':')[0]
-                    # Count unique dest ports from this source
-                    dest_ports_from_src = [c.split(':')[-1] for c in scapy_analysis['conversations'].keys() 
-                                          if c.startswith(src_ip)]
-                    if len(set(dest_ports_from_src)) > 20:
-                        firewall_indicators.append(f"⚠ Possible port scan from {src_ip} ({len(set(dest_ports_from_src))} ports)")
-                        break
+        print_scan_analysis(scans)
+        scanners = {e['source'] for e in scans}
+        if scanners:
+            firewall_indicators.append(f"⚠ Port scans: {len(scans)} episode(s) from {len(scanners)} source(s)")
+        
+        # Periodic connections to external endpoints (C2-style beaconing)
+        beacons = capture_beacons(scapy_analysis)
+        if per_packet_skipped(scapy_analysis):
+            print(f"\n  ℹ️  Beaconing detection skipped: {per_packet_skipped(scapy_analysis)}")
+        else:
+            print_beacons(beacons)
+        if beacons:
+            firewall_indicators.append(f"⚠ Beaconing: {len(beacons)} internal → external pair(s) with periodic connections")
     
     if firewall_indicators:
         print(f"\n  🔥 Firewall/Security Indicators:")
@@ -1488,21 +2795,12 @@ Common Flag Combinations:
         ddos_score += 2
     
     # 6. Port Scan Detection
-    if SCAPY_AVAILABLE and scapy_analysis:
-        # Check for many connections to different ports from same source
-        src_port_map = defaultdict(set)
-        for conv in scapy_analysis['conversations'].keys():
-            parts = conv.split(' <-> ')
-            if len(parts) == 2:
-                src = parts[0].split(':')[0]
-                dst_port = parts[1].split(':')[1]
-                src_port_map[src].add(dst_port)
-        
-        for src, ports in src_port_map.items():
-            if len(ports) > 50:
-                ddos_indicators.append(f"🔴 PORT SCAN: {src} scanned {len(ports)} different ports")
-                ddos_score += 2
-                break
+    if scans:
+        top = scans[0]
+        unit = 'ports on' if top['kind'] == 'vertical' else 'hosts via'
+        ddos_indicators.append(f"🔴 PORT SCAN: {top['source']} probed {top['distinct']:,} {unit} {top['target']} "
+                               f"({top['kind'].replace('_', ' ')}, {len(scans)} episode(s) total)")
+        ddos_score += 2
     
     # 7. Packet Rate Analysis
     if SCAPY_AVAILABLE and scapy_analysis and len(scapy_analysis.get('timestamps', [])) > 1:
@@ -1558,6 +2856,10 @@ Common Flag Combinations:
     else:
         print("\n  ✓ No DDoS indicators detected - Traffic appears normal")
     
+    # Sources that behaved alike (botnet groups) - useful in DDoS post-mortems
+    if SCAPY_AVAILABLE and scapy_analysis:
+        print_source_clusters(capture_clusters(scapy_analysis))
+    
     # SUMMARY
     print("\n" + "="*100)
     print("EXECUTIVE SUMMARY")
@@ -1748,7 +3050,7 @@ Common Flag Combinations:
         print("🎨 GENERATING VISUAL OUTPUTS")
         print("="*100)
         
-        base_name = Path(pcap_file).stem
+        base_name = capture_stem(pcap_file)
         
         # Generate network diagram
         network_diagram = f"{base_name}_network_diagram.png"
@@ -1772,7 +3074,22 @@ Common Flag Combinations:
     
     print()
 
+def diff_main(argv):
+    """Entry point for: pcap_analyzer_v3.py diff BASELINE CAPTURE [CAPTURE ...]"""
+    parser = argparse.ArgumentParser(
+        prog='pcap_analyzer_v3.py diff',
+        description='Compare captures against a baseline using cached analysis summaries')
+    parser.add_argument('baseline', help='Baseline pcap (or its _summary.json)')
+    parser.add_argument('captures', nargs='+', help='Captures (or _summary.json files) to compare')
+    args = parser.parse_args(argv)
+    diff_captures(args.baseline, args.captures)
+
 if __name__ == '__main__':
+    subcommands = {'diff': diff_main, 'ingest': ingest_main, 'query': query_main}
+    if len(sys.argv) > 1 and sys.argv[1] in subcommands:
+        subcommands[sys.argv[1]](sys.argv[2:])
+        sys.exit(0)
+    
     parser = argparse.ArgumentParser(
         description='Advanced PCAP Analyzer v4 - Enhanced Edition',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -1795,10 +3112,38 @@ Examples:
   
   # Full analysis with all features
   python3 pcap_analyzer_v3.py capture.pcap --visual --whois --tor --export-json
+  
+  # Quick triage of a huge capture (1% of flows, estimates with error bounds)
+  python3 pcap_analyzer_v3.py huge.pcap --sample flow --sample-rate 100
+  
+  # Live numbers from a capture tcpdump is still writing (or a rotation directory)
+  python3 pcap_analyzer_v3.py /var/captures/ --follow --interval 10 --export-json
+  
+  # Compare captures against a baseline (uses cached summaries, no re-parsing)
+  python3 pcap_analyzer_v3.py diff baseline.pcap incident.pcap [more.pcap ...]
+  
+  # Bounded memory on scan/flood captures (top-10000 per table)
+  python3 pcap_analyzer_v3.py flood.pcap --sketch --sketch-capacity 10000
+  
+  # Per-second pps/bps/flags per protocol and top-20 host for dashboards
+  python3 pcap_analyzer_v3.py capture.pcap --buckets --bucket-hosts 20
+  
+  # Several mirror sessions / rotated files as one timeline (no mergecap copy)
+  python3 pcap_analyzer_v3.py mirror_a.pcap mirror_b.pcap mirror_c.pcap
+  
+  # Exact results on a capture with more flows than fit in RAM
+  python3 pcap_analyzer_v3.py huge.pcap --max-memory 2G
+  
+  # SQL over flows: ingest captures once, then run canned or ad-hoc queries
+  python3 pcap_analyzer_v3.py ingest flows.db day1/*.pcap
+  python3 pcap_analyzer_v3.py query flows.db talkers --capture incident.pcap
+  python3 pcap_analyzer_v3.py query flows.db "SELECT * FROM flows WHERE port_b = 443"
         """
     )
     
-    parser.add_argument('pcap_file', help='PCAP file to analyze')
+    parser.add_argument('pcap_file', nargs='+',
+                       help='PCAP file(s) to analyze; several are merged by timestamp '
+                            '(with --follow: one file or rotation directory)')
     parser.add_argument('--export-json', action='store_true', 
                        help='Export analysis to JSON file')
     parser.add_argument('--visual', action='store_true',
@@ -1807,11 +3152,69 @@ Examples:
                        help='Perform whois lookups for top IPs (slower)')
     parser.add_argument('--tor', action='store_true',
                        help='Check for Tor exit nodes in traffic')
+    parser.add_argument('--sample', choices=sorted(SAMPLE_MODES),
+                       help='Sampled triage: packet (1-in-N), flow (whole flows) or time (time slices)')
+    parser.add_argument('--sample-rate', type=int, default=100, metavar='N',
+                       help='Keep 1 in N packets/flows/slices (default: 100)')
+    parser.add_argument('--sample-slice', type=float, default=1.0, metavar='SECONDS',
+                       help='Time-slice width for --sample time (default: 1.0)')
+    
+    parser.add_argument('--follow', action='store_true',
+                       help='Tail a growing pcap (or directory of rotated pcaps) and refresh live results')
+    parser.add_argument('--interval', type=float, default=5.0, metavar='SECONDS',
+                       help='Refresh interval for --follow (default: 5)')
+    parser.add_argument('--sketch', action='store_true',
+                       help='Bounded-memory top talkers/ports/conversations (SpaceSaving + HyperLogLog)')
+    parser.add_argument('--sketch-capacity', type=int, default=5000, metavar='K',
+                       help='Entries kept per sketched table (default: 5000)')
+    parser.add_argument('--sketch-precision', type=int, default=14, metavar='P',
+                       help='HyperLogLog precision, 2^P bytes per table (4-18, default: 14)')
+    parser.add_argument('--buckets', action='store_true',
+                       help='Export per-interval packets/bytes/new flows/flags per protocol and top host (CSV + .npz)')
+    parser.add_argument('--bucket-interval', type=float, default=1.0, metavar='SECONDS',
+                       help='Bucket width for --buckets (default: 1.0)')
+    parser.add_argument('--bucket-hosts', type=int, default=10, metavar='K',
+                       help='Top hosts (by bytes) broken out in --buckets (default: 10)')
+    parser.add_argument('--max-memory', type=parse_size, metavar='SIZE',
+                       help='Memory budget for flow tables, e.g. 2G; past it they spill to disk (exact results)')
     
     args = parser.parse_args()
     
-    analyze_pcap(args.pcap_file, 
-                export_json=args.export_json,
-                enable_whois=args.whois,
-                enable_tor=args.tor,
-                enable_visual=args.visual)
+    if args.sample_rate < 1:
+        parser.error('--sample-rate must be at least 1')
+    if args.sketch_capacity < 1 or not 4 <= args.sketch_precision <= 18:
+        parser.error('--sketch-capacity must be at least 1 and --sketch-precision between 4 and 18')
+    if args.bucket_interval <= 0 or args.bucket_hosts < 0:
+        parser.error('--bucket-interval must be positive and --bucket-hosts non-negative')
+    if args.max_memory is not None and args.sketch:
+        parser.error('--max-memory keeps exact tables; it cannot be combined with --sketch')
+    
+    sample = None
+    if args.sample:
+        sample = {'mode': args.sample, 'rate': args.sample_rate, 'slice_seconds': args.sample_slice}
+    
+    sketch = None
+    if args.sketch:
+        sketch = {'capacity': args.sketch_capacity, 'precision': args.sketch_precision}
+    
+    buckets = None
+    if args.buckets:
+        buckets = {'interval': args.bucket_interval, 'top_hosts': args.bucket_hosts}
+    
+    if args.follow and len(args.pcap_file) > 1:
+        parser.error('--follow takes a single capture file or rotation directory')
+    pcap_file = args.pcap_file[0] if len(args.pcap_file) == 1 else args.pcap_file
+    
+    if args.follow:
+        follow_capture(pcap_file, interval=args.interval, export_json=args.export_json,
+                       sketch=sketch, max_memory=args.max_memory, buckets=buckets)
+    else:
+        analyze_pcap(pcap_file,
+                    export_json=args.export_json,
+                    enable_whois=args.whois,
+                    enable_tor=args.tor,
+                    enable_visual=args.visual,
+                    sample=sample,
+                    sketch=sketch,
+                    max_memory=args.max_memory,
+                    buckets=buckets)
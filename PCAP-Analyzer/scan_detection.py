@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Scan Detection Module
+Linear-time port-scan detection over a per-source index of probed hosts and
+ports in time windows: vertical scans, horizontal scans and SYN sweeps
+"""
+
+import heapq
+
+from sketches import DistinctCounter
+
+# Probes from one source are grouped into windows of this many seconds
+SCAN_WINDOW = 60.0
+
+# Distinct ports on a single host (vertical) / hosts on a single port (horizontal)
+VERTICAL_PORTS = 20
+HORIZONTAL_HOSTS = 20
+
+# A source reaching many hosts with mostly unanswered bare SYNs is sweeping
+SWEEP_UNANSWERED = 0.5
+
+# Bound on tracked sources; idle sources without findings are pruned first
+MAX_SCAN_SOURCES = 200000
+PRUNE_EVERY = 100000
+
+# Bound on the per-window host -> ports and port -> hosts tables of one
+# source; past it the half with the fewest distinct targets is dropped
+MAX_WINDOW_TARGETS = 4096
+
+SCAN_KINDS = {
+    'vertical': 'Vertical scan (many ports, one host)',
+    'horizontal': 'Horizontal scan (one port, many hosts)',
+    'syn_sweep': 'SYN sweep (many hosts, mostly unanswered)'
+}
+
+
+class SourceState:
+    """Per-source index: lifetime cardinality sketches plus the open window
+
+    A source that has sent a single probe only keeps that probe; the
+    sketches and window tables are built when a second probe arrives, so a
+    spoofed-source SYN flood costs one small object per source. The window
+    tables hold at most MAX_WINDOW_TARGETS entries each: a sweep of many
+    hosts leaves one-port entries that are trimmed away, while the entries
+    that can reach a scan threshold keep counting (a trimmed entry that
+    comes back starts over, so it undercounts by what it had).
+    """
+    __slots__ = ('first_seen', 'last_seen', 'probes', 'syns', 'answered', 'ports', 'hosts',
+                 'window_start', 'window_end', 'host_ports', 'port_hosts', 'window_hosts',
+                 'window_probes', 'window_syns', 'window_answered', 'episodes', 'first_probe')
+
+    def __init__(self, ts, service, dst):
+        self.first_seen = self.last_seen = self.window_start = self.window_end = ts
+        self.probes = self.syns = self.answered = 0
+        self.window_probes = self.window_syns = self.window_answered = 0
+        self.ports = self.hosts = self.host_ports = self.port_hosts = self.window_hosts = None
+        self.episodes = []
+        self.first_probe = (service, dst)
+
+    @property
+    def indexed(self):
+        return self.ports is not None
+
+    def build_index(self):
+        """Allocate the sketches and window tables, indexing the remembered first probe"""
+        self.ports = DistinctCounter()
+        self.hosts = DistinctCounter()
+        probes, syns, answered = self.window_probes, self.window_syns, self.window_answered
+        self.open_window(self.window_start)
+        self.window_probes, self.window_syns, self.window_answered = probes, syns, answered
+        self.index(*self.first_probe)
+        self.first_probe = None
+
+    def open_window(self, ts):
+        self.window_start = self.window_end = ts
+        self.host_ports = {}
+        self.port_hosts = {}
+        self.window_hosts = DistinctCounter()
+        self.window_probes = self.window_syns = self.window_answered = 0
+
+    def index(self, service, dst):
+        self.ports.add(service)
+        self.hosts.add(dst)
+        self.window_hosts.add(dst)
+        ports = self.host_ports.get(dst)
+        if ports is None:
+            if len(self.host_ports) >= MAX_WINDOW_TARGETS:
+                self.host_ports = _trim(self.host_ports)
+            ports = self.host_ports[dst] = DistinctCounter()
+        ports.add(service)
+        hosts = self.port_hosts.get(service)
+        if hosts is None:
+            if len(self.port_hosts) >= MAX_WINDOW_TARGETS:
+                self.port_hosts = _trim(self.port_hosts)
+            hosts = self.port_hosts[service] = DistinctCounter()
+        hosts.add(dst)
+
+
+def _trim(targets):
+    """Keep the half of a window table with the most distinct values (ties: most recent)"""
+    keep = heapq.nlargest(MAX_WINDOW_TARGETS // 2, enumerate(targets.items()),
+                          key=lambda item: (len(item[1][1]), item[0]))
+    return dict(item for _, item in sorted(keep))
+
+
+class ScanDetector:
+    """
+    Streaming scan detector fed one packet at a time by observe()
+
+    Probes are bare SYNs, other ACK-less TCP probes (FIN/NULL/Xmas) and UDP
+    packets towards a lower port than they came from (client -> service).
+    Each source keeps, for its current window, distinct ports per target
+    host and distinct hosts per target port; these are small exact sets that
+    turn into HyperLogLogs once large, so every packet costs O(1) and memory
+    stays bounded on big sweeps. When a window closes it is classified and
+    consecutive windows with the same finding merge into one episode.
+    """
+
+    def __init__(self, window=SCAN_WINDOW, vertical_ports=VERTICAL_PORTS,
+                 horizontal_hosts=HORIZONTAL_HOSTS, max_sources=MAX_SCAN_SOURCES):
+        self.window = window
+        self.vertical_ports = vertical_ports
+        self.horizontal_hosts = horizontal_hosts
+        self.max_sources = max_sources
+        self.sources = {}
+        self.observed = 0
+        self.untracked = 0
+
+    def observe(self, ts, proto, src, dst, sport, dport, flags=0):
+        """Index one TCP/UDP packet (flags are the TCP flag bits)"""
+        if proto == 'TCP':
+            if flags & 0x12 == 0x12:  # SYN-ACK answers a probe from dst
+                state = self.sources.get(dst)
+                if state is not None:
+                    state.answered += 1
+                    state.window_answered += 1
+                return
+            if flags & 0x14:  # ACK or RST - not a probe
+                return
+        elif dport >= sport:
+            return
+
+        self.observed += 1
+        if self.observed % PRUNE_EVERY == 0:
+            self._prune(ts)
+
+        service = (proto, dport)
+        state = self.sources.get(src)
+        if state is None:
+            if len(self.sources) >= self.max_sources:
+                self.untracked += 1
+                return
+            state = self.sources[src] = SourceState(ts, service, dst)
+        else:
+            if not state.indexed:
+                state.build_index()
+            if ts - state.window_start >= self.window:
+                self._close_window(state)
+                state.open_window(ts)
+            state.index(service, dst)
+
+        state.last_seen = state.window_end = ts
+        state.probes += 1
+        state.window_probes += 1
+        if flags & 0x02:
+            state.syns += 1
+            state.window_syns += 1
+
+    def _classify(self, state):
+        """Findings for the open window: list of (kind, target, distinct count)
+
+        target is the scanned host (vertical), proto/port (horizontal) or '*'
+        (SYN sweep, whatever ports were used)
+        """
+        findings = []
+        if not state.indexed:
+            return findings
+        # Sketch estimates can exceed the probes that produced them
+        probes = state.window_probes
+        if state.host_ports:
+            host, ports = max(state.host_ports.items(), key=lambda kv: len(kv[1]))
+            if min(len(ports), probes) >= self.vertical_ports:
+                findings.append(('vertical', host, min(len(ports), probes)))
+        if state.port_hosts:
+            (proto, port), hosts = max(state.port_hosts.items(), key=lambda kv: len(kv[1]))
+            if min(len(hosts), probes) >= self.horizontal_hosts:
+                findings.append(('horizontal', f"{proto.lower()}/{port}", min(len(hosts), probes)))
+        if state.window_syns and min(len(state.window_hosts), probes) >= self.horizontal_hosts:
+            unanswered = 1 - min(state.window_answered, state.window_syns) / state.window_syns
+            if unanswered >= SWEEP_UNANSWERED:
+                findings.append(('syn_sweep', '*', min(len(state.window_hosts), probes)))
+        return findings
+
+    def _episodes(self, state, findings, episodes):
+        """Merge window findings into episodes (extending the previous window's)"""
+        for kind, target, distinct in findings:
+            for episode in reversed(episodes):
+                if (episode['kind'] == kind and episode['target'] == target
+                        and state.window_start - episode['end'] <= self.window):
+                    episode['end'] = state.window_end
+                    episode['distinct'] = max(episode['distinct'], distinct)
+                    episode['probes'] += state.window_probes
+                    episode['syns'] += state.window_syns
+                    episode['answered'] += state.window_answered
+                    break
+            else:
+                episodes.append({
+                    'kind': kind, 'target': target, 'distinct': distinct,
+                    'start': state.window_start, 'end': state.window_end,
+                    'probes': state.window_probes, 'syns': state.window_syns,
+                    'answered': state.window_answered
+                })
+        return episodes
+
+    def _close_window(self, state):
+        self._episodes(state, self._classify(state), state.episodes)
+
+    def _prune(self, now):
+        """Drop sources idle for a full window that never produced a finding"""
+        idle = [src for src, state in self.sources.items()
+                if now - state.last_seen > self.window and not state.episodes and not self._classify(state)]
+        for src in idle:
+            del self.sources[src]
+
+    def scans(self):
+        """All scan episodes, including still-open windows, most distinct targets first"""
+        results = []
+        for src, state in self.sources.items():
+            episodes = [dict(episode) for episode in state.episodes]
+            self._episodes(state, self._classify(state), episodes)
+            for episode in episodes:
+                episode.update(source=src, total_ports=min(len(state.ports), state.probes),
+                               total_hosts=min(len(state.hosts), state.probes))
+                results.append(episode)
+        return sorted(results, key=lambda e: e['distinct'], reverse=True)
+
+
+def print_scan_analysis(scans, limit=10):
+    """Print scan episodes grouped by kind"""
+    if not scans:
+        print("\n  ✓ No port scans detected")
+        return
+
+    for kind, label in SCAN_KINDS.items():
+        episodes = [e for e in scans if e['kind'] == kind]
+        if not episodes:
+            continue
+        print(f"\n  📍 {label}: {len(episodes)} episode(s)")
+        for e in episodes[:limit]:
+            unit = 'ports' if kind == 'vertical' else 'hosts'
+            answered = f", {e['answered']}/{e['syns']} SYNs answered" if e['syns'] else ""
+            print(f"    {e['source']:<18} -> {e['target']:<18} {e['distinct']:>6,} {unit} "
+                  f"in {e['end'] - e['start']:.1f}s ({e['probes']:,} probes{answered})")
+
+
+if __name__ == '__main__':
+    print("Scan Detection Module")
+    print("Import this module into pcap_analyzer_v3.py")
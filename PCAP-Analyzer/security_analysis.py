@@ -4,36 +4,287 @@ Security Analysis Module
 Detects security issues, firewall blocks, and attack patterns
 """
 
-from collections import Counter, defaultdict
-from scapy.all import IP, TCP, UDP, ICMP
+from collections import Counter
+from datetime import datetime
+from scapy.all import IP, TCP, UDP, ICMP, IPerror, TCPerror, Raw
 
-def analyze_security(packets):
+from flood_detection import (FLOOD_KINDS, FLOOD_SCOPES, FLOOD_THRESHOLDS, FLOOD_WINDOWS, NUMPY_AVAILABLE,
+                             detect_floods)
+from flow_table import PROTO_NUMBERS, flow_key, int_to_ip, ip_to_int
+from signatures import SIGNATURES, register_signatures
+from sketches import DistinctCounter, Reservoir, SpaceSaving
+from timeseries import FLAG_SYN, PROTO_CODES, PacketColumns
+
+# An unanswered SYN is given up on after one to two of these windows
+SYN_TIMEOUT = 30.0
+
+# ICMP unreachable codes sent by filtering devices (net/host/admin prohibited)
+ICMP_PROHIBITED_CODES = (9, 10, 13)
+
+# A RST whose TTL differs from the sender's other packets by more than this
+# was sent by something in the path rather than the endpoint
+RST_TTL_TOLERANCE = 3
+
+# Flows with ACKed traffic are remembered for one to two of these windows
+RST_FLOW_TIMEOUT = 300.0
+
+# Memory bounds: rows per outcome table, tracked scan sources, RST tables
+MAX_OUTCOME_ROWS = 100000
+MAX_SCAN_SOURCES = 200000
+MAX_RST_ROWS = 5000
+MAX_TTL_HOSTS = 100000
+MAX_ACTIVE_FLOWS = 200000
+RST_SAMPLES_PER_PATTERN = 20
+MAX_PAYLOAD_ROWS = 10000
+PAYLOAD_SAMPLES = 3
+
+CONNECTION_OUTCOMES = {
+    'unanswered': 'SYN without any response (security group / NACL drop)',
+    'refused': 'SYN answered with RST (port closed or RST-injecting firewall)',
+    'prohibited': 'SYN answered with ICMP administratively prohibited',
+    'unreachable': 'SYN answered with another ICMP unreachable'
+}
+
+RST_PATTERNS = {
+    'middlebox': 'TTL unlike the sender\'s other packets (injected by firewall/IPS/load balancer)',
+    'after_syn': 'RST answering a SYN (port closed or firewall reject)',
+    'seq_zero': 'Sequence number 0 outside a handshake (forged or appliance RST)',
+    'mid_stream': 'RST in an established flow (application abort or idle timeout)',
+    'no_flow': 'RST for a flow not seen carrying traffic (stale flow or backscatter)'
+}
+
+# Payload signatures, matched by the shared engine in signatures.py
+SECURITY_SIGNATURES = {
+    'security.scanner': (b'sqlmap', b'Nikto', b'Nmap Scripting Engine', b'masscan', b'zgrab', b'Nuclei'),
+    'security.path_traversal': (b'../../', b'..%2f..%2f', b'..%2F..%2F', b'/etc/passwd'),
+    'security.sql_injection': (b'UNION SELECT', b'union select', b"' OR '1'='1", b"' or '1'='1"),
+    'security.jndi_lookup': (b'${jndi:', b'${JNDI:'),
+    'security.shell': (b'/bin/sh -c', b'/bin/bash -c', b'cmd.exe /c', b'powershell -e'),
+    'security.basic_auth': (b'Authorization: Basic ',)
+}
+register_signatures(SECURITY_SIGNATURES)
+
+SUSPICIOUS_PAYLOADS = {
+    'security.scanner': 'Vulnerability scanner user agent',
+    'security.path_traversal': 'Path traversal attempt',
+    'security.sql_injection': 'SQL injection attempt',
+    'security.jndi_lookup': 'JNDI lookup (Log4Shell) attempt',
+    'security.shell': 'Shell command in payload',
+    'security.basic_auth': 'Cleartext HTTP Basic credentials'
+}
+
+
+class ConnectionTracker:
+    """
+    Outcome of every TCP connection attempt, keyed by the canonical flow key
+    (flow_table.flow_key) so the SYN-ACK, RST or quoted ICMP error of the
+    responder lands on the same entry as the SYN.
+
+    Only SYNs still waiting for an answer are held, each as one int
+    (syn count << 1 | initiator-is-side-A). Answered attempts are evicted at
+    once; pending ones live in two time generations of SYN_TIMEOUT seconds
+    and expire as unanswered when their generation is retired. Outcomes are
+    aggregated per destination service, so memory follows the number of
+    services and in-flight SYNs rather than the number of SYNs.
+    """
+
+    def __init__(self):
+        self.current = {}
+        self.previous = {}
+        self.generation_start = None
+        self.counts = Counter()
+        self.outcomes = {kind: {} for kind in CONNECTION_OUTCOMES}
+        self.dropped_rows = 0
+
+    def _rotate(self, ts):
+        if self.generation_start is None:
+            self.generation_start = ts
+        elif ts - self.generation_start >= SYN_TIMEOUT:
+            self.expire(self.previous)
+            self.previous, self.current = self.current, {}
+            self.generation_start = ts
+
+    def _pop(self, key):
+        value = self.current.pop(key, None)
+        if value is None:
+            value = self.previous.pop(key, None)
+        return value
+
+    def syn(self, ts, src, sport, dst, dport):
+        self._rotate(ts)
+        key, forward = flow_key(PROTO_NUMBERS['TCP'], src, sport, dst, dport)
+        value = self._pop(key)
+        self.current[key] = (value + 2) if value is not None else (2 | forward)
+
+    def answer(self, ts, src, sport, dst, dport, outcome=None):
+        """Answer to a pending SYN: SYN-ACK (outcome None), RST or ICMP error
+
+        src/sport is the responder - the sender of a SYN-ACK/RST, or the
+        destination of the SYN quoted in an ICMP error. Returns True if it
+        answered a pending SYN.
+        """
+        self._rotate(ts)
+        key, forward = flow_key(PROTO_NUMBERS['TCP'], src, sport, dst, dport)
+        value = self.current.get(key)
+        if value is None:
+            value = self.previous.get(key)
+        if value is None or (value & 1) == forward:  # nothing pending, or sent by the initiator
+            return False
+        self._pop(key)
+        self.counts['answered' if outcome is None else outcome] += 1
+        if outcome is not None:
+            self._record(outcome, dst, src, sport, value >> 1)
+        return True
+
+    def _record(self, outcome, client, server, port, syns):
+        table = self.outcomes[outcome]
+        row = table.get((server, port))
+        if row is None:
+            if len(table) >= MAX_OUTCOME_ROWS:
+                self.dropped_rows += 1
+                return
+            # syns, flows, first client, distinct clients
+            row = table[(server, port)] = [0, 0, client, DistinctCounter()]
+        row[0] += syns
+        row[1] += 1
+        row[3].add(client)
+
+    def expire(self, generation):
+        """Record every SYN left in a generation as unanswered"""
+        for key, value in generation.items():
+            ip_a, port_a = (key >> 64) & 0xffffffff, (key >> 48) & 0xffff
+            ip_b, port_b = (key >> 16) & 0xffffffff, key & 0xffff
+            if value & 1:
+                client, server, port = ip_a, ip_b, port_b
+            else:
+                client, server, port = ip_b, ip_a, port_a
+            self.counts['unanswered'] += 1
+            self._record('unanswered', client, server, port, value >> 1)
+        generation.clear()
+
+    def finish(self):
+        self.expire(self.previous)
+        self.expire(self.current)
+
+    def rows(self, outcome):
+        """Outcome rows, most attempted services first"""
+        rows = [{'dst': f"{int_to_ip(server)}:{port}", 'src': int_to_ip(first_client), 'syn_count': syns,
+                 'flows': flows, 'sources': len(clients)}
+                for (server, port), (syns, flows, first_client, clients) in self.outcomes[outcome].items()]
+        return sorted(rows, key=lambda row: row['syn_count'], reverse=True)
+
+
+class RstTracker:
+    """
+    Aggregated RST classification with flat memory during RST storms
+
+    Each RST gets one of RST_PATTERNS, checked in that order: TTL mismatch
+    against the sender's last non-RST packet, answer to a pending SYN,
+    sequence number 0, a flow seen with ACKed traffic in the last one to two
+    RST_FLOW_TIMEOUT windows, or none of these. Counts per (source,
+    destination port, pattern) go to a SpaceSaving table and each pattern
+    keeps a reservoir of raw examples.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.pattern_counts = Counter()
+        self.by_source = SpaceSaving(MAX_RST_ROWS)
+        self.by_dest_port = Counter()
+        self.rows = SpaceSaving(MAX_RST_ROWS)
+        self.samples = {pattern: Reservoir(RST_SAMPLES_PER_PATTERN, seed=index)
+                        for index, pattern in enumerate(RST_PATTERNS)}
+        self.host_ttl = {}
+        self.current = set()
+        self.previous = set()
+        self.generation_start = None
+
+    def _rotate(self, ts):
+        if self.generation_start is None:
+            self.generation_start = ts
+        elif ts - self.generation_start >= RST_FLOW_TIMEOUT:
+            self.previous, self.current = self.current, set()
+            self.generation_start = ts
+
+    def packet(self, ts, src, ttl, key, flags):
+        """Any non-RST TCP packet: remember the sender's TTL and flows with ACKed traffic"""
+        self._rotate(ts)
+        if src in self.host_ttl or len(self.host_ttl) < MAX_TTL_HOSTS:
+            self.host_ttl[src] = ttl
+        if flags & 0x10 and key not in self.current and len(self.current) < MAX_ACTIVE_FLOWS:
+            self.current.add(key)
+
+    def rst(self, ts, src, sport, dst, dport, seq, ttl, key, after_syn):
+        self._rotate(ts)
+        expected = self.host_ttl.get(src)
+        if expected is not None and abs(ttl - expected) > RST_TTL_TOLERANCE:
+            pattern = 'middlebox'
+        elif after_syn:
+            pattern = 'after_syn'
+        elif seq == 0:
+            pattern = 'seq_zero'
+        elif key in self.current or key in self.previous:
+            pattern = 'mid_stream'
+        else:
+            pattern = 'no_flow'
+
+        self.total += 1
+        self.pattern_counts[pattern] += 1
+        self.by_source.add(src)
+        self.by_dest_port[dport] += 1
+        self.rows.add((src, dport, pattern))
+        self.samples[pattern].add({'src': src, 'sport': sport, 'dst': dst, 'port': dport, 'seq': seq,
+                                   'ttl': ttl, 'expected_ttl': expected, 'time': ts})
+
+    def report(self):
+        return {
+            'total': self.total,
+            'by_source': self.by_source,
+            'by_dest_port': self.by_dest_port,
+            'pattern_counts': self.pattern_counts,
+            'top_patterns': [{'src': src, 'port': port, 'pattern': pattern, 'count': count}
+                             for (src, port, pattern), count in self.rows.most_common(50)],
+            'samples': {pattern: list(reservoir) for pattern, reservoir in self.samples.items() if len(reservoir)}
+        }
+
+
+def analyze_security(packets, flood_windows=FLOOD_WINDOWS, flood_thresholds=None):
     """
     Analyze security issues and attack patterns
     Returns dict with security analysis
+
+    packets may be any iterable (e.g. a PcapReader); it is read once and
+    per-packet state is bounded, so huge captures can be streamed through.
+    flood_windows / flood_thresholds configure flood detection (see
+    flood_detection.detect_floods); without numpy the per-second maximum is
+    compared against the aggregate thresholds instead.
     """
     
     security = {
         'security_group_blocks': [],
         'nacl_blocks': [],
-        'tcp_rst_analysis': {
-            'total': 0,
-            'by_source': Counter(),
-            'by_dest_port': Counter(),
-            'patterns': []
-        },
+        'refused_connections': [],
+        'prohibited_connections': [],
+        'unreachable_connections': [],
+        'connection_outcomes': Counter(),
+        'tcp_rst_analysis': {},
         'ddos_indicators': {
             'syn_flood': False,
             'udp_flood': False,
             'icmp_flood': False,
             'dns_amplification': False
         },
+        'flood_episodes': [],
         'port_scans': [],
         'suspicious_activity': []
     }
     
-    # Track TCP connections
-    tcp_connections = defaultdict(lambda: {'syn': 0, 'synack': 0, 'rst': 0, 'fin': 0})
+    # Track TCP connection attempts and resets
+    connections = ConnectionTracker()
+    resets = RstTracker()
+    
+    # Timestamp columns of SYN/UDP/ICMP packets for the sliding-window flood detectors
+    flood_columns = PacketColumns()
     
     # Track packet rates
     packet_rates = {
@@ -42,65 +293,75 @@ def analyze_security(packets):
         'icmp_per_second': Counter()
     }
     
-    # Track port scan attempts
-    port_scan_tracker = defaultdict(set)  # src_ip -> set of dst_ports
+    # Track port scan attempts: src_ip -> [distinct dst ports, first 10 ports]
+    port_scan_tracker = {}
+    
+    # Payload signature hits: (signature, src, dst, port) -> packets, plus excerpts
+    payload_hits = Counter()
+    payload_samples = {}
     
     for pkt in packets:
         if not IP in pkt:
             continue
         
-        timestamp = int(pkt.time)
+        pkt_time = float(pkt.time)
+        timestamp = int(pkt_time)
         src_ip = pkt[IP].src
         dst_ip = pkt[IP].dst
         
         # TCP Analysis
         if TCP in pkt:
+            sport = pkt[TCP].sport
             dst_port = pkt[TCP].dport
-            flags = pkt[TCP].flags
-            conn_key = f"{src_ip}:{pkt[TCP].sport}-{dst_ip}:{dst_port}"
+            flags = int(pkt[TCP].flags)
+            key, _ = flow_key(PROTO_NUMBERS['TCP'], ip_to_int(src_ip), sport, ip_to_int(dst_ip), dst_port)
+            if not flags & 0x04:
+                resets.packet(pkt_time, src_ip, pkt[IP].ttl, key, flags)
             
             # Track SYN packets
             if flags & 0x02 and not flags & 0x10:  # SYN, no ACK
-                tcp_connections[conn_key]['syn'] += 1
+                connections.syn(pkt_time, ip_to_int(src_ip), sport, ip_to_int(dst_ip), dst_port)
                 packet_rates['syn_per_second'][timestamp] += 1
+                flood_columns.append(pkt_time, 0, PROTO_CODES['TCP'], FLAG_SYN, ip_to_int(src_ip), ip_to_int(dst_ip))
                 
                 # Track potential port scan
-                port_scan_tracker[src_ip].add(dst_port)
+                tracked = port_scan_tracker.get(src_ip)
+                if tracked is None and len(port_scan_tracker) < MAX_SCAN_SOURCES:
+                    tracked = port_scan_tracker[src_ip] = [DistinctCounter(), []]
+                if tracked is not None:
+                    tracked[0].add(dst_port)
+                    if len(tracked[1]) < 10 and dst_port not in tracked[1]:
+                        tracked[1].append(dst_port)
             
             # Track SYN-ACK packets
             if flags & 0x12 == 0x12:  # SYN+ACK
-                tcp_connections[conn_key]['synack'] += 1
+                connections.answer(pkt_time, ip_to_int(src_ip), sport, ip_to_int(dst_ip), dst_port)
             
             # Track RST packets
             if flags & 0x04:  # RST
-                tcp_connections[conn_key]['rst'] += 1
-                security['tcp_rst_analysis']['total'] += 1
-                security['tcp_rst_analysis']['by_source'][src_ip] += 1
-                security['tcp_rst_analysis']['by_dest_port'][dst_port] += 1
-                
-                # Categorize RST pattern
-                if pkt[TCP].seq == 0:
-                    pattern = 'Firewall/Security Appliance RST'
-                elif dst_port < 1024:
-                    pattern = 'Service not listening'
-                else:
-                    pattern = 'Connection refused'
-                
-                security['tcp_rst_analysis']['patterns'].append({
-                    'src': src_ip,
-                    'dst': dst_ip,
-                    'port': dst_port,
-                    'pattern': pattern,
-                    'time': pkt.time
-                })
-            
-            # Track FIN packets
-            if flags & 0x01:  # FIN
-                tcp_connections[conn_key]['fin'] += 1
+                after_syn = connections.answer(pkt_time, ip_to_int(src_ip), sport, ip_to_int(dst_ip), dst_port,
+                                               'refused')
+                resets.rst(pkt_time, src_ip, sport, dst_ip, dst_port, pkt[TCP].seq, pkt[IP].ttl, key, after_syn)
+        
+        # Payload signatures (one pass over the raw bytes for all of them)
+        if Raw in pkt and (TCP in pkt or UDP in pkt):
+            load = pkt[Raw].load
+            port = pkt[TCP].dport if TCP in pkt else pkt[UDP].dport
+            for name, offset in SIGNATURES.scan(load).items():
+                if name not in SUSPICIOUS_PAYLOADS:
+                    continue
+                row = (name, src_ip, dst_ip, port)
+                if row in payload_hits or len(payload_hits) < MAX_PAYLOAD_ROWS:
+                    payload_hits[row] += 1
+                samples = payload_samples.setdefault(name, [])
+                if len(samples) < PAYLOAD_SAMPLES:
+                    samples.append(f"{src_ip} → {dst_ip}:{port} "
+                                   f"{load[offset:offset + 60].decode('utf-8', errors='replace')!r}")
         
         # UDP Analysis
         if UDP in pkt:
             packet_rates['udp_per_second'][timestamp] += 1
+            flood_columns.append(pkt_time, 0, PROTO_CODES['UDP'], 0, ip_to_int(src_ip), ip_to_int(dst_ip))
             
             # DNS amplification detection
             if pkt[UDP].sport == 53 and len(pkt) > 512:
@@ -109,44 +370,66 @@ def analyze_security(packets):
         # ICMP Analysis
         if ICMP in pkt:
             packet_rates['icmp_per_second'][timestamp] += 1
+            flood_columns.append(pkt_time, 0, PROTO_CODES['ICMP'], 0, ip_to_int(src_ip), ip_to_int(dst_ip))
+            
+            # Unreachable quoting a SYN: the error answers that connection attempt
+            if pkt[ICMP].type == 3 and TCPerror in pkt:
+                quoted, quoted_tcp = pkt[IPerror], pkt[TCPerror]
+                outcome = 'prohibited' if pkt[ICMP].code in ICMP_PROHIBITED_CODES else 'unreachable'
+                connections.answer(pkt_time, ip_to_int(quoted.dst), quoted_tcp.dport,
+                                   ip_to_int(quoted.src), quoted_tcp.sport, outcome)
     
-    # Post-processing: Detect security group blocks
-    for conn_key, counts in tcp_connections.items():
-        if counts['syn'] > 0 and counts['synack'] == 0 and counts['rst'] == 0:
-            # SYN without response = likely security group block
-            parts = conn_key.split('-')
-            src = parts[0]
-            dst = parts[1]
-            security['security_group_blocks'].append({
-                'src': src,
-                'dst': dst,
-                'syn_count': counts['syn']
-            })
+    # Post-processing: classify connection attempts
+    connections.finish()
+    security['connection_outcomes'] = connections.counts
+    security['security_group_blocks'] = connections.rows('unanswered')
+    security['refused_connections'] = connections.rows('refused')
+    security['prohibited_connections'] = connections.rows('prohibited')
+    security['unreachable_connections'] = connections.rows('unreachable')
+    security['tcp_rst_analysis'] = resets.report()
     
     # Detect DDoS patterns
-    max_syn_rate = max(packet_rates['syn_per_second'].values()) if packet_rates['syn_per_second'] else 0
-    max_udp_rate = max(packet_rates['udp_per_second'].values()) if packet_rates['udp_per_second'] else 0
-    max_icmp_rate = max(packet_rates['icmp_per_second'].values()) if packet_rates['icmp_per_second'] else 0
+    if NUMPY_AVAILABLE:
+        for episode in detect_floods(flood_columns, flood_windows, flood_thresholds):
+            # One busy source alone is more likely a scan than a flood
+            if episode['scope'] != 'source':
+                security['ddos_indicators'][f"{episode['kind']}_flood"] = True
+            episode['key'] = None if episode['key'] is None else int_to_ip(episode['key'])
+            for talkers in ('top_sources', 'top_targets'):
+                episode[talkers] = [(int_to_ip(ip), count) for ip, count in episode[talkers]]
+            security['flood_episodes'].append(episode)
+    else:
+        limits = dict(FLOOD_THRESHOLDS['total'], **(flood_thresholds or {}).get('total', {}))
+        for kind in ('syn', 'udp', 'icmp'):
+            rates = packet_rates[f"{kind}_per_second"]
+            if rates and max(rates.values()) > limits[kind]:
+                security['ddos_indicators'][f"{kind}_flood"] = True
     
-    if max_syn_rate > 1000:
-        security['ddos_indicators']['syn_flood'] = True
-    if max_udp_rate > 5000:
-        security['ddos_indicators']['udp_flood'] = True
-    if max_icmp_rate > 1000:
-        security['ddos_indicators']['icmp_flood'] = True
+    security['suspicious_activity'] = [
+        {'signature': name, 'description': SUSPICIOUS_PAYLOADS[name], 'src': src, 'dst': dst, 'port': port,
+         'packets': count}
+        for (name, src, dst, port), count in payload_hits.most_common()
+    ]
+    security['payload_samples'] = payload_samples
     
     # Detect port scans
-    for src_ip, ports in port_scan_tracker.items():
+    for src_ip, (ports, sample) in port_scan_tracker.items():
         if len(ports) > 20:  # Scanned more than 20 ports
             security['port_scans'].append({
                 'src': src_ip,
                 'ports_scanned': len(ports),
-                'ports': sorted(list(ports))[:10]  # First 10 ports
+                'ports': sorted(sample)  # First 10 ports
             })
     
     return security
 
 
+def format_clients(row):
+    """First client of an outcome row, plus how many others"""
+    others = row['sources'] - 1
+    return row['src'] + (f" (+{others:,} more)" if others > 0 else "")
+
+
 def print_security_analysis(security):
     """Print security analysis results"""
     
@@ -154,16 +437,34 @@ def print_security_analysis(security):
     print("SECURITY ANALYSIS")
     print("="*80)
     
+    # Connection attempt outcomes
+    outcomes = security.get('connection_outcomes')
+    if outcomes:
+        print("\n[TCP Connection Attempts]")
+        for outcome in ('answered',) + tuple(CONNECTION_OUTCOMES):
+            if outcomes[outcome]:
+                label = 'SYN answered with SYN-ACK' if outcome == 'answered' else CONNECTION_OUTCOMES[outcome]
+                print(f"  {outcomes[outcome]:>10,}  {label}")
+    
     # Security Group Blocks
     if security['security_group_blocks']:
         print("\n[Security Group Blocks Detected]")
-        print(f"  Total: {len(security['security_group_blocks'])}")
+        print(f"  Total: {len(security['security_group_blocks'])} destination(s)")
         print("\n  Blocked connections (SYN without response):")
         for block in security['security_group_blocks'][:10]:  # Show first 10
-            print(f"    ❌ {block['src']} → {block['dst']} ({block['syn_count']} attempts)")
+            print(f"    ❌ {format_clients(block)} → {block['dst']} ({block['syn_count']} attempts)")
         
         print("\n  💡 Recommendation: Check security group rules for these connections")
     
+    # Actively rejected attempts
+    for key, title in (('refused_connections', 'Connections Refused (SYN → RST)'),
+                       ('prohibited_connections', 'Connections Prohibited (SYN → ICMP admin prohibited)'),
+                       ('unreachable_connections', 'Connections Unreachable (SYN → ICMP unreachable)')):
+        if security.get(key):
+            print(f"\n[{title}]")
+            for row in security[key][:10]:
+                print(f"    ⛔ {format_clients(row)} → {row['dst']} ({row['syn_count']} attempts)")
+    
     # TCP RST Analysis
     rst = security['tcp_rst_analysis']
     if rst['total'] > 0:
@@ -178,22 +479,49 @@ def print_security_analysis(security):
         for port, count in rst['by_dest_port'].most_common(5):
             print(f"    Port {port}: {count} RSTs")
         
-        if rst['patterns']:
+        if rst['pattern_counts']:
             print("\n  RST patterns detected:")
-            pattern_counts = Counter(p['pattern'] for p in rst['patterns'])
-            for pattern, count in pattern_counts.most_common():
-                print(f"    {pattern}: {count}")
+            for pattern, count in rst['pattern_counts'].most_common():
+                print(f"    {count:>8}  {RST_PATTERNS[pattern]}")
+        
+        if rst['top_patterns']:
+            print("\n  Top RST senders by port and pattern:")
+            for row in rst['top_patterns'][:10]:
+                print(f"    {row['src']} → port {row['port']} ({row['pattern'].replace('_', ' ')}): {row['count']} RSTs")
+        
+        for pattern, samples in rst['samples'].items():
+            if pattern in ('middlebox', 'seq_zero'):
+                print(f"\n  Example {pattern.replace('_', ' ')} RSTs:")
+                for sample in samples[:3]:
+                    ttl = f"TTL {sample['ttl']}"
+                    if sample['expected_ttl'] is not None:
+                        ttl += f" (sender usually {sample['expected_ttl']})"
+                    print(f"    {datetime.fromtimestamp(sample['time']).strftime('%H:%M:%S.%f')[:-3]} "
+                          f"{sample['src']}:{sample['sport']} → {sample['dst']}:{sample['port']} seq {sample['seq']}, {ttl}")
     
     # DDoS Indicators
     ddos = security['ddos_indicators']
-    if any(ddos.values()):
+    if any(ddos.values()) or security.get('flood_episodes'):
         print("\n[⚠️  DDoS/Flood Indicators Detected]")
-        if ddos['syn_flood']:
-            print("  ⚠️  TCP SYN Flood detected (>1000 SYN/sec)")
-        if ddos['udp_flood']:
-            print("  ⚠️  UDP Flood detected (>5000 UDP/sec)")
-        if ddos['icmp_flood']:
-            print("  ⚠️  ICMP Flood detected (>1000 ICMP/sec)")
+        if security.get('flood_episodes'):
+            for episode in security['flood_episodes'][:10]:
+                scope = FLOOD_SCOPES[episode['scope']]
+                if episode['key']:
+                    scope = f"{'to' if episode['scope'] == 'target' else 'from'} {episode['key']}"
+                windows = '/'.join(f"{w * 1000:g}ms" if w < 1 else f"{w:g}s" for w in episode['windows'])
+                print(f"  ⚠️  {FLOOD_KINDS[episode['kind']]} ({scope}): "
+                      f"{datetime.fromtimestamp(episode['start']).strftime('%H:%M:%S.%f')[:-3]} - "
+                      f"{datetime.fromtimestamp(episode['end']).strftime('%H:%M:%S.%f')[:-3]}, "
+                      f"{episode['packets']:,} packets, peak {episode['peak_rate']:,.0f}/s ({windows} window)")
+                print(f"       Top sources: {', '.join(f'{ip} ({n:,})' for ip, n in episode['top_sources'])}")
+                print(f"       Top targets: {', '.join(f'{ip} ({n:,})' for ip, n in episode['top_targets'])}")
+        else:
+            if ddos['syn_flood']:
+                print(f"  ⚠️  TCP SYN Flood detected (>{FLOOD_THRESHOLDS['total']['syn']} SYN/sec)")
+            if ddos['udp_flood']:
+                print(f"  ⚠️  UDP Flood detected (>{FLOOD_THRESHOLDS['total']['udp']} UDP/sec)")
+            if ddos['icmp_flood']:
+                print(f"  ⚠️  ICMP Flood detected (>{FLOOD_THRESHOLDS['total']['icmp']} ICMP/sec)")
         if ddos['dns_amplification']:
             print("  ⚠️  DNS Amplification attack detected (large DNS responses)")
         
@@ -210,6 +538,21 @@ def print_security_analysis(security):
             print(f"     Sample ports: {', '.join(map(str, scan['ports']))}")
         
         print("\n  💡 Recommendation: Block scanner IPs in NACL or security groups")
+    
+    # Payload signatures
+    if security.get('suspicious_activity'):
+        print("\n[Suspicious Payloads]")
+        totals = Counter()
+        for row in security['suspicious_activity']:
+            totals[row['signature']] += row['packets']
+        for name, count in totals.most_common():
+            print(f"  ⚠️  {SUSPICIOUS_PAYLOADS[name]}: {count} packets")
+            for sample in security['payload_samples'].get(name, []):
+                print(f"       {sample}")
+        
+        print("\n  Top sources:")
+        for row in security['suspicious_activity'][:10]:
+            print(f"    {row['src']} → {row['dst']}:{row['port']} {row['description']} ({row['packets']} packets)")
 
 
 if __name__ == '__main__':
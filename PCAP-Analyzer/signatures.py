@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Payload Signature Module
+Shared multi-pattern byte matcher: detectors register named byte patterns
+and every payload is scanned once for all of them
+"""
+
+import re
+
+# Payloads are only scanned up to this many bytes
+MAX_SCAN_BYTES = 4096
+
+
+class SignatureEngine:
+    """
+    All registered patterns compiled into one matcher over raw bytes
+
+    The patterns become a single regex alternation of literals, longest
+    first, which the regex engine scans in C for the first byte of any
+    pattern. Each search reports the longest pattern starting at the
+    earliest offset; shorter patterns that are a prefix of it are implied
+    by that match (the dictionary-suffix outputs of an Aho-Corasick
+    automaton), and the next search resumes one byte further, so every
+    occurrence of every pattern is found. scan() returns
+    {name: offset of first occurrence}.
+
+    register() may be called at any time; the matcher is rebuilt on the next
+    scan, so adding signatures never adds per-packet passes.
+    """
+
+    def __init__(self, max_bytes=MAX_SCAN_BYTES):
+        self.max_bytes = max_bytes
+        self.names = {}
+        self._matcher = None
+        self._outputs = {}
+
+    def register(self, name, *patterns):
+        """Report `name` wherever any of the byte patterns occurs"""
+        for pattern in patterns:
+            if not pattern:
+                raise ValueError(f"empty signature pattern for {name}")
+            names = self.names.setdefault(bytes(pattern), [])
+            if name not in names:
+                names.append(name)
+        self._matcher = None
+
+    def compile(self):
+        ordered = sorted(self.names, key=len, reverse=True)
+        # No capture groups: a plain literal alternation keeps the fast prefix scan
+        self._matcher = re.compile(b'|'.join(re.escape(pattern) for pattern in ordered), re.DOTALL)
+        # Matched pattern -> every name reported by it and its prefixes
+        self._outputs = {pattern: tuple(name for other in ordered if pattern.startswith(other)
+                                        for name in self.names[other])
+                         for pattern in ordered}
+
+    def scan(self, payload):
+        if not self.names:
+            return {}
+        if self._matcher is None:
+            self.compile()
+        found = {}
+        search = self._matcher.search
+        end = min(len(payload), self.max_bytes)
+        match = search(payload, 0, end)
+        while match is not None:
+            offset = match.start()
+            for name in self._outputs[match.group()]:
+                if name not in found:
+                    found[name] = offset
+            match = search(payload, offset + 1, end)
+        return found
+
+
+# Engine shared by aws_detection.py and security_analysis.py
+SIGNATURES = SignatureEngine()
+
+
+def register_signatures(table, engine=SIGNATURES):
+    """Register a {name: pattern or tuple of patterns} table"""
+    for name, patterns in table.items():
+        if isinstance(patterns, bytes):
+            patterns = (patterns,)
+        engine.register(name, *patterns)
+
+
+if __name__ == '__main__':
+    print("Payload Signature Module")
+    print("Import this module into pcap_analyzer_v3.py")
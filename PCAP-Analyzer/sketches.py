@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Streaming Sketches Module
+Bounded-memory heavy-hitter (SpaceSaving) and cardinality (HyperLogLog)
+sketches used by pcap_analyzer_v3.py --sketch on scan/flood captures
+"""
+
+import hashlib
+import heapq
+import math
+import random
+
+
+def stable_hash64(key):
+    """64-bit hash that is identical across processes (unlike hash())"""
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """
+    Distinct-count sketch using 2^precision one-byte registers
+    Standard error is 1.04 / sqrt(2^precision) (0.81% at the default 14)
+    """
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError("HyperLogLog precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, key):
+        h = stable_hash64(key)
+        index = h >> (64 - self.precision)
+        remainder = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        # Small-range correction (linear counting)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        """Union with a sketch built elsewhere (e.g. a parallel worker)"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def __len__(self):
+        return self.count()
+
+
+class DistinctCounter:
+    """
+    Distinct counter that is exact for small sets and switches to a
+    HyperLogLog once it holds more than `limit` keys. Suited to keeping one
+    counter per source, where most sources only ever see a handful of keys.
+    """
+
+    def __init__(self, limit=128, precision=12):
+        self.limit = limit
+        self.precision = precision
+        self.keys = set()
+        self.hll = None
+
+    @property
+    def exact(self):
+        return self.hll is None
+
+    def add(self, key):
+        if self.hll is not None:
+            self.hll.add(key)
+            return
+        self.keys.add(key)
+        if len(self.keys) > self.limit:
+            self.hll = HyperLogLog(self.precision)
+            for existing in self.keys:
+                self.hll.add(existing)
+            self.keys = None
+
+    def merge(self, other):
+        if other.hll is None:
+            for key in other.keys:
+                self.add(key)
+        else:
+            if self.hll is None:
+                self.hll = HyperLogLog(self.precision)
+                for key in self.keys:
+                    self.hll.add(key)
+                self.keys = None
+            self.hll.merge(other.hll)
+        return self
+
+    def __len__(self):
+        return len(self.keys) if self.hll is None else self.hll.count()
+
+
+class SpaceSaving:
+    """
+    Top-K counter (Metwally et al. SpaceSaving) with a Counter-style API
+
+    At most `capacity` keys are monitored. An unmonitored key replaces the
+    current minimum and inherits its count as error, so every key whose true
+    count exceeds total/capacity is kept and no count is overestimated by
+    more than total/capacity. len() is the HyperLogLog distinct estimate.
+
+    `sketch[key] += n` works as with Counter. Counts only grow, so the
+    min-heap is repaired lazily when an eviction needs the true minimum.
+    """
+
+    def __init__(self, capacity=5000, precision=14):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self.distinct = HyperLogLog(precision)
+        self._heap = []
+
+    def _rank(self, key):
+        return self.counts[key]
+
+    def _rank_value(self, value):
+        return value
+
+    def _pop_min(self):
+        while True:
+            value, key = heapq.heappop(self._heap)
+            actual = self._rank(key)
+            if actual == value:
+                return value, key
+            heapq.heappush(self._heap, (actual, key))
+
+    def _monitor(self, key, initial):
+        """Start monitoring key, evicting the minimum if full; returns the inherited error"""
+        error = 0
+        if len(self.counts) >= self.capacity:
+            error, evicted = self._pop_min()
+            del self.counts[evicted]
+            del self.errors[evicted]
+        self.counts[key] = initial(error)
+        self.errors[key] = error
+        heapq.heappush(self._heap, (self._rank(key), key))
+        return error
+
+    def add(self, key, count=1):
+        self.total += count
+        self.distinct.add(key)
+        if key in self.counts:
+            self.counts[key] += count
+        else:
+            self._monitor(key, lambda error: error + count)
+
+    def __getitem__(self, key):
+        return self.counts.get(key, 0)
+
+    def __setitem__(self, key, value):
+        self.add(key, value - self[key])
+
+    def get(self, key, default=0):
+        return self.counts.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def __iter__(self):
+        return iter(self.counts)
+
+    def __len__(self):
+        return self.distinct.count()
+
+    def keys(self):
+        return self.counts.keys()
+
+    def values(self):
+        return self.counts.values()
+
+    def items(self):
+        return self.counts.items()
+
+    def most_common(self, n=None):
+        return heapq.nlargest(n or len(self.counts), self.counts.items(), key=lambda kv: kv[1])
+
+    @property
+    def max_error(self):
+        """Upper bound on the overestimate of any reported count"""
+        return self.total / self.capacity if len(self.counts) >= self.capacity else 0
+
+    def _empty_value(self, floor):
+        return floor
+
+    def _combine(self, a, b):
+        return a + b
+
+    def merge(self, other):
+        """Merge a sketch built on another part of the capture (mergeable summaries)"""
+        self_floor = min(map(self._rank, self.counts), default=0) if len(self.counts) >= self.capacity else 0
+        other_floor = min(map(other._rank, other.counts), default=0) if len(other.counts) >= other.capacity else 0
+
+        merged, errors = {}, {}
+        for key in set(self.counts) | set(other.counts):
+            mine = self.counts[key] if key in self.counts else self._empty_value(self_floor)
+            theirs = other.counts[key] if key in other.counts else other._empty_value(other_floor)
+            merged[key] = self._combine(mine, theirs)
+            errors[key] = self.errors.get(key, self_floor) + other.errors.get(key, other_floor)
+
+        self.counts = {}
+        for key in heapq.nlargest(self.capacity, merged, key=lambda k: self._rank_value(merged[k])):
+            self.counts[key] = merged[key]
+        self.errors = {key: errors[key] for key in self.counts}
+        self._heap = [(self._rank(key), key) for key in self.counts]
+        heapq.heapify(self._heap)
+        self.total += other.total
+        self.distinct.merge(other.distinct)
+        return self
+
+
+class SpaceSavingTable(SpaceSaving):
+    """
+    SpaceSaving over rows of counters, e.g. conversations with packets/bytes
+
+    `table[key]` returns the mutable row (inserting like a defaultdict), ranked
+    by the `rank` field. A row that replaces an evicted one inherits its rank
+    count as error; the other fields only count what was seen since insertion.
+    """
+
+    def __init__(self, capacity=5000, precision=14, fields=('packets', 'bytes'), rank='packets'):
+        super().__init__(capacity, precision)
+        self.fields = fields
+        self.rank = rank
+
+    def _rank(self, key):
+        return self.counts[key][self.rank]
+
+    def _rank_value(self, value):
+        return value[self.rank]
+
+    def _new_row(self, error):
+        row = dict.fromkeys(self.fields, 0)
+        row[self.rank] = error
+        return row
+
+    def __getitem__(self, key):
+        self.distinct.add(key)
+        if key not in self.counts:
+            self._monitor(key, self._new_row)
+        return self.counts[key]
+
+    def __setitem__(self, key, value):
+        raise TypeError("Update SpaceSavingTable rows in place: table[key][field] += n")
+
+    def add(self, key, count=1):
+        self[key][self.rank] += count
+
+    def get(self, key, default=None):
+        return self.counts.get(key, default)
+
+    def most_common(self, n=None):
+        return heapq.nlargest(n or len(self.counts), self.counts.items(),
+                              key=lambda kv: kv[1][self.rank])
+
+    @property
+    def max_error(self):
+        # Rank counts always sum to the stream total in SpaceSaving
+        total = sum(row[self.rank] for row in self.counts.values())
+        return total / self.capacity if len(self.counts) >= self.capacity else 0
+
+    def _empty_value(self, floor):
+        return self._new_row(floor)
+
+    def _combine(self, a, b):
+        return {field: a[field] + b[field] for field in self.fields}
+
+
+class Reservoir:
+    """
+    Uniform random sample of at most `size` items from a stream (Vitter's
+    algorithm R). Seeded, so the same capture yields the same sample.
+    """
+
+    def __init__(self, size=20, seed=0):
+        self.size = size
+        self.items = []
+        self.seen = 0
+        self._random = random.Random(seed)
+
+    def add(self, item):
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+            return
+        slot = self._random.randrange(self.seen)
+        if slot < self.size:
+            self.items[slot] = item
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+if __name__ == '__main__':
+    print("Streaming Sketches Module")
+    print("Import this module into pcap_analyzer_v3.py")
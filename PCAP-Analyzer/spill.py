@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Disk-Spilling Aggregation Module
+Flow tables that keep a bounded number of rows in RAM and spill sorted runs to
+temporary files; a k-way merge produces exact totals (pcap_analyzer_v3.py --max-memory)
+"""
+
+import heapq
+import json
+import os
+import re
+import shutil
+import tempfile
+from itertools import groupby
+from operator import itemgetter
+
+# Rough in-RAM cost of one conversation row (key string, row dict, order entry)
+ROW_BYTES = 500
+
+SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(text):
+    """'512M', '2G', '1.5g' or plain bytes -> bytes"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*', str(text).upper())
+    if not match:
+        raise ValueError(f"Invalid size: {text!r} (use e.g. 512M or 2G)")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def write_json_object(f, items, indent=2, level=1, transform=None):
+    """Stream (key, row) items as a JSON object nested `level` deep
+
+    Same layout as json.dump(dict(items), indent=indent) at that depth.
+    transform: optional (key, row) -> (key, row) applied to each entry
+    """
+    pad = ' ' * indent * (level + 1)
+    first = True
+    for key, row in items:
+        if transform:
+            key, row = transform(key, row)
+        f.write(('{\n' if first else ',\n') + pad + json.dumps(key if isinstance(key, str) else str(key)) + ': '
+                + json.dumps(row, indent=indent).replace('\n', '\n' + pad))
+        first = False
+    f.write('{}' if first else '\n' + ' ' * indent * level + '}')
+
+
+class CounterRows:
+    """SpillTable row codec for dicts of integer counters (summed on merge)"""
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def new(self):
+        return dict.fromkeys(self.fields, 0)
+
+    def encode(self, row):
+        return [str(row[field]) for field in self.fields]
+
+    def decode(self, values):
+        return dict(zip(self.fields, map(int, values)))
+
+    def merge(self, row, later):
+        for field in self.fields:
+            row[field] += later[field]
+        return row
+
+
+class SpillTable:
+    """
+    Aggregation table keyed by non-negative integers, e.g. packed flow keys
+
+    Rows are dicts of counters by default (CounterRows(fields)); `codec` may
+    be any object with encode(row) -> list of str, decode(values) -> row and
+    merge(row, later) -> row, such as flow_table.FlowRecord. `table[key]`
+    returns the mutable row (inserting codec.new() like a defaultdict) and
+    `table[key] = row` inserts one. When more than `max_rows` rows are held,
+    they are written to a temporary file sorted by key and the in-memory
+    table starts over. Reading (items(), most_common(), len()) merges all
+    runs with the live rows, folding the rows of a key in the order they were
+    written, so results are exactly those of an in-memory dict. Each key's
+    first-insertion sequence number travels with it: items() is re-sorted on
+    it externally so iteration follows dict insertion order, and ties in
+    most_common() come out as a stable sort of the dict would.
+    """
+
+    def __init__(self, max_rows, fields=('packets', 'bytes'), rank='packets', tmpdir=None, codec=None):
+        self.max_rows = max(1, int(max_rows))
+        self.codec = codec or CounterRows(fields)
+        self.rank = itemgetter(rank) if isinstance(rank, str) else rank
+        self.rows = {}
+        self.order = {}
+        self.sequence = 0
+        self.runs = []
+        self.tmpdir = tmpdir
+        self._workdir = None
+        self._cache = {}
+
+    def __getitem__(self, key):
+        row = self.get(key)
+        if row is None:
+            row = self.codec.new()
+            self[key] = row
+        return row
+
+    def __setitem__(self, key, row):
+        """Insert a row for a key not held in memory (it may have spilled rows)"""
+        if key in self.rows:
+            raise KeyError(f"{key:x} is already held; update its row in place")
+        if len(self.rows) >= self.max_rows:
+            self._spill()
+        self.rows[key] = row
+        self.order[key] = self.sequence
+        self.sequence += 1
+        if self._cache:
+            self._invalidate()
+
+    def get(self, key, default=None):
+        """The mutable row held in memory for a key (spilled rows are not searched)"""
+        row = self.rows.get(key)
+        if row is None:
+            return default
+        if self._cache:
+            self._invalidate()
+        return row
+
+    def __contains__(self, key):
+        """Membership among rows held in memory (spilled rows are not searched)"""
+        return key in self.rows
+
+    @property
+    def spilled(self):
+        return bool(self.runs)
+
+    def _invalidate(self):
+        for path in self._cache.get('ordered', []):
+            os.remove(path)
+        self._cache.clear()
+
+    def _write_run(self, items, name):
+        """Write (key, seq, row) items to a run file (tab-separated, hex keys)"""
+        if self._workdir is None:
+            self._workdir = tempfile.mkdtemp(prefix='pcap_spill_', dir=self.tmpdir)
+        path = os.path.join(self._workdir, name)
+        encode = self.codec.encode
+        with open(path, 'w') as f:
+            for key, seq, row in items:
+                f.write('\t'.join([f"{key:x}", str(seq)] + encode(row)) + '\n')
+        return path
+
+    def _spill(self):
+        """Write the live rows as one run sorted by key"""
+        self.runs.append(self._write_run(self._live_run(), f"run{len(self.runs):05d}.tsv"))
+        self.rows = {}
+        self.order = {}
+
+    def _read_run(self, path):
+        decode = self.codec.decode
+        with open(path) as f:
+            for line in f:
+                key, seq, *values = line.rstrip('\n').split('\t')
+                yield int(key, 16), int(seq), decode(values)
+
+    def _live_run(self):
+        for key in sorted(self.rows):
+            yield key, self.order[key], self.rows[key]
+
+    def _grouped(self):
+        """Yield (key, [(seq, row), ...]) in key order, rows in the order they were written"""
+        # heapq.merge is stable, so a key's rows come out run by run, live rows last
+        runs = [self._read_run(path) for path in self.runs] + [self._live_run()]
+        for key, group in groupby(heapq.merge(*runs, key=itemgetter(0)), key=itemgetter(0)):
+            yield key, [(seq, row) for _, seq, row in group]
+
+    def _merged(self):
+        """Yield (key, first sequence, merged row) in key order"""
+        merge = self.codec.merge
+        for key, segments in self._grouped():
+            seq, row = segments[0]
+            for _, later in segments[1:]:
+                row = merge(row, later)
+            yield key, seq, row
+
+    def resumed(self):
+        """(key, row) of every row written for a key that an earlier run already held
+
+        These keys went back into memory after spilling, so an insert-time
+        "first row of this key" test counted them once per extra row.
+        """
+        for key, segments in self._grouped():
+            for _, row in segments[1:]:
+                yield key, row
+
+    def _ordered(self):
+        """Yield merged rows in first-insertion order (a second external sort, on seq)"""
+        if 'ordered' not in self._cache:
+            paths, chunk = [], []
+            for item in self._merged():
+                chunk.append(item)
+                if len(chunk) >= self.max_rows:
+                    chunk.sort(key=itemgetter(1))
+                    paths.append(self._write_run(chunk, f"ordered{len(paths):05d}.tsv"))
+                    chunk = []
+            chunk.sort(key=itemgetter(1))
+            paths.append(self._write_run(chunk, f"ordered{len(paths):05d}.tsv"))
+            self._cache['ordered'] = paths
+        return heapq.merge(*[self._read_run(path) for path in self._cache['ordered']], key=itemgetter(1))
+
+    def items(self):
+        if not self.runs:
+            return self.rows.items()
+        return ((key, row) for key, _, row in self._ordered())
+
+    def keys(self):
+        return (key for key, _ in self.items())
+
+    def values(self):
+        return (row for _, row in self.items())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        if not self.runs:
+            return len(self.rows)
+        if 'len' not in self._cache:
+            self._cache['len'] = sum(1 for _ in self._merged())
+        return self._cache['len']
+
+    def most_common(self, n=None):
+        """Top rows by rank (a field name or a row -> number function), ties in first-seen order"""
+        rank = self.rank
+        if not self.runs:
+            return sorted(self.rows.items(), key=lambda kv: rank(kv[1]), reverse=True)[:n]
+        if n not in self._cache:
+            best = heapq.nsmallest(n or len(self), self._merged(), key=lambda item: (-rank(item[2]), item[1]))
+            self._cache[n] = [(key, row) for key, _, row in best]
+        return self._cache[n]
+
+    def write_json(self, f, indent=2, level=1, transform=None):
+        """Stream the table as a JSON object (see write_json_object())"""
+        write_json_object(f, self.items(), indent, level, transform)
+
+    def close(self):
+        """Remove the temporary run files"""
+        if self._workdir:
+            shutil.rmtree(self._workdir, ignore_errors=True)
+            self._workdir = None
+
+    def __del__(self):
+        self.close()
+
+
+if __name__ == '__main__':
+    print("Disk-Spilling Aggregation Module")
+    print("Import this module into pcap_analyzer_v3.py")
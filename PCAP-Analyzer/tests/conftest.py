@@ -0,0 +1,19 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+# The analyzer modules are scripts next to this directory, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def analyzer(tmp_path, monkeypatch):
+    """pcap_analyzer_v3 imported with a temporary home (it creates ~/Desktop/pcap_analysis_output)"""
+    pytest.importorskip('scapy.all')
+    monkeypatch.setenv('HOME', str(tmp_path))
+    (tmp_path / 'Desktop').mkdir()
+    module = importlib.import_module('pcap_analyzer_v3')
+    monkeypatch.setattr(module, 'OUTPUT_DIR', tmp_path)
+    return module
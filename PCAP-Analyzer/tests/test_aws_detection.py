@@ -0,0 +1,127 @@
+import pytest
+
+import aws_detection
+from aws_detection import AsymmetryTracker, CidrTable, HandshakeTracker, NatTracker, hop_count
+from flow_table import PROTO_NUMBERS, ip_to_int
+
+TCP, UDP = PROTO_NUMBERS['TCP'], PROTO_NUMBERS['UDP']
+CLIENT = ip_to_int('10.0.0.1')
+SERVER = ip_to_int('10.1.0.1')
+
+
+def vpc_of(ip):
+    return f"{ip >> 16:x}"
+
+
+def handshake(tracker, ts, port, flags_ab=0x02, flags_ba=0x12):
+    tracker.observe(ts, TCP, CLIENT, port, SERVER, 443, 64, flags_ab)
+    tracker.observe(ts, TCP, SERVER, 443, CLIENT, port, 64, flags_ba)
+
+
+def test_asymmetry_full_table_keeps_generations(monkeypatch):
+    monkeypatch.setattr(aws_detection, 'MAX_ASYM_FLOWS', 1000)
+    tracker = AsymmetryTracker(vpc_of)
+    lag = 100
+    for i in range(1200 + lag):
+        # SYNs run `lag` flows ahead of the SYN-ACK/ACK of earlier flows
+        if i < 1200:
+            tracker.observe(0.0, TCP, CLIENT, 1024 + i, SERVER, 443, 64, 0x02)
+        if i >= lag:
+            port = 1024 + i - lag
+            tracker.observe(0.0, TCP, SERVER, 443, CLIENT, port, 64, 0x12)
+            tracker.observe(0.0, TCP, CLIENT, port, SERVER, 443, 64, 0x10)
+        assert len(tracker.current) + len(tracker.previous) <= 1000
+    report = tracker.report()
+    assert report['flows'] == []
+    assert not report['reasons']
+    assert report['evicted'] > 0
+
+
+def test_asymmetry_idle_flows_are_retired_and_classified():
+    tracker = AsymmetryTracker(vpc_of)
+    tracker.observe(0.0, TCP, CLIENT, 2000, SERVER, 443, 64, 0x10)
+    tracker.observe(0.0, TCP, SERVER, 443, CLIENT, 3000, 64, 0x12)
+    handshake(tracker, 1.0, 4000)
+    for step in range(1, 4):
+        tracker.observe(step * aws_detection.ASYM_IDLE_TIMEOUT, TCP, CLIENT, 5000 + step, SERVER, 443, 64, 0x02)
+    report = tracker.report()
+    assert report['reasons'] == {'one_way': 1, 'synack_without_syn': 1}
+    assert report['evicted'] == 0
+
+
+def test_asymmetry_closed_flows_are_not_carried_forward():
+    tracker = AsymmetryTracker(vpc_of)
+    tracker.observe(0.0, TCP, CLIENT, 2000, SERVER, 443, 64, 0x02)
+    tracker.observe(0.0, TCP, SERVER, 443, CLIENT, 2000, 64, 0x12)
+    tracker.observe(0.0, TCP, CLIENT, 2000, SERVER, 443, 64, 0x11)
+    tracker.observe(aws_detection.ASYM_IDLE_TIMEOUT, TCP, CLIENT, 9, SERVER, 9, 64, 0x02)
+    # The closed flow is in `previous`; its last ACK must not move it to `current`
+    tracker.observe(aws_detection.ASYM_IDLE_TIMEOUT + 1, TCP, SERVER, 443, CLIENT, 2000, 64, 0x10)
+    assert len(tracker.previous) == 1 and len(tracker.current) == 1
+    assert tracker.report()['flows'] == []
+
+
+def test_handshake_outcomes_and_generation_timeouts():
+    tracker = HandshakeTracker()
+    tracker.syn(0.0, CLIENT, 1000, SERVER, 443)
+    tracker.syn(0.5, CLIENT, 1000, SERVER, 443)  # retransmission keeps the first SYN time
+    tracker.answer(0.25, SERVER, 443, CLIENT, 1000)
+    tracker.syn(1.0, CLIENT, 1001, SERVER, 443)
+    tracker.answer(1.1, SERVER, 443, CLIENT, 1001, refused=True)
+    tracker.syn(2.0, CLIENT, 1002, SERVER, 443)
+    # Two generations later the unanswered SYN is retired as a timeout
+    tracker.syn(2.0 + aws_detection.HANDSHAKE_TIMEOUT, CLIENT, 1003, SERVER, 80)
+    tracker.syn(2.0 + 2 * aws_detection.HANDSHAKE_TIMEOUT, CLIENT, 1004, SERVER, 80)
+    report = tracker.report()
+    assert (report['attempts'], report['success'], report['refused'], report['timeouts']) == (5, 1, 1, 1)
+    assert report['latency_ms']['p50'] == 250.0
+    target = next(row for row in report['targets'] if row['target'] == '10.1.0.1:443')
+    assert (target['attempts'], target['success'], target['refused'], target['timeouts']) == (3, 1, 1, 1)
+    tracker.finish()
+    assert tracker.timeouts == 3 and not tracker.current and not tracker.previous
+
+
+def test_handshake_answer_from_the_client_side_is_ignored():
+    tracker = HandshakeTracker()
+    tracker.syn(0.0, CLIENT, 1000, SERVER, 443)
+    tracker.answer(0.1, CLIENT, 1000, SERVER, 443)
+    assert tracker.success == 0 and len(tracker.current) == 1
+
+
+def test_nat_peaks_close_and_reuse():
+    tracker = NatTracker(idle_timeout=10.0)
+    for port in range(5):
+        tracker.observe(0.0, TCP, CLIENT, 2000 + port, SERVER, 443, 0x02)
+    tracker.observe(1.0, TCP, SERVER, 443, CLIENT, 2000, 0x11)  # FIN from the server closes a mapping
+    tracker.observe(2.0, TCP, CLIENT, 2000, SERVER, 443, 0x02)  # ephemeral port reused
+    tracker.observe(2.0, UDP, CLIENT, 5353, SERVER, 53)
+    report = tracker.report()
+    tcp = next(row for row in report['destinations'] if row['proto'] == 'TCP')
+    assert (tcp['peak_ports'], tcp['connections'], tcp['reused']) == (5, 6, 1)
+    assert report['reuse_rate'] == pytest.approx(100 / 6)
+    assert tracker.destinations[(TCP, CLIENT, SERVER, 443)][0] == 5
+
+
+def test_nat_idle_mappings_expire_after_two_generations():
+    tracker = NatTracker(idle_timeout=10.0)
+    tracker.observe(0.0, TCP, CLIENT, 2000, SERVER, 443, 0x02)
+    tracker.observe(5.0, TCP, CLIENT, 2001, SERVER, 443, 0x10)  # established before the capture
+    tracker.observe(10.0, UDP, CLIENT, 9, SERVER, 9)
+    tracker.observe(20.0, UDP, CLIENT, 9, SERVER, 9)
+    assert tracker.destinations[(TCP, CLIENT, SERVER, 443)][:2] == [0, 2]
+    assert tracker.destinations[(TCP, CLIENT, SERVER, 443)][3] == 1
+    assert len(tracker.current) == 1
+
+
+def test_cidr_longest_prefix_match():
+    table = CidrTable({'10.0.0.0/8': 'corp', '10.1.0.0/16': 'vpc-a', '10.1.2.0/24': 'subnet', '0.0.0.0/0': 'any'})
+    assert table.lookup(ip_to_int('10.1.2.3')) == 'subnet'
+    assert table.lookup(ip_to_int('10.1.3.3')) == 'vpc-a'
+    assert table.lookup(ip_to_int('10.9.0.1')) == 'corp'
+    assert table.lookup(ip_to_int('192.0.2.1')) == 'any'
+    assert CidrTable(['172.16.5.9/12']).lookup(ip_to_int('172.31.0.1')) == '172.16.0.0/12'
+    assert len(table) == 4
+
+
+def test_hop_count():
+    assert [hop_count(ttl) for ttl in (64, 62, 120, 250)] == [0, 2, 8, 5]
@@ -0,0 +1,36 @@
+import random
+
+from beaconing import ConnectionStarts, detect_beacons
+from flow_table import ip_to_int
+
+HOST = ip_to_int('10.0.0.20')
+C2 = ip_to_int('203.0.113.9')
+
+
+def test_periodic_connections_rank_first():
+    rng = random.Random(8)
+    starts = ConnectionStarts()
+    # 60 s beacon with 1 s jitter, random browsing to another host, internal traffic
+    for index in range(40):
+        starts.append(1000.0 + index * 60 + rng.uniform(-1, 1), HOST, C2, 443)
+    browse = 1000.0
+    for _ in range(40):
+        browse += rng.expovariate(1 / 60)
+        starts.append(browse, HOST, ip_to_int('198.51.100.1'), 443)
+    for index in range(40):
+        starts.append(1000.0 + index * 60, HOST, ip_to_int('10.0.0.1'), 443)
+
+    beacons = detect_beacons(starts)
+    assert [(beacon['src'], beacon['dst'], beacon['port']) for beacon in beacons] == [(HOST, C2, 443)]
+    beacon = beacons[0]
+    assert beacon['connections'] == 40
+    assert abs(beacon['period'] - 60) < 2 and beacon['jitter'] < 0.05
+
+
+def test_too_few_or_too_fast_connections_are_ignored():
+    starts = ConnectionStarts()
+    for index in range(5):
+        starts.append(index * 60.0, HOST, C2, 443)
+    for index in range(100):
+        starts.append(index * 0.1, HOST, ip_to_int('203.0.113.10'), 80)
+    assert detect_beacons(starts) == []
@@ -0,0 +1,52 @@
+import random
+
+from dns_analysis import DnsTracker, parent_domain
+
+
+def random_label(rng, length):
+    return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(length))
+
+
+def test_parent_domain():
+    assert parent_domain('a.b.example.com') == 'example.com'
+    assert parent_domain('www.bbc.co.uk') == 'bbc.co.uk'
+    assert parent_domain('localhost') == 'localhost'
+
+
+def test_tunnel_subdomains_are_scored_per_parent():
+    rng = random.Random(5)
+    tracker = DnsTracker()
+    for _ in range(200):
+        tracker.observe('10.0.0.5', f"{random_label(rng, 30)}.{random_label(rng, 20)}.t.example.net.", 16)
+    for word in ('www', 'mail', 'api', 'cdn', 'static') * 10:
+        tracker.observe('10.0.0.6', f"{word}.wikipedia.org.", 1)
+    report = tracker.report()
+    assert [row['domain'] for row in report['tunneling']] == ['example.net']
+    tunnel = report['tunneling'][0]
+    # Past 128 subdomains the count is a HyperLogLog estimate
+    assert abs(tunnel['unique_subdomains'] - 200) <= 10 and tunnel['txt_null_queries'] == 200
+    assert tunnel['longest_label'] == 30
+    assert report['qtypes'] == {'TXT': 200, 'A': 50}
+
+
+def test_dga_labels_flagged_not_dictionary_words():
+    rng = random.Random(6)
+    tracker = DnsTracker()
+    for _ in range(30):
+        tracker.observe('10.0.0.7', f"{random_label(rng, 16)}.com")
+    for name in ('google.com', 'facebook.com', 'wikipedia.org', 'microsoft.com', 'amazonaws.com'):
+        tracker.observe('10.0.0.8', name)
+    report = tracker.report()
+    flagged = {row['domain'] for row in report['dga']}
+    assert len(flagged) >= 25
+    assert not flagged & {'google.com', 'facebook.com', 'wikipedia.org', 'microsoft.com', 'amazonaws.com'}
+    assert report['dga_sources'][0][0] == '10.0.0.7'
+
+
+def test_name_table_is_bounded():
+    tracker = DnsTracker(max_names=10)
+    for index in range(50):
+        tracker.observe('10.0.0.9', f"host{index}.example.com")
+    assert len(tracker.names) == 10 and tracker.untracked == 40
+    # Subdomain cardinality keeps counting past the name table
+    assert len(tracker.parents['example.com'][2]) == 50
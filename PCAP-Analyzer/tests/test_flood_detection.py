@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from flood_detection import detect_floods, window_episodes, window_starts
+from flow_table import ip_to_int
+from timeseries import FLAG_SYN, PROTO_CODES, PacketColumns
+
+
+def brute_starts(micros, groups, width):
+    return np.array([min(j for j in range(len(micros)) if groups[j] == groups[i] and micros[j] > micros[i] - width)
+                     for i in range(len(micros))])
+
+
+def test_window_starts_match_brute_force():
+    rng = np.random.default_rng(4)
+    groups = np.sort(rng.integers(0, 5, 400))
+    micros = np.concatenate([np.sort(rng.integers(0, 10**7, count)) for count in np.bincount(groups)])
+    for width in (1, 1000, 10**6):
+        assert (window_starts(micros, groups, width) == brute_starts(micros, groups, width)).all()
+
+
+def test_window_starts_survive_long_spans():
+    # Times decades apart must not bleed into the group of the next packet
+    micros = np.array([0, 2**62, 5, 2**62 + 5], dtype=np.int64)
+    groups = np.array([0, 0, 1, 1], dtype=np.int64)
+    assert window_starts(micros, groups, 10).tolist() == [0, 1, 2, 3]
+
+
+def test_window_episodes_split_per_group():
+    micros = np.array([0, 10, 20, 30, 10**7, 0, 10], dtype=np.int64)
+    groups = np.array([0, 0, 0, 0, 0, 1, 1], dtype=np.int64)
+    assert window_episodes(micros, groups, 0.1, 3) == [(0, 3, 4)]
+
+
+def syn_flood_columns(sources, rate, seconds=2.0):
+    columns = PacketColumns()
+    target = ip_to_int('10.0.0.80')
+    count = int(rate * seconds)
+    for index in range(count):
+        columns.append(1000.0 + index / rate, 60, PROTO_CODES['TCP'], FLAG_SYN,
+                       ip_to_int('198.51.100.0') + index % sources, target)
+    # Background UDP well under every threshold
+    for index in range(20):
+        columns.append(1000.0 + index * 0.1, 100, PROTO_CODES['UDP'], 0, ip_to_int('10.0.0.1'), target)
+    return columns
+
+
+def test_syn_flood_total_and_target():
+    episodes = detect_floods(syn_flood_columns(sources=1000, rate=3000))
+    scopes = {(episode['kind'], episode['scope']) for episode in episodes}
+    assert scopes == {('syn', 'total'), ('syn', 'target')}
+    target = next(episode for episode in episodes if episode['scope'] == 'target')
+    assert target['key'] == ip_to_int('10.0.0.80')
+    assert target['peak_rate'] == pytest.approx(3000, rel=0.05)
+    assert target['top_targets'] == [(ip_to_int('10.0.0.80'), 6000)]
+
+
+def test_single_source_flood_and_thresholds_override():
+    columns = syn_flood_columns(sources=1, rate=300)
+    assert {episode['scope'] for episode in detect_floods(columns)} == {'source'}
+    assert detect_floods(columns, thresholds={'source': {'syn': 0}}) == []
@@ -0,0 +1,40 @@
+from flow_db import INDEXES, FlowDatabase
+
+
+def indexes(db):
+    return {name for (name,) in db.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")}
+
+
+def ingest(db, name, packets):
+    db.begin_capture(name, fingerprint=name)
+    during = indexes(db)
+    for packet in packets:
+        db.add_packet(*packet)
+    db.finish_capture()
+    return during
+
+
+def handshake(ts, client):
+    return [(ts, 'TCP', client, 40000, '10.0.0.1', 443, 60, 0x02),
+            (ts + 0.1, 'TCP', '10.0.0.1', 443, client, 40000, 60, 0x12),
+            (ts + 0.2, 'TCP', client, 40000, '10.0.0.1', 443, 60, 0x10)]
+
+
+def test_indexes_deferred_only_for_an_empty_database(tmp_path):
+    db = FlowDatabase(str(tmp_path / 'flows.db'))
+    assert ingest(db, 'first.pcap', handshake(0.0, '10.0.1.1')) == set()
+    assert indexes(db) == set(INDEXES)
+    # The database now holds flows: a second capture keeps the indexes
+    assert ingest(db, 'second.pcap', handshake(10.0, '10.0.1.2')) == set(INDEXES)
+    assert indexes(db) == set(INDEXES)
+    db.close()
+
+
+def test_flows_are_written_initiator_first(tmp_path):
+    db = FlowDatabase(str(tmp_path / 'flows.db'))
+    ingest(db, 'one.pcap', handshake(0.0, '10.0.1.9'))
+    _, rows = db.query("SELECT ip_a, port_a, ip_b, port_b, packets_ab, packets_ba, syn, synack FROM flows")
+    assert rows == [('10.0.1.9', 40000, '10.0.0.1', 443, 2, 1, 1, 1)]
+    _, seconds = db.query("SELECT second, packets, syn, new_flows FROM seconds")
+    assert seconds == [(0, 3, 1, 1)]
+    db.close()
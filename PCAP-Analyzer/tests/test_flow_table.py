@@ -0,0 +1,70 @@
+import itertools
+import random
+
+from flow_table import (FlowRecord, FlowTable, PROTO_NUMBERS, STATE_NAMES, flow_key, flow_label,
+                        ip_to_int, unpack_flow_key)
+
+TCP = PROTO_NUMBERS['TCP']
+CLIENT = ip_to_int('10.0.0.2')
+SERVER = ip_to_int('10.0.0.1')
+SYN, SYNACK, ACK, FIN_ACK, RST = 0x02, 0x12, 0x10, 0x11, 0x04
+
+
+def replay(packets, ts=0.0):
+    """FlowRecord of (forward, flags) packets"""
+    forward, flags = packets[0]
+    record = FlowRecord(ts, forward, flags)
+    for forward, flags in packets:
+        record.update(ts, forward, 60, flags)
+    return record
+
+
+def test_flow_key_is_direction_independent():
+    key, forward = flow_key(TCP, CLIENT, 40000, SERVER, 443)
+    reverse, backward = flow_key(TCP, SERVER, 443, CLIENT, 40000)
+    assert key == reverse and forward != backward
+    assert unpack_flow_key(key) == (TCP, SERVER, 443, CLIENT, 40000)
+    assert flow_label(key, initiator_is_a=forward) == 'TCP 10.0.0.2:40000 <-> 10.0.0.1:443'
+
+
+def test_handshake_and_close_states():
+    record = replay([(True, SYN), (False, SYNACK), (True, ACK)])
+    assert STATE_NAMES[record.state] == 'established'
+    record.update(1.0, True, 60, FIN_ACK)
+    assert STATE_NAMES[record.state] == 'closing'
+    record.update(1.0, False, 60, FIN_ACK)
+    assert STATE_NAMES[record.state] == 'closed'
+    assert (record.syn, record.synack, record.fin) == (1, 1, 2)
+    assert STATE_NAMES[replay([(True, SYN), (False, RST)]).state] == 'reset'
+
+
+def test_table_counts_both_directions_in_one_record():
+    table = FlowTable()
+    _, new = table.update(0.0, TCP, CLIENT, 40000, SERVER, 443, 60, SYN)
+    record, again = table.update(0.5, TCP, SERVER, 443, CLIENT, 40000, 1500, SYNACK)
+    assert new and not again and len(table) == 1
+    row = record.summary(flow_key(TCP, CLIENT, 40000, SERVER, 443)[0])
+    assert (row['src'], row['packets_fwd'], row['bytes_rev']) == ('10.0.0.2', 1, 1500)
+    assert table.state_counts() == {'syn_received': 1}
+
+
+def test_merge_of_split_flow_matches_one_record():
+    rng = random.Random(7)
+    flag_choices = (0, SYN, SYNACK, ACK, FIN_ACK, 0x01, RST, 0x14, 0x18)
+    for _ in range(2000):
+        packets = [(rng.random() < 0.5, rng.choice(flag_choices)) for _ in range(rng.randint(2, 10))]
+        whole = replay(packets)
+        split = rng.randint(1, len(packets) - 1)
+        head, tail = replay(packets[:split]), replay(packets[split:], ts=1.0)
+        merged = head.merge(FlowRecord.decode(tail.encode()))
+        assert merged.encode()[2:] == whole.encode()[2:]
+        assert (merged.first_seen, merged.last_seen) == (0.0, 1.0)
+
+
+def test_merge_composes_in_order():
+    # The same two halves give different states depending on which came first
+    opening = [(True, SYN), (False, SYNACK), (True, ACK)]
+    closing = [(True, FIN_ACK), (False, FIN_ACK)]
+    states = {STATE_NAMES[replay(first).merge(replay(then)).state]
+              for first, then in itertools.permutations((opening, closing))}
+    assert states == {'closed', 'established'}
@@ -0,0 +1,64 @@
+import os
+import struct
+
+
+def pcap_header(magic=0xa1b2c3d4, linktype=1):
+    return struct.pack('<IHHiIII', magic, 2, 4, 0, 0, 65535, linktype)
+
+
+def record(sec, frac, data):
+    return struct.pack('<IIII', sec, frac, len(data), len(data)) + data
+
+
+def read(follower):
+    return [(ts, data) for ts, _, data in follower.read_new()]
+
+
+def test_partial_records_wait_for_the_next_poll(analyzer, tmp_path):
+    path = tmp_path / 'live.pcap'
+    first, second = record(100, 500000, b'a' * 60), record(101, 0, b'b' * 70)
+    path.write_bytes(pcap_header() + first + second[:30])
+    follower = analyzer.PcapFollower(path)
+    assert follower.has_new_data()
+    assert read(follower) == [(100.5, b'a' * 60)]
+    assert follower.offset == 24 + len(first)
+    assert read(follower) == []
+
+    with open(path, 'ab') as f:
+        f.write(second[30:])
+    assert follower.has_new_data()
+    assert read(follower) == [(101.0, b'b' * 70)]
+    assert not follower.has_new_data()
+
+
+def test_rewritten_or_replaced_files_are_read_from_the_start(analyzer, tmp_path):
+    path = tmp_path / 'ring.pcap'
+    path.write_bytes(pcap_header() + record(1, 0, b'old') + record(2, 0, b'old'))
+    follower = analyzer.PcapFollower(path)
+    assert len(read(follower)) == 2
+
+    # Ring slot rewritten in place: same size, different first record
+    with open(path, 'r+b') as f:
+        f.write(pcap_header() + record(3, 0, b'new') + record(4, 0, b'new'))
+    assert [data for _, data in read(follower)] == [b'new', b'new']
+
+    # Truncated
+    path.write_bytes(pcap_header() + record(3, 0, b'new'))
+    assert [data for _, data in read(follower)] == [b'new']
+    with open(path, 'ab') as f:
+        f.write(record(5, 0, b'tail'))
+    assert [data for _, data in read(follower)] == [b'tail']
+
+    # Replaced by a new file (new inode)
+    replacement = tmp_path / 'next.pcap'
+    replacement.write_bytes(pcap_header(magic=0xa1b23c4d) + record(6, 250000000, b'nano'))
+    os.replace(replacement, path)
+    assert read(follower) == [(6.25, b'nano')]
+
+
+def test_not_yet_a_pcap(analyzer, tmp_path):
+    path = tmp_path / 'starting.pcap'
+    path.write_bytes(pcap_header()[:10])
+    follower = analyzer.PcapFollower(path)
+    assert read(follower) == [] and follower.endian is None
+    assert read(analyzer.PcapFollower(tmp_path / 'missing.pcap')) == []
@@ -0,0 +1,50 @@
+import scan_detection
+from scan_detection import ScanDetector
+
+SCANNER = '192.0.2.7'
+
+
+def host(index):
+    return f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+
+
+def test_large_sweep_keeps_window_tables_bounded():
+    detector = ScanDetector()
+    hosts = 50000
+    for index in range(hosts):
+        detector.observe(index * 0.0001, 'TCP', SCANNER, host(index), 40000, 80, 0x02)
+        # A few hosts are probed on many ports in the middle of the sweep
+        if index % 10000 == 5000:
+            for port in range(1, 31):
+                detector.observe(index * 0.0001, 'TCP', SCANNER, host(index), 40000, 1000 + port, 0x02)
+    state = detector.sources[SCANNER]
+    assert len(state.host_ports) <= scan_detection.MAX_WINDOW_TARGETS
+    assert len(state.port_hosts) <= scan_detection.MAX_WINDOW_TARGETS
+
+    findings = {scan['kind']: scan for scan in detector.scans()}
+    assert findings['horizontal']['target'] == 'tcp/80'
+    assert abs(findings['horizontal']['distinct'] - hosts) < hosts * 0.05
+    assert findings['syn_sweep']['syns'] == hosts + 5 * 30
+    assert findings['vertical']['distinct'] == 31
+
+
+def test_vertical_scan_after_trimmed_sweep(monkeypatch):
+    monkeypatch.setattr(scan_detection, 'MAX_WINDOW_TARGETS', 64)
+    detector = ScanDetector()
+    for index in range(1000):
+        detector.observe(0.0, 'TCP', SCANNER, host(index), 40000, 443, 0x02)
+    for port in range(1, 26):
+        detector.observe(1.0, 'TCP', SCANNER, host(5000), 40000, port, 0x02)
+    state = detector.sources[SCANNER]
+    assert len(state.host_ports) <= 64
+    vertical = [scan for scan in detector.scans() if scan['kind'] == 'vertical']
+    assert [(scan['target'], scan['distinct']) for scan in vertical] == [(host(5000), 25)]
+
+
+def test_answered_connections_are_not_a_sweep():
+    detector = ScanDetector()
+    for index in range(40):
+        detector.observe(index, 'TCP', SCANNER, host(index), 40000 + index, 443, 0x02)
+        detector.observe(index, 'TCP', host(index), SCANNER, 443, 40000 + index, 0x12)
+    kinds = {scan['kind'] for scan in detector.scans()}
+    assert kinds == {'horizontal'}
@@ -0,0 +1,57 @@
+import pytest
+
+pytest.importorskip('scapy.all')
+
+import security_analysis
+from flow_table import PROTO_NUMBERS, flow_key, ip_to_int
+from security_analysis import ConnectionTracker, RstTracker
+
+CLIENT = ip_to_int('10.0.0.1')
+SERVER = ip_to_int('10.1.0.1')
+
+
+def test_answered_syns_are_evicted_and_pending_ones_expire():
+    tracker = ConnectionTracker()
+    tracker.syn(0.0, CLIENT, 1000, SERVER, 443)
+    tracker.syn(0.5, CLIENT, 1000, SERVER, 443)
+    assert tracker.answer(1.0, SERVER, 443, CLIENT, 1000)
+    tracker.syn(1.0, CLIENT, 1001, SERVER, 22)
+    assert tracker.answer(1.5, SERVER, 22, CLIENT, 1001, 'refused')
+    tracker.syn(2.0, CLIENT, 1002, SERVER, 8080)
+    tracker.syn(2.0, CLIENT, 1003, SERVER, 8080)
+    # The initiator's own packets do not answer its SYN
+    assert not tracker.answer(2.1, CLIENT, 1002, SERVER, 8080)
+    assert len(tracker.current) == 2
+
+    # Retired after two SYN_TIMEOUT generations
+    tracker.syn(2.0 + security_analysis.SYN_TIMEOUT, CLIENT, 1004, SERVER, 9)
+    tracker.syn(2.0 + 2 * security_analysis.SYN_TIMEOUT, CLIENT, 1005, SERVER, 9)
+    assert tracker.counts == {'answered': 1, 'refused': 1, 'unanswered': 2}
+    assert tracker.rows('unanswered') == [{'dst': '10.1.0.1:8080', 'src': '10.0.0.1', 'syn_count': 2,
+                                           'flows': 2, 'sources': 1}]
+    assert tracker.rows('refused')[0]['syn_count'] == 1
+    tracker.finish()
+    assert tracker.counts['unanswered'] == 4 and not tracker.current and not tracker.previous
+
+
+def test_outcome_rows_are_bounded(monkeypatch):
+    monkeypatch.setattr(security_analysis, 'MAX_OUTCOME_ROWS', 3)
+    tracker = ConnectionTracker()
+    for port in range(10):
+        tracker.syn(0.0, CLIENT, 1000, SERVER, port + 1)
+    tracker.finish()
+    assert len(tracker.outcomes['unanswered']) == 3 and tracker.dropped_rows == 7
+
+
+def test_rst_patterns_and_flow_generations():
+    tracker = RstTracker()
+    key = flow_key(PROTO_NUMBERS['TCP'], CLIENT, 1000, SERVER, 443)[0]
+    tracker.packet(0.0, SERVER, 60, key, 0x10)
+    tracker.rst(1.0, SERVER, 443, CLIENT, 1000, 5, 60, key, False)
+    tracker.rst(1.0, SERVER, 443, CLIENT, 1000, 5, 120, key, False)
+    tracker.rst(1.0, ip_to_int('10.2.0.1'), 443, CLIENT, 1000, 0, 60, key, False)
+    # The ACKed flow is forgotten after two RST_FLOW_TIMEOUT generations
+    tracker.packet(security_analysis.RST_FLOW_TIMEOUT, CLIENT, 64, 0, 0)
+    tracker.packet(2 * security_analysis.RST_FLOW_TIMEOUT, CLIENT, 64, 0, 0)
+    tracker.rst(2 * security_analysis.RST_FLOW_TIMEOUT, SERVER, 443, CLIENT, 1000, 5, 60, key, False)
+    assert tracker.pattern_counts == {'mid_stream': 1, 'middlebox': 1, 'seq_zero': 1, 'no_flow': 1}
@@ -0,0 +1,36 @@
+import pytest
+
+from signatures import SignatureEngine, register_signatures
+
+
+def engine(table, **kwargs):
+    signatures = SignatureEngine(**kwargs)
+    register_signatures(table, signatures)
+    return signatures
+
+
+def test_first_offset_of_every_pattern():
+    signatures = engine({'http': (b'GET ', b'POST '), 'admin': b'/admin', 'passwd': b'/etc/passwd'})
+    payload = b'POST /admin HTTP/1.1\r\n\r\nGET /etc/passwd GET /admin'
+    assert signatures.scan(payload) == {'http': 0, 'admin': 5, 'passwd': 28}
+
+
+def test_prefix_and_overlapping_patterns():
+    # 'ab' is a prefix of 'abc' and 'bcd' overlaps it: all three are found
+    signatures = engine({'long': b'abc', 'prefix': b'ab', 'overlap': b'bcd'})
+    assert signatures.scan(b'xxabcd') == {'long': 2, 'prefix': 2, 'overlap': 3}
+
+
+def test_names_share_patterns_and_late_registration():
+    signatures = engine({'one': b'token', 'two': b'token'})
+    assert signatures.scan(b'a token') == {'one': 2, 'two': 2}
+    signatures.register('three', b'a t')
+    assert signatures.scan(b'a token') == {'one': 2, 'two': 2, 'three': 0}
+
+
+def test_scan_limit_and_special_bytes():
+    signatures = engine({'regex': b'.*(', 'tail': b'end'}, max_bytes=16)
+    assert signatures.scan(b'xx.*(' + b'-' * 20 + b'end') == {'regex': 2}
+    assert SignatureEngine().scan(b'anything') == {}
+    with pytest.raises(ValueError):
+        signatures.register('empty', b'')
@@ -0,0 +1,85 @@
+import random
+from collections import Counter
+
+from sketches import DistinctCounter, HyperLogLog, Reservoir, SpaceSaving, SpaceSavingTable
+
+
+def zipf_stream(n, keys, seed=1):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(keys)]
+    return rng.choices(range(keys), weights=weights, k=n)
+
+
+def test_hyperloglog_within_error_bound():
+    hll = HyperLogLog(precision=12)
+    for key in range(50000):
+        hll.add(key)
+    # 4 standard errors
+    assert abs(hll.count() - 50000) <= 4 * hll.relative_error * 50000
+
+
+def test_hyperloglog_merge_is_union():
+    left, right, union = HyperLogLog(10), HyperLogLog(10), HyperLogLog(10)
+    for key in range(3000):
+        (left if key % 2 else right).add(key)
+        union.add(key)
+    for key in range(1000, 2000):
+        right.add(key)
+    assert left.merge(right).registers == union.registers
+
+
+def test_distinct_counter_is_exact_until_limit():
+    counter = DistinctCounter(limit=16)
+    for key in range(16):
+        counter.add(key)
+        counter.add(key)
+    assert counter.exact and len(counter) == 16
+    counter.add(16)
+    assert not counter.exact and abs(len(counter) - 17) <= 2
+
+
+def test_space_saving_error_bound():
+    stream = zipf_stream(20000, 2000)
+    exact, sketch = Counter(stream), SpaceSaving(capacity=100, precision=10)
+    for key in stream:
+        sketch[key] += 1
+    bound = sketch.max_error
+    assert bound == len(stream) / 100
+    for key, count in sketch.items():
+        assert exact[key] <= count <= exact[key] + bound
+        assert count - sketch.errors[key] <= exact[key]
+    # Every key above total/capacity is monitored
+    assert all(key in sketch for key, count in exact.items() if count > bound)
+
+
+def test_space_saving_merge_keeps_bounds():
+    stream = zipf_stream(20000, 2000, seed=2)
+    exact = Counter(stream)
+    halves = SpaceSaving(capacity=100, precision=10), SpaceSaving(capacity=100, precision=10)
+    for index, key in enumerate(stream):
+        halves[index % 2].add(key)
+    merged = halves[0].merge(halves[1])
+    assert merged.total == len(stream)
+    for key, count in merged.items():
+        assert count - merged.errors[key] <= exact[key] <= count
+
+
+def test_space_saving_table_rows():
+    table = SpaceSavingTable(capacity=2, precision=8)
+    for key, size in (('a', 10), ('a', 10), ('b', 5), ('c', 7)):
+        row = table[key]
+        row['packets'] += 1
+        row['bytes'] += size
+    # 'c' replaced 'b' and inherited its packet count as error
+    assert dict(table.most_common()) == {'a': {'packets': 2, 'bytes': 20}, 'c': {'packets': 2, 'bytes': 7}}
+    assert table.errors['c'] == 1 and table.max_error == 2
+
+
+def test_reservoir_is_seeded_and_bounded():
+    samples = []
+    for _ in range(2):
+        reservoir = Reservoir(size=5, seed=3)
+        for item in range(1000):
+            reservoir.add(item)
+        samples.append(list(reservoir))
+    assert samples[0] == samples[1] and len(samples[0]) == 5 and reservoir.seen == 1000
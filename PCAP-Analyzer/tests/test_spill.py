@@ -0,0 +1,111 @@
+import io
+import json
+
+import pytest
+
+from flow_table import PROTO_NUMBERS, FlowTable, ip_to_int
+from spill import SpillTable, parse_size
+
+TCP, UDP = PROTO_NUMBERS['TCP'], PROTO_NUMBERS['UDP']
+
+
+def test_parse_size():
+    assert parse_size('512K') == 512 << 10
+    assert parse_size('1.5g') == 3 << 29
+    with pytest.raises(ValueError):
+        parse_size('lots')
+
+
+def test_counter_rows_merge_across_runs(tmp_path):
+    table, exact = SpillTable(3, tmpdir=tmp_path), {}
+    for step in range(200):
+        key = (step * 7) % 11
+        table[key]['packets'] += 1
+        table[key]['bytes'] += step
+        row = exact.setdefault(key, {'packets': 0, 'bytes': 0})
+        row['packets'] += 1
+        row['bytes'] += step
+    assert table.spilled
+    assert list(table.items()) == list(exact.items())
+    assert len(table) == len(exact)
+    assert table.most_common(4) == sorted(exact.items(), key=lambda kv: kv[1]['packets'], reverse=True)[:4]
+    out = io.StringIO()
+    table.write_json(out, level=0)
+    assert json.loads(out.getvalue()) == {str(key): row for key, row in exact.items()}
+    table.close()
+
+
+def test_spilled_flow_table_matches_memory(tmp_path):
+    memory, spilled = FlowTable(), FlowTable(max_rows=4, tmpdir=tmp_path)
+    server = ip_to_int('10.0.0.1')
+    packets = []
+    for round_ in range(3):
+        for client in range(10):
+            src, sport = ip_to_int('10.0.1.0') + client, 40000 + client
+            ts = round_ * 10.0 + client
+            packets += [(ts, TCP, src, sport, server, 443, 60, (0x02, 0x10, 0x11)[round_]),
+                        (ts + 0.5, TCP, server, 443, src, sport, 60, (0x12, 0x10, 0x11)[round_]),
+                        (ts, UDP, src, 5353, server, 53, 80, 0)]
+    for packet in packets:
+        memory.update(*packet)
+        spilled.update(*packet)
+
+    assert spilled.spilled
+    summaries = [(key, record.summary(key)) for key, record in memory.items()]
+    assert [(key, record.summary(key)) for key, record in spilled.items()] == summaries
+    assert spilled.state_counts() == memory.state_counts() == {'closed': 10}
+    top = [(key, record.summary(key)) for key, record in memory.most_common(5)]
+    assert [(key, record.summary(key)) for key, record in spilled.most_common(5)] == top
+    # Each UDP flow came back after spilling in rounds 2 and 3
+    resumed = [key for key, record in spilled.resumed() if key >> 96 == UDP]
+    assert len(resumed) == 20 and len(set(resumed)) == 10
+    spilled.close()
+
+
+def capture():
+    """(ts, frame bytes): handshakes, closes and resets from 30 clients plus recurring UDP flows"""
+    from scapy.all import Ether, IP, TCP as TCPLayer, UDP as UDPLayer, Raw
+    frames = []
+    for client in range(30):
+        ts = 1000.0 + client * 0.25
+        src, port = f"10.0.1.{client + 1}", 40000 + client
+        ending = 'R' if client % 5 == 0 else 'FA'
+        for offset, (forward, flags) in enumerate([(True, 'S'), (False, 'SA'), (True, 'A'), (True, 'PA'),
+                                                   (False, ending), (True, 'FA')]):
+            ip = IP(src=src, dst='10.0.0.1') if forward else IP(src='10.0.0.1', dst=src)
+            sport, dport = (port, 443) if forward else (443, port)
+            frames.append((ts + offset * 0.01, Ether() / ip / TCPLayer(sport=sport, dport=dport, flags=flags) / Raw(b'x' * client)))
+        for round_ in range(3):
+            frames.append((ts + round_ * 3.0, Ether() / IP(src=src, dst='10.0.0.53') / UDPLayer(sport=5000 + client, dport=9999) / Raw(b'q' * 30)))
+    frames.sort(key=lambda frame: frame[0])
+    return [(ts, bytes(frame)) for ts, frame in frames]
+
+
+def test_max_memory_export_matches_memory(analyzer, tmp_path):
+    from scapy.all import Ether
+    buckets = {'interval': 1.0, 'top_hosts': 5}
+    runs = {'memory': analyzer.new_scapy_analysis(buckets=buckets),
+            'spilled': analyzer.new_scapy_analysis(max_memory=4000, buckets=buckets)}
+    for ts, frame in capture():
+        for analysis in runs.values():
+            analyzer.update_scapy_analysis(analysis, Ether(frame), ts)
+    assert runs['spilled']['conversations'].spilled
+
+    exports = {}
+    for name, analysis in runs.items():
+        analyzer.export_analysis(analysis, f"{name}.json")
+        with open(tmp_path / f"{name}.json") as f:
+            exports[name] = json.load(f)
+        # Per-packet columns are not kept under --max-memory
+        for key in ('anomalies', 'beacons', 'per_packet_skipped'):
+            exports[name].pop(key)
+    assert exports['spilled'] == exports['memory']
+    assert exports['memory']['source_clusters']['sources'] == 30
+
+    rates = [analyzer.handshake_success_rate(analysis) for analysis in runs.values()]
+    assert rates[0] == rates[1] == 100.0
+
+    bins = [analysis['buckets'].bins(analyzer.resumed_udp_flows(analysis)) for analysis in runs.values()]
+    for field in ('bucket_start', 'total', 'protocols', 'hosts'):
+        assert (bins[0][field] == bins[1][field]).all()
+    runs['spilled']['conversations'].close()
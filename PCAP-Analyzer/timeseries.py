@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Time Series Module
+Compact per-packet columns collected during the Scapy pass, and fixed-interval
+bucket counters updated in the same pass for CSV / .npz bucket exports
+"""
+
+import csv
+from array import array
+from datetime import datetime
+
+from sketches import SpaceSaving
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+PROTOCOLS = ('TCP', 'UDP', 'ICMP', 'Other')
+PROTO_CODES = {name: code for code, name in enumerate(PROTOCOLS)}
+
+METRICS = ('packets', 'bytes', 'new_flows', 'syn', 'rst', 'fin', 'tcp_issues')
+
+# Per-packet flag bits
+FLAG_SYN = 0x01
+FLAG_RST = 0x02
+FLAG_FIN = 0x04
+FLAG_NEW_FLOW = 0x08
+FLAG_TCP_ISSUE = 0x10
+FLAG_ICMP_UNREACH = 0x20
+
+# METRICS columns counted from the flag bits
+FLAG_METRICS = ((METRICS.index('new_flows'), FLAG_NEW_FLOW), (METRICS.index('syn'), FLAG_SYN),
+                (METRICS.index('rst'), FLAG_RST), (METRICS.index('fin'), FLAG_FIN),
+                (METRICS.index('tcp_issues'), FLAG_TCP_ISSUE))
+
+# Hosts followed per bucket: at least this many, or 4x the hosts exported
+BUCKET_HOST_CANDIDATES = 32
+
+
+class PacketColumns:
+    """Append-only per-packet columns backed by array.array (~22 bytes per packet)"""
+    __slots__ = ('ts', 'size', 'proto', 'flags', 'src', 'dst')
+
+    def __init__(self):
+        self.ts = array('d')
+        self.size = array('I')
+        self.proto = array('B')
+        self.flags = array('B')
+        self.src = array('I')
+        self.dst = array('I')
+
+    def append(self, ts, size, proto, flags=0, src=0, dst=0):
+        """src/dst are 32-bit IPv4 addresses (0 for non-IP frames)"""
+        self.ts.append(ts)
+        self.size.append(size)
+        self.proto.append(proto)
+        self.flags.append(flags)
+        self.src.append(src)
+        self.dst.append(dst)
+
+    def __len__(self):
+        return len(self.ts)
+
+
+class BucketCounters:
+    """
+    Fixed-interval METRICS counters per protocol, updated per packet
+
+    Rows are keyed by bucket index (floor(time / interval)), so memory grows
+    with the occupied buckets rather than the packets. Hosts are followed by
+    a SpaceSaving of bytes (sent + received) with room for
+    max(BUCKET_HOST_CANDIDATES, 4 x top_hosts) candidates; a candidate keeps
+    per-bucket rows from the packet that (last) made it one, and the rows of
+    evicted hosts are dropped. The heaviest candidates are exported.
+    """
+
+    def __init__(self, interval=1.0, top_hosts=10):
+        self.interval = interval
+        self.top_hosts = top_hosts
+        self.rows = {}
+        self.candidates = SpaceSaving(max(BUCKET_HOST_CANDIDATES, 4 * top_hosts), precision=4)
+        self.host_rows = {}
+
+    @staticmethod
+    def _count(row, base, size, flags):
+        row[base] += 1
+        row[base + 1] += size
+        if flags:
+            for column, bit in FLAG_METRICS:
+                if flags & bit:
+                    row[base + column] += 1
+
+    def add(self, ts, size, proto, flags=0, src=0, dst=0):
+        """Same arguments as PacketColumns.append(); a packet counts for its source and destination host"""
+        bucket = int(ts // self.interval)
+        row = self.rows.get(bucket)
+        if row is None:
+            row = self.rows[bucket] = [0] * (len(PROTOCOLS) * len(METRICS))
+        self._count(row, proto * len(METRICS), size, flags)
+
+        for host in (src, dst):
+            if not host:
+                continue
+            self.candidates.add(host, size)
+            if host not in self.candidates:
+                continue
+            rows = self.host_rows.get(host)
+            if rows is None:
+                rows = self.host_rows[host] = {}
+            host_row = rows.get(bucket)
+            if host_row is None:
+                host_row = rows[bucket] = [0] * len(METRICS)
+            self._count(host_row, 0, size, flags)
+        if len(self.host_rows) > 2 * self.candidates.capacity:
+            self.host_rows = {host: rows for host, rows in self.host_rows.items() if host in self.candidates}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def bins(self, repeated_flows=()):
+        """
+        Occupied buckets in time order as a dict with bucket_start (epoch
+        seconds) and int64 count arrays shaped (buckets, METRICS) for 'total',
+        (buckets, PROTOCOLS, METRICS) for 'protocols' and (buckets, hosts,
+        METRICS) for 'hosts' (integer addresses in 'host_ids'); None when empty.
+
+        repeated_flows: (ts, proto, src, dst) of packets that were flagged
+        FLAG_NEW_FLOW but did not start a flow; they are taken out of
+        new_flows (a host's row only if it counted one in that bucket).
+        """
+        if not self.rows:
+            return None
+        order = sorted(self.rows)
+        index = {bucket: position for position, bucket in enumerate(order)}
+        protocols = np.array([self.rows[bucket] for bucket in order],
+                             dtype=np.int64).reshape(len(order), len(PROTOCOLS), len(METRICS))
+
+        hosts = [host for host, _ in self.candidates.most_common(self.top_hosts)]
+        host_counts = np.zeros((len(order), len(hosts), len(METRICS)), dtype=np.int64)
+        for slot, host in enumerate(hosts):
+            for bucket, row in self.host_rows.get(host, {}).items():
+                host_counts[index[bucket], slot] = row
+
+        new_flows = METRICS.index('new_flows')
+        slots = {host: slot for slot, host in enumerate(hosts)}
+        for ts, proto, src, dst in repeated_flows:
+            position = index[int(ts // self.interval)]
+            protocols[position, proto, new_flows] -= 1
+            for host in (src, dst):
+                slot = slots.get(host)
+                if slot is not None and host_counts[position, slot, new_flows] > 0:
+                    host_counts[position, slot, new_flows] -= 1
+        return {
+            'interval': self.interval,
+            'bucket_start': np.array(order, dtype=np.float64) * self.interval,
+            'total': protocols.sum(axis=1),
+            'protocols': protocols,
+            'host_ids': hosts,
+            'hosts': host_counts
+        }
+
+
+def write_buckets_csv(bins, output_file, host_names):
+    """Long-format CSV: one row per bucket for 'all', plus non-empty protocol/host rows"""
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['time', 'epoch', 'scope', 'key'] + list(METRICS))
+        for index, start in enumerate(bins['bucket_start']):
+            stamp = datetime.fromtimestamp(start).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+            prefix = [stamp, f"{start:.6f}"]
+            writer.writerow(prefix + ['all', ''] + bins['total'][index].tolist())
+            for code, name in enumerate(PROTOCOLS):
+                row = bins['protocols'][index, code]
+                if row[0]:
+                    writer.writerow(prefix + ['protocol', name] + row.tolist())
+            for slot, name in enumerate(host_names):
+                row = bins['hosts'][index, slot]
+                if row[0]:
+                    writer.writerow(prefix + ['host', name] + row.tolist())
+
+
+def write_buckets_npz(bins, output_file, host_names):
+    """Compressed columnar arrays (load with numpy.load)"""
+    np.savez_compressed(output_file,
+                        interval=np.float64(bins['interval']),
+                        bucket_start=bins['bucket_start'],
+                        metrics=np.array(METRICS),
+                        total=bins['total'],
+                        protocols=np.array(PROTOCOLS),
+                        protocol_counts=bins['protocols'],
+                        hosts=np.array(host_names, dtype=str),
+                        host_counts=bins['hosts'])
+
+
+if __name__ == '__main__':
+    print("Time Series Module")
+    print("Import this module into pcap_analyzer_v3.py")